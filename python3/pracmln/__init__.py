@@ -19,14 +19,37 @@
 # CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
-from .mln.base import MLN
-from .mln.database import Database
+#
+# The public names of the package are resolved lazily on first access, such
+# that a plain "import pracmln" does neither pull in the parser and the
+# inference and learning engines nor any of the GUI toolkits.
+import importlib
+
 from .mln.constants import *
-from .mlnlearn import MLNLearn
-from .mlnlearn import MLNLearn as learn
-from .mlnquery import MLNQuery
-from .mlnquery import MLNQuery as query
-from .mlnlearn import QUERY_PREDS
-from .mlnlearn import EVIDENCE_PREDS
-from .utils.project import mlnpath
-from .utils.project import PRACMLNConfig
\ No newline at end of file
+
+
+_LAZY = {
+    'MLN': ('.mln.base', 'MLN'),
+    'Database': ('.mln.database', 'Database'),
+    'MLNLearn': ('.mlnlearn', 'MLNLearn'),
+    'learn': ('.mlnlearn', 'MLNLearn'),
+    'MLNQuery': ('.mlnquery', 'MLNQuery'),
+    'query': ('.mlnquery', 'MLNQuery'),
+    'QUERY_PREDS': ('.mlnlearn', 'QUERY_PREDS'),
+    'EVIDENCE_PREDS': ('.mlnlearn', 'EVIDENCE_PREDS'),
+    'mlnpath': ('.utils.project', 'mlnpath'),
+    'PRACMLNConfig': ('.utils.project', 'PRACMLNConfig'),
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    module, attr = _LAZY[name]
+    value = getattr(importlib.import_module(module, __name__), attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
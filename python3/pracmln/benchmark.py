@@ -0,0 +1,549 @@
+"""
+Created on Oct 16, 2026
+
+Runtime benchmarks for the inference and learning engines
+on the shipped examples.
+"""
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from pracmln import MLN, Database
+from pracmln.mln.base import parse_mln
+from pracmln.mln.database import parse_db
+from pracmln.mln.inference.exact import EnumerationAsk
+from pracmln.mln.inference.gibbs import GibbsSampler
+from pracmln.mln.inference.mcsat import MCSAT, SampleSAT
+from pracmln.mln.inference.wcspinfer import WCSPConverter
+from pracmln.mln.learning.bpll import BPLL, DPLL
+from pracmln.mln.learning.cll import CLL, DCLL
+from pracmln.mln.learning.multidb import MultipleDatabaseLearner, LearnerWorkers
+from pracmln.mln.evidence import ColumnarDatabase, EvidenceStore
+from pracmln.mln.mrfcache import MRFCache
+from pracmln.server import MLNClient
+from pracmln.server.loadtest import spawn, loadtest
+from pracmln.utils import locs
+from pracmln.utils.project import mlnpath
+from pracmln.wcsp import solver
+
+
+def _project(name):
+    return os.path.join(locs.examples, name, '%s.pracmln' % name)
+
+
+def _timeit(f, repeat=1):
+    start = time.time()
+    for _ in range(repeat):
+        result = f()
+    return (time.time() - start) / repeat, result
+
+
+def _report(label, secs):
+    print('%-60s %10.4f ms' % (label, secs * 1000.))
+
+
+def bench_samplesat(repeat=20, maxworlds=2 ** 16):
+    """
+    Compares the time per MC-SAT step of the WalkSAT/SA-based SampleSAT
+    with the sampler enumerating all possible worlds.
+    """
+    print('=== BENCHMARK: SampleSAT ===')
+    for project, mlnfile, dbfile in (('smokers', 'wts.pybpll.smoking-train-smoking.mln', 'smoking-test-smaller.db'),
+                                     ('smokers', 'wts.pybpll.smoking-train-smoking.mln', 'smoking-test.db'),
+                                     ('alarm', 'alarm-kreator.mln', 'query1.db'),
+                                     ('alarm', 'alarm-noisyor.mln', 'query1.db')):
+        p = _project(project)
+        mln = MLN(mlnfile='%s:%s' % (p, mlnfile), grammar='StandardGrammar')
+        db = Database(mln, dbfile='%s:%s' % (p, dbfile))
+        mrf = mln.ground(db)
+        mcsat = MCSAT(mrf)
+        mcsat._initkb()
+        random.seed(0)
+        # the clauses satisfied by a random world are a typical clause set of an MC-SAT step
+        state = mcsat.random_world()
+        M = numpy.nonzero(mcsat.kb.clausetruth(numpy.array(state, dtype=numpy.float64)) == 1)[0]
+        label = '%s/%s (%d clauses)' % (project, dbfile, len(M))
+        secs, _ = _timeit(lambda: SampleSAT(mrf, state, M, [], mcsat, p=.5, maxsteps=mcsat.samplesat_maxsteps).run(), repeat)
+        _report('%s WalkSAT/SA' % label, secs)
+        if mrf.countworlds(withevidence=True) > maxworlds:
+            print('%-60s %13s' % ('%s enumeration' % label, 'skipped'))
+            continue
+        secs, _ = _timeit(lambda: SampleSAT(mrf, state, M, [], mcsat, p=.5).enumerate(), repeat)
+        _report('%s enumeration' % label, secs)
+
+
+def bench_gibbs(sweeps=100):
+    """
+    Measures the time per sweep of the Gibbs sampler.
+    """
+    print('=== BENCHMARK: Gibbs sampling ===')
+    for project, mlnfile, dbfile in (('smokers', 'wts.pybpll.smoking-train-smoking.mln', 'smoking-test.db'),
+                                     ('alarm', 'alarm-noisyor.mln', 'query1.db')):
+        p = _project(project)
+        mln = MLN(mlnfile='%s:%s' % (p, mlnfile), grammar='StandardGrammar')
+        db = Database(mln, dbfile='%s:%s' % (p, dbfile))
+        gibbs = GibbsSampler(mln.ground(db))
+        chain = GibbsSampler.Chain(gibbs, gibbs.queries)
+        secs, _ = _timeit(chain.step, sweeps)
+        _report('%s/%s (%d variables)' % (project, dbfile, len(gibbs.blankets)), secs)
+
+
+def bench_chains(chains=4, maxsteps=500):
+    """
+    Compares running multiple MCMC chains sequentially and in a process pool.
+    """
+    print('=== BENCHMARK: parallel MCMC chains ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:wts.pybpll.smoking-train-smoking.mln' % p, grammar='StandardGrammar')
+    db = Database(mln, dbfile='%s:smoking-test.db' % p)
+    mrf = mln.ground(db)
+    for method in (MCSAT, GibbsSampler):
+        for multicore in (False, True):
+            infer = method(mrf, queries=['Cancer'], chains=chains, maxsteps=maxsteps, multicore=multicore, rndseed=0)
+            secs, _ = _timeit(infer.run)
+            _report('%s, %d chains, multicore=%s (R-hat %.3f)' % (method.__name__, chains, multicore, max(infer.rhat.values())), secs)
+
+
+def bench_mrfcache(repeat=10):
+    """
+    Compares materializing and grounding an MLN with restoring it from an MRFCache.
+    """
+    print('=== BENCHMARK: MRF cache ===')
+    for project, mlnfile, dbfile in (('smokers', 'wts.pybpll.smoking-train-smoking.mln', 'smoking-test.db'),
+                                     ('alarm', 'alarm-kreator.mln', 'query1.db')):
+        p = _project(project)
+        mln = MLN(mlnfile='%s:%s' % (p, mlnfile), grammar='StandardGrammar')
+        db = Database(mln, dbfile='%s:%s' % (p, dbfile))
+        secs, _ = _timeit(lambda: mln.materialize(db).ground(db), repeat)
+        _report('%s/%s materialize + ground' % (project, dbfile), secs)
+        directory = tempfile.mkdtemp()
+        try:
+            cache = MRFCache(directory)
+            cache.ground(mln, db)
+            secs, _ = _timeit(lambda: cache.ground(mln, db), repeat)
+            _report('%s/%s cache hit' % (project, dbfile), secs)
+        finally:
+            shutil.rmtree(directory)
+
+
+def bench_components(maxworlds=2 ** 16):
+    """
+    Compares exact inference and MPE inference over the whole ground network
+    with the decomposition into its connected components.
+    """
+    print('=== BENCHMARK: connected components ===')
+    for project, mlnfile, dbfile, queries in (('alarm', 'alarm-noisyor.mln', 'query1.db', ['alarm', 'burglary']),
+                                              ('alarm', 'alarm-kreator.mln', 'query1.db', ['alarm', 'burglary']),
+                                              ('meals', 'meals_any_for.mln', 'query1.db', ['day', 'timeT'])):
+        p = _project(project)
+        mln = MLN(mlnfile='%s:%s' % (p, mlnfile), grammar='StandardGrammar')
+        db = Database(mln, dbfile='%s:%s' % (p, dbfile))
+        mrf = mln.ground(db)
+        label = '%s/%s' % (project, mlnfile)
+        for decompose in (False, True):
+            infer = EnumerationAsk(mrf, queries=queries, decompose=decompose)
+            if not decompose and mrf.countworlds(withevidence=True) > maxworlds:
+                print('%-60s %13s' % ('%s enumeration, decompose=False' % label, 'skipped'))
+                continue
+            secs, _ = _timeit(infer.run)
+            _report('%s enumeration, decompose=%s' % (label, decompose), secs)
+    for project, mlnfile, dbfile in (('smokers', 'wts.pybpll.smoking-train-smoking.mln', 'smoking-test.db'),
+                                     ('alarm', 'alarm-kreator.mln', 'query1.db')):
+        p = _project(project)
+        mln = MLN(mlnfile='%s:%s' % (p, mlnfile), grammar='StandardGrammar')
+        db = Database(mln, dbfile='%s:%s' % (p, dbfile))
+        wcsp = WCSPConverter(mln.ground(db)).convert()
+        for decompose in (False, True):
+            secs, _ = _timeit(lambda: wcsp.solve(decompose=decompose))
+            _report('%s/%s WCSP, decompose=%s (%d components)' % (project, dbfile, decompose, len(wcsp.components())), secs)
+
+
+def bench_enumeration():
+    """
+    Measures the number of worlds per second scored by EnumerationAsk.
+    """
+    print('=== BENCHMARK: enumeration ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:wts.pybpll.smoking-train-smoking.mln' % p, grammar='StandardGrammar')
+    db = Database(mln)
+    people = ['Ann', 'Bob', 'Cid', 'Dan']
+    for a in people:
+        for b in people:
+            if a != b and (a < b or a == 'Ann'):
+                db << 'Friends(%s,%s)' % (a, b)
+    mrf = mln.ground(db)
+    for multicore in (False, True):
+        infer = EnumerationAsk(mrf, queries=['Cancer', 'Smokes(Ann) ^ Cancer(Bob)'], decompose=False, multicore=multicore)
+        secs, _ = _timeit(infer.run)
+        worlds = sum([c.size for c in infer.components])
+        _report('smokers, %d worlds, multicore=%s (%d worlds/s)' % (worlds, multicore, worlds / secs), secs)
+
+
+def bench_bpll(repeat=100):
+    """
+    Measures the time per evaluation of the (discriminative) pseudo-log-likelihood
+    and its gradient.
+    """
+    print('=== BENCHMARK: BPLL/DPLL ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:smoking.mln' % p, grammar='StandardGrammar')
+    db = Database.load(mln, '%s:smoking-train.db' % p)[0]
+    mrf = mln.materialize(db).ground(db)
+    for method in (BPLL, DPLL):
+        learner = method(mrf, qpreds=['Smokes', 'Cancer'])
+        learner._prepare()
+        w = numpy.random.RandomState(0).randn(len(mrf.formulas))
+        def evaluate():
+            learner._lastw = None
+            learner._f(w)
+            learner._grad(w)
+        secs, _ = _timeit(evaluate, repeat)
+        _report('%s smokers/smoking-train.db f + grad' % method.__name__, secs)
+
+
+def bench_bpll_statistics(repeat=5):
+    """
+    Compares computing the BPLL statistics sequentially and in a process pool.
+    """
+    print('=== BENCHMARK: BPLL statistics ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:smoking.mln' % p, grammar='StandardGrammar')
+    db = Database.load(mln, '%s:smoking-train.db' % p)[0]
+    mrf = mln.materialize(db).ground(db)
+    for multicore in (False, True):
+        learner = BPLL(mrf, multicore=multicore)
+        secs, _ = _timeit(learner._prepare, repeat)
+        _report('smokers/smoking-train.db, multicore=%s' % multicore, secs)
+
+
+def bench_lifted(people=12):
+    """
+    Compares computing the BPLL and CLL statistics with and without lifting 
+    on a smokers database, in which most people have identical evidence.
+    """
+    print('=== BENCHMARK: lifted statistics ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:smoking.mln' % p, grammar='StandardGrammar')
+    db = Database(mln)
+    for i in range(people):
+        db << ('Smokes(P%d)' % i if i < people // 2 else '!Smokes(P%d)' % i)
+        db << ('Cancer(P%d)' % i if i < people // 4 else '!Cancer(P%d)' % i)
+    db << 'Friends(P0,P1)'
+    db << 'Friends(P1,P0)'
+    mrf = mln.materialize(db).ground(db)
+    for method in (BPLL, CLL):
+        for lifted in (False, True):
+            learner = method(mrf, lifted=lifted)
+            secs, _ = _timeit(learner._prepare)
+            _report('%s smokers, %d people, %s' % (method.__name__, people, 'lifted' if lifted else 'ground'), secs)
+
+
+def bench_cll(repeat=100, partsize=2):
+    """
+    Measures the time per optimizer iteration, i.e. one evaluation of the
+    (discriminative) composite-log-likelihood and its gradient.
+    """
+    print('=== BENCHMARK: CLL/DCLL ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:smoking.mln' % p, grammar='StandardGrammar')
+    db = Database.load(mln, '%s:smoking-train.db' % p)[0]
+    mrf = mln.materialize(db).ground(db)
+    for method in (CLL, DCLL):
+        random.seed(0)
+        learner = method(mrf, qpreds=['Smokes', 'Cancer'], partsize=partsize)
+        learner._prepare()
+        w = numpy.random.RandomState(0).randn(len(mrf.formulas))
+        def iteration():
+            w[0] += 1e-3
+            learner._f(w)
+            learner._grad(w)
+        secs, _ = _timeit(iteration, repeat)
+        _report('%s smokers/smoking-train.db f + grad (%d partitions)' % (method.__name__, len(learner.partitions)), secs)
+
+
+def bench_multidb(dbs=8, repeat=20):
+    """
+    Compares evaluating the likelihood and gradient of a MultipleDatabaseLearner
+    sequentially and by persistent worker processes.
+    """
+    print('=== BENCHMARK: multiple database learning ===')
+    p = _project('object-recognition')
+    mln = MLN(mlnfile='%s:object-detection.mln' % p, grammar='PRACGrammar')
+    learner = MultipleDatabaseLearner(mln, Database.load(mln, '%s:scenes-new.db' % p)[:dbs], BPLL)
+    learner._prepare()
+    w = list(numpy.random.RandomState(0).randn(len(learner.mln.formulas)))
+    def iteration():
+        learner._f(w)
+        learner._grad(w)
+    secs, _ = _timeit(iteration, repeat)
+    _report('object-recognition, %d databases, sequential f + grad' % dbs, secs)
+    learner._workers = LearnerWorkers(learner.learners)
+    try:
+        secs, _ = _timeit(iteration, repeat)
+        _report('object-recognition, %d databases, %d workers f + grad' % (dbs, len(learner._workers.workers)), secs)
+    finally:
+        learner._workers.close()
+        learner._workers = None
+
+
+def bench_minibatch(dbs=8, batchsize=2, repeat=20):
+    """
+    Compares the time of a full-batch evaluation of the gradient of a 
+    MultipleDatabaseLearner to the time of a minibatch step of the stochastic
+    optimizers.
+    """
+    print('=== BENCHMARK: minibatch learning ===')
+    p = _project('object-recognition')
+    mln = MLN(mlnfile='%s:object-detection.mln' % p, grammar='PRACGrammar')
+    learner = MultipleDatabaseLearner(mln, Database.load(mln, '%s:scenes-new.db' % p)[:dbs], BPLL)
+    learner._prepare()
+    learner._w = [0] * len(learner.mln.formulas)
+    w = list(numpy.random.RandomState(0).randn(len(learner._varweights())))
+    secs, _ = _timeit(lambda: learner.grad(w), repeat)
+    _report('object-recognition, %d databases, full-batch gradient' % dbs, secs)
+    batches = [list(range(i, i + batchsize)) for i in range(0, dbs, batchsize)]
+    secs, _ = _timeit(lambda: [learner.grad_batch(w, b, dbs) for b in batches], repeat)
+    _report('object-recognition, %d databases, epoch of minibatch gradients (batch size %d)' % (dbs, batchsize), secs)
+    secs, _ = _timeit(lambda: learner.grad_batch(w, batches[0], dbs), repeat)
+    _report('object-recognition, %d databases, minibatch gradient (batch size %d)' % (dbs, batchsize), secs)
+
+
+def bench_columnar(people=150, repeat=1):
+    """
+    Compares grounding an MLN with a dict-based Database and a ColumnarDatabase,
+    and parsing a database with loading its memory-mapped evidence store.
+    """
+    print('=== BENCHMARK: columnar evidence ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:smoking.mln' % p, grammar='StandardGrammar')
+    rnd = random.Random(0)
+    db = Database(mln)
+    for i in range(people):
+        db << ('Smokes(P%d)' % i, rnd.random() < .3)
+        db << ('Cancer(P%d)' % i, rnd.random() < .1)
+        for j in range(people):
+            db << ('Friends(P%d,P%d)' % (i, j), rnd.random() < .05)
+    cdb = ColumnarDatabase.fromdb(db)
+    mln_ = mln.materialize(db)
+    for label, db_ in (('Database', db), ('ColumnarDatabase', cdb)):
+        secs, _ = _timeit(lambda: mln_.ground(db_), repeat)
+        _report('smokers, %d people, %d atoms, ground with %s' % (people, len(db), label), secs)
+    directory = tempfile.mkdtemp()
+    try:
+        dbfile = os.path.join(directory, 'smokers.db')
+        with open(dbfile, 'w') as f:
+            db.write(f, color=False, bars=False)
+        secs, _ = _timeit(lambda: Database(mln, dbfile=dbfile), repeat)
+        _report('smokers, %d people, parse database file' % people, secs)
+        cdb.store.save(os.path.join(directory, 'store'))
+        secs, _ = _timeit(lambda: ColumnarDatabase(mln, EvidenceStore.load(os.path.join(directory, 'store'))), repeat)
+        _report('smokers, %d people, load memory-mapped evidence store' % people, secs)
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_dbload(dbs=8, people=40):
+    """
+    Compares asserting the atoms of '---'-separated smokers databases one by one
+    with parsing them in bulk by parse_db, on one and on all cores.
+    """
+    print('=== BENCHMARK: database loading ===')
+    p = _project('smokers')
+    mln = MLN(mlnfile='%s:smoking.mln' % p, grammar='StandardGrammar')
+    rnd = random.Random(0)
+    lines = []
+    for _ in range(dbs):
+        lines.append('person = {%s}' % ','.join(['P%d' % i for i in range(people)]))
+        for i in range(people):
+            lines.append('%sSmokes(P%d)' % ('' if rnd.random() < .3 else '!', i))
+            lines.append('%.2f Cancer(P%d)' % (rnd.random(), i))
+            for j in range(people):
+                lines.append('%sFriends(P%d,P%d)' % ('' if rnd.random() < .05 else '!', i, j))
+        lines.append('---')
+    content = '\n'.join(lines)
+    def assert_atoms():
+        db = Database(mln)
+        for l in lines:
+            if l == '---':
+                db = Database(mln)
+            elif '{' not in l:
+                value, atom = l.split(' ') if ' ' in l else (1, l)
+                db << (atom, float(value))
+    secs, _ = _timeit(assert_atoms)
+    _report('%d databases, %d lines, Database.add per atom' % (dbs, len(lines)), secs)
+    for multicore in (False, True):
+        secs, _ = _timeit(lambda: parse_db(mln, content, multicore=multicore))
+        _report('%d databases, %d lines, parse_db, multicore=%s' % (dbs, len(lines), multicore), secs)
+
+
+def bench_serialization(repeat=3):
+    """
+    Compares loading a learned MLN and its databases from the text files with
+    loading them from the binary format.
+    """
+    print('=== BENCHMARK: binary serialization ===')
+    p = _project('object-recognition')
+    mlnfile, dbfile = '%s:learnt.cll.scenes-new-object-detection.mln' % p, '%s:scenes-new.db' % p
+    def load_text():
+        mln = MLN(mlnfile=mlnfile, grammar='PRACGrammar')
+        return mln, Database.load(mln, dbfile, ignore_unknown_preds=True)
+    secs, (mln, dbs) = _timeit(load_text, repeat)
+    _report('object-recognition, MLN + %d databases from text' % len(dbs), secs)
+    directory = tempfile.mkdtemp()
+    try:
+        mlnfile, dbfile = os.path.join(directory, 'model.mln'), os.path.join(directory, 'scenes.db')
+        mln.save(mlnfile)
+        Database.save_dbs(dbs, dbfile)
+        def load_binary():
+            mln = MLN.load_binary(mlnfile)
+            return mln, Database.load_binary(mln, dbfile)
+        secs, _ = _timeit(load_binary, repeat)
+        _report('object-recognition, MLN + %d databases from binary' % len(dbs), secs)
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_wcspconvert(people=(20, 40)):
+    """
+    Compares the time for converting a ground MLN into a WCSP with the time
+    for solving it, for a model whose formulas are neither conjunctions nor
+    disjunctions, so their constraints are evaluated in all combinations of values.
+    """
+    print('=== BENCHMARK: WCSP conversion ===')
+    mln = MLN(grammar='StandardGrammar', logic='FirstOrderLogic')
+    mln << 'Smokes(person)'
+    mln << 'Cancer(person)'
+    mln << 'Friends(person,person)'
+    mln << '1.5 Smokes(x) <=> Cancer(x)'
+    mln << '0.8 Friends(x,y) => (Smokes(x) <=> Smokes(y))'
+    mln << '0.3 (Smokes(x) <=> Smokes(y)) <=> (Cancer(x) <=> Cancer(y))'
+    for n in people:
+        rnd = random.Random(0)
+        db = Database(mln)
+        for i in range(n):
+            for j in range(n):
+                db << ('Friends(P%d,P%d)' % (i, j), rnd.random() < .1)
+        mrf = mln.ground(db)
+        secs, wcsp = _timeit(lambda: WCSPConverter(mrf).convert())
+        _report('smokers, %d people, convert (%d constraints)' % (n, len(wcsp.constraints)), secs)
+        secs, _ = _timeit(lambda: wcsp.solve())
+        _report('smokers, %d people, solve' % n, secs)
+
+
+def bench_wcspengines(repeat=3):
+    """
+    Compares the MPE solvers for the WCSPs of the shipped examples.
+    """
+    print('=== BENCHMARK: WCSP engines ===')
+    for project, mlnfile, dbfile, grammar in (('smokers', 'wts.pybpll.smoking-train-smoking.mln', 'smoking-test.db', 'StandardGrammar'),
+                                              ('alarm', 'alarm-kreator.mln', 'query1.db', 'StandardGrammar'),
+                                              ('tweety', 'tweety-kreator.mln', 'query1.db', 'StandardGrammar'),
+                                              ('vegetarians', 'vegetarian-motivation.mln', 'vegetarian-3-2-orders-vegdish.db', 'StandardGrammar'),
+                                              ('object-recognition', 'learnt.cll.scenes-new-object-detection.mln', 'test.db', 'PRACGrammar')):
+        p = _project(project)
+        mln = MLN(mlnfile='%s:%s' % (p, mlnfile), grammar=grammar)
+        db = Database(mln, dbfile='%s:%s' % (p, dbfile), ignore_unknown_preds=True)
+        wcsp = WCSPConverter(mln.ground(db)).convert()
+        label = '%s/%s (%d variables)' % (project, dbfile, len(wcsp.domsizes))
+        for engine in ('toulbar2', 'native'):
+            backend = solver(engine)
+            if not backend.available():
+                print('%-60s %13s' % ('%s %s' % (label, engine), 'skipped'))
+                continue
+            secs, (_, cost) = _timeit(lambda: wcsp.solve(decompose=False, backend=backend), repeat)
+            _report('%s %s, cost %d' % (label, engine, cost), secs)
+
+
+def bench_importtime(repeat=5):
+    """
+    Measures the time for importing the package and its main entry points
+    in a fresh interpreter, and whether they load the GUI toolkit or scipy.
+    """
+    print('=== BENCHMARK: import time ===')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+    script = ('import sys, time; t = time.perf_counter(); %s; '
+              'print(time.perf_counter() - t, "tkinter" in sys.modules, "scipy" in sys.modules)')
+    for stmt in ('import pracmln',
+                 'from pracmln import MLN, Database',
+                 'from pracmln import MLNQuery',
+                 'from pracmln import MLNLearn'):
+        times = []
+        for _ in range(repeat):
+            out = subprocess.check_output([sys.executable, '-c', script % stmt], env=env).decode().split()
+            times.append(float(out[0]))
+        loaded = [m for m, flag in zip(('tkinter', 'scipy'), out[1:]) if flag == 'True']
+        _report('%s%s' % (stmt, ' (loads %s)' % ', '.join(loaded) if loaded else ''), min(times))
+
+
+def bench_server(requests=100, concurrency=8):
+    """
+    Compares answering queries with varying evidence by parsing, materializing
+    and grounding the model for every request, as the ROS service does, with
+    the inference server keeping the model resident, without and with batching.
+    """
+    print('=== BENCHMARK: inference server ===')
+    p = _project('smokers')
+    mlntext = mlnpath('%s:wts.pybpll.smoking-train-smoking.mln' % p).content
+    dbtext = mlnpath('%s:smoking-test-smaller.db' % p).content
+    vary = ['Friends(Ann,Bob)', 'Smokes(Bob)']
+    params = {'maxsteps': 300}
+    rnd = random.Random(0)
+    evidence = [[('' if rnd.random() < .5 else '!') + atom for atom in vary] for _ in range(requests)]
+    def reparse():
+        for lits in evidence:
+            mln = parse_mln(mlntext, grammar='StandardGrammar')
+            db = parse_db(mln, dbtext)[0]
+            for lit in lits:
+                db << lit
+            MCSAT(mln.materialize(db).ground(db), ['Cancer', 'Smokes'], **params).run()
+    secs, _ = _timeit(reparse)
+    _report('smokers, parse per request (time per request)', secs / requests)
+    for batchsize in (1, 32):
+        with spawn(batchsize=batchsize) as path:
+            with MLNClient(path) as client:
+                client.load('smokers', mln=mlntext, db=dbtext, grammar='StandardGrammar')
+            stats = loadtest(path, 'smokers', requests=requests, concurrency=concurrency, queries='Cancer,Smokes',
+                             vary=vary, method='MC-SAT', params=params)
+        _report('smokers, server, batch size %d (time per request)' % batchsize, 1. / stats['throughput'])
+        _report('smokers, server, batch size %d (median latency, %d clients)' % (batchsize, concurrency), stats['latency']['p50'])
+
+
+def runall():
+    start = time.time()
+    bench_importtime()
+    bench_samplesat()
+    bench_gibbs()
+    bench_chains()
+    bench_mrfcache()
+    bench_columnar()
+    bench_dbload()
+    bench_serialization()
+    bench_components()
+    bench_wcspconvert()
+    bench_wcspengines()
+    bench_server()
+    bench_enumeration()
+    bench_bpll()
+    bench_bpll_statistics()
+    bench_lifted()
+    bench_cll()
+    bench_multidb()
+    bench_minibatch()
+    print()
+    print('all benchmarks finished after', time.time() - start, 'secs')
+
+
+def main():
+    runall()
+
+
+if __name__ == '__main__':
+    main()
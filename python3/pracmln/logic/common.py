@@ -67,14 +67,30 @@ class Logic(object):
         self.mln = mln
     
     
+    @property
+    def grammar(self):
+        # unpickled logics only know the name of their grammar, which is
+        # instantiated on first use since building the parsers is expensive
+        if isinstance(self._grammar, str):
+            self._grammar = eval(self._grammar)(self)
+        return self._grammar
+    
+    
+    @grammar.setter
+    def grammar(self, grammar):
+        self._grammar = grammar
+    
+    
     def __getstate__(self):
         d = self.__dict__.copy()
-        d['grammar'] = type(self.grammar).__name__
+        if not isinstance(d['_grammar'], str):
+            d['_grammar'] = type(d['_grammar']).__name__
         return d
         
     def __setstate__(self, d):
+        if 'grammar' in d:
+            d['_grammar'] = d.pop('grammar')
         self.__dict__ = d
-        self.grammar = eval(d['grammar'])(self)
         
     
 #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #  #   
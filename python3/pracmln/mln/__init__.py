@@ -24,10 +24,29 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from .base import MLN
-from .base import HARD
-from .base import Predicate
-from .base import FunctionalPredicate
-from .base import SoftFunctionalPredicate
-from .database import Database
+import importlib
+
 from .errors import *
+
+
+_LAZY = {
+    'MLN': '.base',
+    'HARD': '.base',
+    'Predicate': '.base',
+    'FunctionalPredicate': '.base',
+    'SoftFunctionalPredicate': '.base',
+    'Database': '.database',
+}
+
+
+def __getattr__(name):
+    # the model classes are imported on first access only (see pracmln/__init__.py)
+    if name not in _LAZY:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
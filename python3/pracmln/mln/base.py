@@ -39,11 +39,12 @@ from .util import StopWatch, mergedom, fstr, colorize, stripComments
 from .mlnpreds import (Predicate, FuzzyPredicate, SoftFunctionalPredicate,
     FunctionalPredicate)
 from .database import Database
-from .learning.multidb import MultipleDatabaseLearner
+from .evidence import AtomIndex, ColumnarDatabase
+from .mrfcache import MRFCache
+from . import serialization
 import sys
 import re
 import traceback
-from .learning.bpll import BPLL
 from ..utils.project import mlnpath
 from importlib import util as imputil
 
@@ -369,7 +370,12 @@ class MLN(object):
         for pred in self.predicates:
             for gndatom in pred.groundatoms(self, mrf.domains):
                 mrf.gndatom(gndatom.predname, *gndatom.args)
-        evidence = dict([(atom, value) for atom, value in db.evidence.items() if mrf.gndatom(atom) is not None])
+        # the ground atoms have been created in the order of their offsets
+        mrf._atomindex = AtomIndex.frommln(self, mrf.domains)
+        if isinstance(db, ColumnarDatabase):
+            evidence = db.store.assignments(mrf.atomindex)
+        else:
+            evidence = dict([(atom, value) for atom, value in db.evidence.items() if mrf.gndatom(atom) is not None])
         mrf.set_evidence(evidence, erase=False)
         return mrf
 
@@ -383,13 +389,20 @@ class MLN(object):
         for value in domain[domname]:
             self.constant(domname, value)
 
-    def learn(self, databases, method=BPLL, **params):
+    def learn(self, databases, method='BPLL', **params):
         '''
         Triggers the learning parameter learning process for a given set of databases.
         Returns a new MLN object with the learned parameters.
         
         :param databases:     list of :class:`mln.database.Database` objects or filenames
-        '''
+        :param method:        the learning method, i.e. a learner class or its id or name in
+                              :attr:`mln.methods.LearningMethods`
+        '''
+        # the learners depend on scipy, which is only loaded once learning is requested
+        from .methods import LearningMethods
+        from .learning.multidb import MultipleDatabaseLearner
+        from .learning.incremental import IncrementalLearner
+        method = LearningMethods.clazz(method)
         verbose = params.get('verbose', False)
         
         # get a list of database objects
@@ -404,7 +417,12 @@ class MLN(object):
             elif type(db) is list: dbs.extend(db)
             else: dbs.append(db)
         logger.debug('loaded %s evidence databases for learning' % len(dbs))
-        newmln = self.materialize(*dbs)
+        cache = None
+        if params.get('mrfcache', False) and len(dbs) == 1:
+            cache = MRFCache()
+            newmln, mrf = cache.ground(self, dbs[0])
+        else:
+            newmln = self.materialize(*dbs)
 
         logger.debug('MLN predicates:')
         for p in newmln.predicates: logger.debug(p)
@@ -415,10 +433,14 @@ class MLN(object):
         logger.debug('MLN formulas:')
         for f in newmln.formulas: logger.debug('%s %s' % (str(f.weight).ljust(10, ' '), f))
         # run learner
-        if len(dbs) == 1:
-            mrf = newmln.ground(dbs[0])
+        if params.get('incremental'):
+            learner = IncrementalLearner(newmln, dbs, method, **params)
+        elif len(dbs) == 1:
             logger.debug('Loading %s-Learner' % method.__name__)
-            learner = method(mrf, **params)
+            if cache is None:
+                learner = method(newmln.ground(dbs[0]), **params)
+            else:
+                learner = cache.learner(mrf, method, **params)
         else:
             learner = MultipleDatabaseLearner(newmln, dbs, method, **params)
         if verbose:
@@ -453,6 +475,24 @@ class MLN(object):
         self.write(f, color=False)   
         f.close()
 
+    def save(self, filename):
+        '''
+        Writes this MLN into the file with the given filename in the binary
+        format (see :mod:`mln.serialization`), which can be loaded again
+        by :meth:`load_binary` without parsing.
+        '''
+        with open(filename, 'wb') as f:
+            serialization.dump_mln(self, f)
+
+    @staticmethod
+    def load_binary(filename):
+        '''
+        Reads an MLN from a file in the binary format (see :meth:`save`). The MLN
+        is created with the logic and grammar it has been saved with.
+        '''
+        with open(filename, 'rb') as f:
+            return serialization.load_mln(f)
+
     def write(self, stream=sys.stdout, color=None):
         '''
         Writes the MLN to the given stream.
@@ -527,6 +567,8 @@ class MLN(object):
                           the contents of all files will be concatenated.
         :param logic:     (string) the type of logic to be used. Either `FirstOrderLogic` or `FuzzyLogic`.
         :param grammar:   (string) the syntax to be used for parsing the MLN file. Either `PRACGrammar` or `StandardGrammar`.
+        
+        Files in the binary format must be loaded by :meth:`load_binary`.
         '''
         # read MLN file
         text = ''
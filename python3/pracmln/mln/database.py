@@ -34,10 +34,12 @@ from io import StringIO
 import sys
 from .util import colorize
 from .errors import MLNParsingError
-import traceback
 from collections import defaultdict
+from multiprocessing import Pool
 import re
 from ..utils.project import mlnpath
+from ..utils.multicore import with_tracing
+from . import serialization
 
 
 logger = logs.getlogger(__name__)
@@ -195,6 +197,43 @@ class Database(object):
         :param truth:      the truth value of this ground literal. 0 stands for false, 1 for true.
                            In case of soft or fuzzy evidence, any truth value in [0,1] is allowed.
         """
+        pred, args, atom_str, truth = self._parselit(gndlit, truth)
+        # update the domains
+        for domname, arg in zip(pred.argdoms, args):
+            self.domain({domname: arg})
+
+        self._evidence[atom_str] = truth
+        return self
+
+
+    def _extend(self, domains, evidence):
+        """
+        Adds the values of the given domains and the given evidence, which
+        have already been validated by :func:`parse_db`.
+
+        :param domains:    dict mapping domain names to lists of values.
+        :param evidence:   dict mapping ground atom strings to truth values.
+        """
+        for domname, values in domains.items():
+            dom = self._domains.get(domname)
+            if dom is None:
+                self._domains[domname] = list(values)
+                continue
+            members = set(dom)
+            for value in values:
+                if value not in members:
+                    dom.append(value)
+                    members.add(value)
+        self._evidence.update(evidence)
+        return self
+
+
+    def _parselit(self, gndlit, truth):
+        """
+        Validates the ground literal `gndlit` and returns the predicate, the arguments
+        and the string representation of its ground atom together with the truth value
+        of the ground atom.
+        """
         if isinstance(gndlit, str):
             true, predname, args = self.mln.logic.parse_literal(str(gndlit))
             atom_str = str(self.mln.logic.gnd_atom(predname, args, self.mln))
@@ -219,13 +258,7 @@ class Database(object):
         
         if not all([not self.mln.logic.isvar(a) for a in args]):
             raise Exception('No variables are allowed in databases. Only ground atoms: %s' % atom_str)
-        
-        # update the domains
-        for domname, arg in zip(pred.argdoms, args):
-            self.domain({domname: arg})
-
-        self._evidence[atom_str] = truth
-        return self
+        return pred, args, atom_str, truth
               
                 
     def ishard(self):
@@ -431,16 +464,68 @@ class Database(object):
         stream.write('---\n'.join(strdbs))
                         
                         
+    def save(self, filename):
+        """
+        Writes this database into the file with the given filename in the
+        binary format (see :mod:`mln.serialization`).
+        """
+        Database.save_dbs([self], filename)
+
+
     @staticmethod
-    def load(mln, dbfiles, ignore_unknown_preds=False, db=None):
+    def save_dbs(dbs, filename):
+        """
+        Writes the given databases into the file with the given filename in the
+        binary format (see :mod:`mln.serialization`). The databases may be
+        given by a generator, in which case they are written one by one.
+        """
+        with open(filename, 'wb') as f:
+            serialization.write_header(f, 'db')
+            writer = serialization.DatabaseWriter(f)
+            for db in dbs:
+                atoms = []
+                for atom, truth in db:
+                    _, predname, args = _parse_literal(db.mln.logic, atom)
+                    atoms.append((predname, args, truth))
+                writer.write(db.domains, atoms)
+
+
+    @staticmethod
+    def iterload(mln, filename, ignore_unknown_preds=False):
+        """
+        Reads the databases from a file in the binary format one by one, without
+        loading the whole file into memory.
+
+        :returns:    a generator of database objects.
+        """
+        with open(filename, 'rb') as f:
+            serialization.read_header(f, 'db')
+            for domains, evidence in serialization.iterdbrecords(f, mln, ignore_unknown_preds):
+                yield Database(mln)._extend(domains, evidence)
+
+
+    @staticmethod
+    def load_binary(mln, filename, ignore_unknown_preds=False):
+        """
+        Reads all databases from a file in the binary format (see :meth:`save_dbs`).
+
+        :returns:    a list of database objects.
+        """
+        return list(Database.iterload(mln, filename, ignore_unknown_preds=ignore_unknown_preds))
+
+
+    @staticmethod
+    def load(mln, dbfiles, ignore_unknown_preds=False, db=None, multicore=False):
         """
         Reads one or multiple database files containing literals and/or domains.
         Returns one or multiple databases where domains is dictionary mapping 
         domain names to lists of constants defined in the database
-        and evidence is a dictionary mapping ground atom strings to truth values
+        and evidence is a dictionary mapping ground atom strings to truth values.
+        Files in the binary format must be loaded by :meth:`load_binary`.
         
         :param dbfile:  a single one or a list of paths to database file.
         :param mln:     the MLN object which should be used to load the database.
+        :param multicore: parse multiple ('---'-separated) databases in a file in parallel.
         :returns:       either one single or a list of database objects.
           
         :Example:
@@ -458,7 +543,7 @@ class Database(object):
                 if dbpath.project is not None:
                     projectpath = dbpath.projectloc
                 dirs = [os.path.dirname(fp) for fp in dbfiles]
-                dbs_ = parse_db(mln, content=dbpath.content, ignore_unknown_preds=ignore_unknown_preds, db=db, dirs=dirs, projectpath=projectpath)
+                dbs_ = parse_db(mln, content=dbpath.content, ignore_unknown_preds=ignore_unknown_preds, db=db, dirs=dirs, projectpath=projectpath, multicore=multicore)
                 dbs.extend(dbs_)
             else:
                 raise Exception('Illegal db file specifier: %s' % dbpath)
@@ -536,46 +621,47 @@ class Database(object):
                 yield assignment
                 
 
-def parse_db(mln, content, ignore_unknown_preds=False, db=None, dirs=['.'], projectpath=None):
+# matches well-formed ground literals, everything else is left to the grammar of the logic
+_GNDLIT = re.compile(r"(!?)([A-Za-z0-9_'\-]+)\(([A-Za-z0-9_'\-]+(?:,[A-Za-z0-9_'\-]+)*)\)$")
+
+# this readonly global is for multiprocessing to exploit copy-on-write
+# on linux systems
+global_mln = None
+
+
+def _parse_literal(logic, s):
     """
-    Reads one or more databases in a string representation and returns
-    the respective Database objects.
-    
-    :param mln:                     the MLN object which should be used to load
-                                    the database.
-    :param content:                 the string representation of one or
-                                    multiple ('---'-separated) databases
-    :param ignore_unknown_preds:    by default this function raises an
-                                    Exception when it encounters a predicate
-                                    in the DB that has not been declared in
-                                    the associated MLN.
-                                    ignore_unknown_preds=True simply ignores
-                                    such predicates.
-    :param db:                      The Database object that shall receive
-                                    the facts stored in the new DB. If None,
-                                    a new `Database` object will be created.
-    :return:                        a list of databases
+    Parses a ground literal like :meth:`logic.grammar.Grammar.parse_literal`, but
+    without invoking the grammar for plain literals like ``!p(A,B)``.
+    """
+    m = _GNDLIT.match(s)
+    if m is None:
+        return logic.parse_literal(s)
+    return m.group(1) != '!', m.group(2), m.group(3).split(',')
+
+
+def _parse_dbchunk(args):
+    """
+    Parses the lines of a single database (i.e. without '---' separators).
+
+    :returns:    the list of the (domains, evidence) pairs of the databases included
+                 by the lines, followed by the one of the database itself.
     """
+    lines, start, ignore_unknown_preds, dirs, projectpath, existing = args
+    mln = global_mln
+    logic = mln.logic
     log = logs.getlogger('db')
-    content = stripComments(content)
-    allow_multiple = True
-    if db is None:
-        allow_multiple = True
-        db = Database(mln, ignore_unknown_preds=ignore_unknown_preds)
+    domains = {}
+    members = {}
+    evidence = {}
     dbs = []
-    # expand domains with dbtext constants and save evidence
-    for line, l in enumerate(content.split("\n")):
+    for line, l in enumerate(lines, start):
         l = l.strip()
         if l == '':
             continue
-        # separator between independent databases
-        elif l == '---' and not db.isempty():
-            dbs.append(db)
-            db = Database(mln)
-            continue
         # domain declaration
         elif "{" in l:
-            domname, constants = db.mln.logic.parse_domain(l)
+            domname, constants = logic.parse_domain(l)
             domnames = [domname for _ in constants]
         # include
         elif l.startswith('#include'):
@@ -601,14 +687,15 @@ def parse_db(mln, content, ignore_unknown_preds=False, db=None, dirs=['.'], proj
                 if m is not None:
                     filename = m.group('filename')
                 else:
-                    raise MLNParsingError('Malformed #include statement: %s' % line)
+                    raise MLNParsingError('Malformed #include statement: %s' % l)
                 if projectpath is None:
                     raise MLNParsingError('No project specified: Cannot locate import from project: %s' % filename)
                 includefilename = ':'.join([projectpath, filename])
             logger.debug('Including file: "%s"' % includefilename)
             p = mlnpath(includefilename)
-            dbs.extend(parse_db(content=mlnpath(includefilename).content, ignore_unknown_preds=ignore_unknown_preds, dirs=[p.resolve_path()]+dirs, 
-                      projectpath=ifnone(p.project, projectpath, lambda x: '/'.join(p.path+[x])), mln=mln)) 
+            dbs.extend([(db.domains, db._evidence) for db in parse_db(content=p.content, ignore_unknown_preds=ignore_unknown_preds, 
+                                                                         dirs=[p.resolve_path()]+dirs, mln=mln,
+                                                                         projectpath=ifnone(p.project, projectpath, lambda x: '/'.join(p.path+[x])))])
             continue
         # valued evidence
         elif l[0] in "0123456789":
@@ -617,47 +704,122 @@ def parse_db(mln, content, ignore_unknown_preds=False, db=None, dirs=['.'], proj
             value = float(l[:s])
             if value < 0 or value > 1:
                 raise Exception('Valued evidence must be in [0,1]') 
-            if gndatom  in db.evidence:
+            if gndatom in evidence or gndatom in existing:
                 raise Exception("Duplicate soft evidence for '%s'" % gndatom)
             try:
-                _, predname, constants =   mln.logic.parse_literal(gndatom) # TODO Should we allow soft evidence on non-atoms here? (This assumes atoms)
+                true, predname, constants = _parse_literal(logic, gndatom) # TODO Should we allow soft evidence on non-atoms here? (This assumes atoms)
+                pred = mln.predicate(predname)
+                if pred is None:
+                    raise NoSuchPredicateError('Predicate %s is undefined.' % predname)
             except NoSuchPredicateError as e:
                 if ignore_unknown_preds: continue
                 else: raise e
-            domnames = mln.predicate(predname).argdoms
-            db << (gndatom, value)
+            truth = value if true else 1 - value
         # literal
         else:
             if l[0] == "?":
                 raise Exception("Unknown literals not supported (%s)" % l) # this is an Alchemy feature
             try:
-                true, predname, constants = mln.logic.parse_literal(l)
+                true, predname, constants = _parse_literal(logic, l)
             except NoSuchPredicateError as e:
                 if ignore_unknown_preds: continue
                 else: raise e
             except Exception as e:
-                traceback.print_exc()
-                raise MLNParsingError('Error parsing line %d: %s (%s)' % (line+1, l, e.message))
-            if mln.predicate(predname) is None and ignore_unknown_preds:
+                raise MLNParsingError('Error parsing line %d: %s (%s)' % (line+1, l, e))
+            pred = mln.predicate(predname)
+            if pred is None and ignore_unknown_preds:
                 log.debug('Predicate "%s" is undefined.' % predname)
                 continue
-            elif mln.predicate(predname) is None:
+            elif pred is None:
                 raise NoSuchPredicateError(predname)
-            domnames = mln.predicate(predname).argdoms
-            # save evidence
-            true = 1 if true else 0
-            db << ("%s(%s)" % (predname, ",".join(constants)), true)
-
+            truth = 1 if true else 0
+        if "{" not in l:
+            # save evidence, with the checks of Database.add()
+            atomstr = '%s(%s)' % (predname, ','.join(constants))
+            domnames = pred.argdoms
+            if len(domnames) != len(constants):
+                raise Exception('Invalid number of arguments: %s' % l)
+            if any([logic.isvar(c) for c in constants]):
+                raise Exception('No variables are allowed in databases. Only ground atoms: %s' % atomstr)
+            evidence[atomstr] = float('%.6f' % truth)
         # expand domains
-        if len(domnames) != len(constants):
-            raise Exception("Ground atom %s in database %d has wrong number of parameters" % (l, len(dbs)))
+        for domname, c in zip(domnames, constants):
+            dom = domains.get(domname)
+            if dom is None:
+                dom = domains[domname] = []
+                members[domname] = set()
+            if c not in members[domname]:
+                dom.append(c)
+                members[domname].add(c)
+    dbs.append((domains, evidence))
+    return dbs
 
-        for i, c in enumerate(constants):
-            db.domain({domnames[i]: c})
-            
-    if not db.isempty(): dbs.append(db)
-    if len(dbs) > 1 and not allow_multiple:
-        raise Exception('Only one single database is permitted when loading via the constructor. Use Database.load() for loading multiple DBs,')
+
+def parse_db(mln, content, ignore_unknown_preds=False, db=None, dirs=['.'], projectpath=None, multicore=False):
+    """
+    Reads one or more databases in a string representation and returns
+    the respective Database objects.
+    
+    Plain ground literals are tokenized by a regular expression and the domains
+    are extended in bulk, only the remaining literals are parsed by the grammar
+    of the MLN's logic.
+    
+    :param mln:                     the MLN object which should be used to load
+                                    the database.
+    :param content:                 the string representation of one or
+                                    multiple ('---'-separated) databases
+    :param ignore_unknown_preds:    by default this function raises an
+                                    Exception when it encounters a predicate
+                                    in the DB that has not been declared in
+                                    the associated MLN.
+                                    ignore_unknown_preds=True simply ignores
+                                    such predicates.
+    :param db:                      The Database object that shall receive
+                                    the facts stored in the new DB. If None,
+                                    a new `Database` object will be created.
+    :param multicore:               if `True`, multiple ('---'-separated) databases
+                                    are parsed in parallel.
+    :return:                        a list of databases
+    """
+    lines = stripComments(content).split("\n")
+    # separators between independent databases
+    chunks = []
+    start = 0
+    for i, l in enumerate(lines):
+        if l.strip() == '---':
+            chunks.append((start, i))
+            start = i + 1
+    chunks.append((start, len(lines)))
+    existing = set(db._evidence) if db is not None else set()
+    args = [(lines[s:e], s, ignore_unknown_preds, dirs, projectpath, existing if i == 0 else ()) for i, (s, e) in enumerate(chunks)]
+    global global_mln
+    global_mln = mln
+    if multicore and len(chunks) > 1:
+        pool = Pool()
+        try:
+            results = pool.map(with_tracing(_parse_dbchunk), args)
+        except Exception as e:
+            logger.error('Error in child process. Terminating pool...')
+            pool.close()
+            raise e
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = list(map(_parse_dbchunk, args))
+    if db is None:
+        db = Database(mln, ignore_unknown_preds=ignore_unknown_preds)
+    dbs = []
+    for i, parsed in enumerate(results):
+        for domains, evidence in parsed[:-1]:
+            dbs.append(Database(mln)._extend(domains, evidence))
+        if i > 0:
+            db = Database(mln)
+        db._extend(*parsed[-1])
+        if not db.isempty():
+            dbs.append(db)
+        elif i < len(results) - 1:
+            raise MLNParsingError('Error parsing line %d: --- (empty database)' % (chunks[i][1] + 1))
     return dbs
 
 
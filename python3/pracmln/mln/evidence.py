@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+#
+# Markov Logic Networks -- Columnar Evidence Store
+#
+# (C) 2012-2015 by Daniel Nyga
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import json
+import os
+from bisect import bisect_right
+from collections import defaultdict
+
+import numpy
+from dnutils import logs
+
+from .database import Database, _parse_literal
+from .errors import NoSuchPredicateError
+from ..logic.common import Logic
+
+
+logger = logs.getlogger(__name__)
+
+# bump this whenever the layout of the stored evidence changes
+STORE_FORMAT = 1
+
+
+class AtomIndex(object):
+    """
+    Maps the ground atoms of a set of predicates to consecutive integer offsets.
+
+    Predicates and constants are interned to integer ids. The ground atoms of
+    every predicate occupy a contiguous block, and the offset of a ground atom
+    is the base of the block of its predicate plus the mixed-radix number of
+    its arguments, whose digits are the ids of the arguments in their domains
+    (the first argument being the most significant one). This is the order in
+    which :meth:`mln.base.MLN.ground` creates the ground atoms of an MRF, so
+    the offset of a ground atom of such an MRF is its index.
+
+    :param predicates:    list of pairs of predicate names and their argument domain names.
+    :param domains:       dict mapping domain names to the lists of their values.
+    """
+
+    def __init__(self, predicates, domains):
+        self.predicates = [(name, tuple(argdoms)) for name, argdoms in predicates]
+        self._preds = dict([(name, i) for i, (name, _) in enumerate(self.predicates)])
+        self.domains = dict([(d, list(values)) for d, values in domains.items()])
+        for _, argdoms in self.predicates:
+            for d in argdoms: self.domains.setdefault(d, [])
+        self._consts = dict([(d, dict([(c, i) for i, c in enumerate(values)])) for d, values in self.domains.items()])
+        self.bases = []
+        self.shapes = []
+        self.strides = []
+        size = 0
+        for _, argdoms in self.predicates:
+            shape = tuple([len(self.domains[d]) for d in argdoms])
+            strides = [1] * len(shape)
+            for i in reversed(range(len(shape) - 1)):
+                strides[i] = strides[i + 1] * shape[i + 1]
+            self.bases.append(size)
+            self.shapes.append(shape)
+            self.strides.append(tuple(strides))
+            size += int(numpy.prod(shape, dtype=numpy.int64))
+        self.size = size
+
+
+    @staticmethod
+    def frommln(mln, domains):
+        """
+        Creates the index of the ground atoms of all predicates of the given MLN.
+        """
+        return AtomIndex([(p.name, p.argdoms) for p in mln.predicates], domains)
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __eq__(self, other):
+        return isinstance(other, AtomIndex) and self.predicates == other.predicates and self.domains == other.domains
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def offset(self, predname, args):
+        """
+        Returns the offset of the ground atom with the given predicate name and
+        arguments, or None if the predicate or any of the constants is unknown.
+        """
+        i = self._preds.get(predname)
+        if i is None: return None
+        argdoms = self.predicates[i][1]
+        if len(args) != len(argdoms): return None
+        offset = self.bases[i]
+        for dom, arg, stride in zip(argdoms, args, self.strides[i]):
+            c = self._consts[dom].get(arg)
+            if c is None: return None
+            offset += c * stride
+        return offset
+
+
+    def atom(self, offset):
+        """
+        Returns the pair of the predicate name and the list of arguments of the
+        ground atom with the given offset.
+        """
+        if offset < 0 or offset >= self.size:
+            raise IndexError('Atom offset out of range: %s' % offset)
+        # empty blocks share their base with the next block, so take the last one
+        i = bisect_right(self.bases, offset) - 1
+        name, argdoms = self.predicates[i]
+        rest = int(offset) - self.bases[i]
+        args = []
+        for dom, stride in zip(argdoms, self.strides[i]):
+            c, rest = divmod(rest, stride)
+            args.append(self.domains[dom][c])
+        return name, args
+
+
+    def block(self, predname):
+        """
+        Returns the slice of the offsets of all ground atoms of the given predicate.
+        """
+        i = self._preds.get(predname)
+        if i is None:
+            raise NoSuchPredicateError('No such predicate: %s' % predname)
+        return slice(self.bases[i], self.bases[i] + int(numpy.prod(self.shapes[i], dtype=numpy.int64)))
+
+
+    def translate(self, other, offsets):
+        """
+        Maps the offsets of ground atoms in this index to the offsets of the same
+        ground atoms in the index `other`, which may intern the constants in a
+        different order. Atoms that do not exist in `other` are mapped to -1.
+
+        :param offsets:    an array of offsets in this index.
+        :returns:          an int64 array of the offsets in `other`.
+        """
+        offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        if self == other: return offsets.copy()
+        result = numpy.full(len(offsets), -1, dtype=numpy.int64)
+        constmaps = {}
+        for i, (name, argdoms) in enumerate(self.predicates):
+            j = other._preds.get(name)
+            if j is None or other.predicates[j][1] != argdoms: continue
+            block = self.block(name)
+            where = numpy.flatnonzero((offsets >= block.start) & (offsets < block.stop))
+            if not len(where): continue
+            if not argdoms:
+                result[where] = other.bases[j]
+                continue
+            coords = numpy.unravel_index(offsets[where] - block.start, self.shapes[i])
+            target = numpy.full(len(where), other.bases[j], dtype=numpy.int64)
+            valid = numpy.ones(len(where), dtype=bool)
+            for dom, coord, stride in zip(argdoms, coords, other.strides[j]):
+                if dom not in constmaps:
+                    consts = other._consts.get(dom, {})
+                    constmaps[dom] = numpy.array([consts.get(c, -1) for c in self.domains[dom]], dtype=numpy.int64)
+                c = constmaps[dom][coord]
+                valid &= c >= 0
+                target += c * stride
+            result[where[valid]] = target[valid]
+        return result
+
+
+    def tojson(self):
+        return {'predicates': [[name, list(argdoms)] for name, argdoms in self.predicates],
+                'domains': self.domains}
+
+
+    @staticmethod
+    def fromjson(data):
+        return AtomIndex([(name, argdoms) for name, argdoms in data['predicates']], data['domains'])
+
+
+class EvidenceStore(object):
+    """
+    Stores the truth values of all ground atoms of an :class:`AtomIndex` in a
+    single float64 array, in which unknown truth values are NaN.
+
+    A store can be saved to a directory and loaded from there as a memory-mapped
+    array, such that the evidence of very large databases is paged in by the
+    operating system on demand instead of being held in memory.
+
+    :param index:     the :class:`AtomIndex` of the ground atoms.
+    :param values:    the array of truth values, ordered by the atom offsets.
+                      If None, all truth values are unknown.
+    """
+
+    def __init__(self, index, values=None):
+        if values is None:
+            values = numpy.full(index.size, numpy.nan)
+        elif len(values) != index.size:
+            raise Exception('Expected %d truth values, got %d' % (index.size, len(values)))
+        self.index = index
+        self.values = values
+
+
+    def __len__(self):
+        return int(numpy.count_nonzero(~numpy.isnan(self.values)))
+
+
+    def known(self):
+        """
+        Returns the array of the offsets of all ground atoms with known truth values.
+        """
+        return numpy.flatnonzero(~numpy.isnan(self.values))
+
+
+    def get(self, predname, args):
+        """
+        Returns the truth value of the given ground atom, or None if it is unknown.
+        """
+        offset = self.index.offset(predname, args)
+        if offset is None: return None
+        truth = self.values[offset]
+        return None if truth != truth else float(truth)
+
+
+    def _checkwriteable(self):
+        if not self.values.flags.writeable:
+            raise Exception("The evidence store is read-only. Load it with mmap_mode='r+' to write "
+                            "changes through to disk or with mmap_mode='c' to keep them in memory.")
+
+
+    def set(self, predname, args, truth):
+        """
+        Sets the truth value of the given ground atom. A truth value of None
+        retracts the evidence.
+        """
+        self._checkwriteable()
+        offset = self.index.offset(predname, args)
+        if offset is None:
+            if predname not in self.index._preds:
+                raise NoSuchPredicateError('No such predicate: %s' % predname)
+            raise Exception('Ground atom %s(%s) is not in the domains of the store.' % (predname, ','.join(args)))
+        self.values[offset] = numpy.nan if truth is None else truth
+
+
+    def items(self):
+        """
+        Iterates over the ground atoms with known truth values.
+
+        :returns:    a generator of ((predicate name, arguments), truth) tuples.
+        """
+        for offset in self.known():
+            yield self.index.atom(offset), float(self.values[offset])
+
+
+    def assignments(self, index):
+        """
+        Returns a dict mapping the offsets of the ground atoms in `index` to their
+        known truth values in this store. Ground atoms that do not exist in `index`
+        are skipped.
+        """
+        known = self.known()
+        targets = self.index.translate(index, known)
+        valid = targets >= 0
+        return dict(zip(targets[valid].tolist(), self.values[known[valid]].tolist()))
+
+
+    def relayout(self, domains):
+        """
+        Re-interns the constants to the given domains, keeping the truth values
+        of all ground atoms whose arguments remain in the domains. This copies
+        the truth values into memory, so the store is no longer memory-mapped and
+        subsequent changes are not written through to disk.
+        """
+        self._checkwriteable()
+        index = AtomIndex(self.index.predicates, domains)
+        known = self.known()
+        targets = self.index.translate(index, known)
+        valid = targets >= 0
+        values = numpy.full(index.size, numpy.nan)
+        values[targets[valid]] = self.values[known[valid]]
+        self.index = index
+        self.values = values
+
+
+    def copy(self):
+        return EvidenceStore(self.index, numpy.array(self.values))
+
+
+    def flush(self):
+        """
+        Writes the changes of a memory-mapped store back to disk.
+        """
+        if isinstance(self.values, numpy.memmap):
+            self.values.flush()
+
+
+    @staticmethod
+    def _writeindex(index, path):
+        os.makedirs(path, exist_ok=True)
+        data = index.tojson()
+        data['format'] = STORE_FORMAT
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump(data, f)
+
+
+    def save(self, path):
+        """
+        Saves this store to the directory `path`.
+        """
+        EvidenceStore._writeindex(self.index, path)
+        numpy.save(os.path.join(path, 'values.npy'), numpy.asarray(self.values))
+
+
+    @staticmethod
+    def load(path, mmap_mode='r'):
+        """
+        Loads a store from the directory `path`.
+
+        :param mmap_mode:    the mode the truth values are memory-mapped with (see
+                             :func:`numpy.load`). With the default mode `'r'` the store
+                             is read-only, with `'r+'` changes are written through to
+                             disk, with `'c'` they are kept in memory. If None, the
+                             truth values are read into memory.
+        """
+        with open(os.path.join(path, 'index.json')) as f:
+            data = json.load(f)
+        if data.get('format') != STORE_FORMAT:
+            raise Exception('Unsupported evidence store format in %s: %s' % (path, data.get('format')))
+        values = numpy.load(os.path.join(path, 'values.npy'), mmap_mode=mmap_mode)
+        return EvidenceStore(AtomIndex.fromjson(data), values)
+
+
+    @staticmethod
+    def create(index, path):
+        """
+        Creates an empty memory-mapped store in the directory `path`, which can be
+        filled without holding the truth values in memory.
+        """
+        EvidenceStore._writeindex(index, path)
+        values = numpy.lib.format.open_memmap(os.path.join(path, 'values.npy'), mode='w+', dtype=numpy.float64, shape=(index.size,))
+        values[:] = numpy.nan
+        return EvidenceStore(index, values)
+
+
+class ColumnarDatabase(Database):
+    """
+    A :class:`mln.database.Database` whose evidence is kept in an :class:`EvidenceStore`
+    instead of a dict of ground atom strings.
+
+    The domains of the database determine the layout of the store, so adding
+    evidence with a constant that is not yet in its domain, or removing a value
+    from a domain, re-interns all ground atoms. Databases of known domains should
+    thus be created from a store, e.g. by :meth:`fromdb` or :meth:`EvidenceStore.load`.
+    Re-interning copies a memory-mapped store into memory (see :meth:`EvidenceStore.relayout`),
+    and a store loaded read-only (the default of :meth:`EvidenceStore.load`) cannot be changed.
+    Unlike :meth:`mln.database.Database.retract`, retracting evidence leaves the
+    domains untouched.
+
+    The evidence of an MRF grounded with a columnar database is set by translating
+    the atom offsets of the store to the atom offsets of the MRF.
+
+    :param mln:      the :class:`mln.base.MLN` instance that the database shall be associated with.
+    :param store:    the :class:`EvidenceStore` holding the evidence. If None, an
+                     empty store for the predicates of the MLN is created.
+    :param domains:  the domains of an empty store.
+
+    :Example:
+    >>> db = ColumnarDatabase.fromdb(Database(mln, dbfile='huge.db'))
+    >>> db.store.save('huge.evidence')
+    >>> ...
+    >>> db = ColumnarDatabase(mln, EvidenceStore.load('huge.evidence'))
+    >>> mrf = mln.ground(db)
+    """
+
+    def __init__(self, mln, store=None, domains=None):
+        self.mln = mln
+        if store is None:
+            store = EvidenceStore(AtomIndex.frommln(mln, domains or {}))
+        self.store = store
+
+
+    @staticmethod
+    def fromdb(db):
+        """
+        Creates a columnar copy of the given database.
+        """
+        mln = db.mln
+        store = EvidenceStore(AtomIndex.frommln(mln, db.domains))
+        for atom, truth in db:
+            _, predname, args = mln.logic.parse_literal(atom)
+            store.set(predname, args, truth)
+        return ColumnarDatabase(mln, store)
+
+
+    @property
+    def domains(self):
+        return self.store.index.domains
+
+    @domains.setter
+    def domains(self, doms):
+        self.store.relayout(doms)
+
+    @property
+    def evidence(self):
+        return dict(self)
+
+    @property
+    def _evidence(self):
+        # read-only view for the methods inherited from Database
+        return dict(self)
+
+
+    def _atomargs(self, gndatom):
+        if isinstance(gndatom, str):
+            _, predname, args = self.mln.logic.parse_literal(gndatom)
+            return predname, args
+        elif isinstance(gndatom, Logic.GroundLit):
+            return gndatom.gndatom.predname, gndatom.gndatom.args
+        elif isinstance(gndatom, (Logic.GroundAtom, Logic.Lit)):
+            return gndatom.predname, gndatom.args
+        raise Exception('gndatom has an illegal type: %s' % str(type(gndatom)))
+
+
+    def truth(self, gndatom):
+        predname, args = self._atomargs(gndatom)
+        return self.store.get(predname, args)
+
+
+    def domain(self, domain):
+        if type(domain) is dict:
+            domains = self.store.index.domains
+            new = defaultdict(list)
+            for domname, values in domain.items():
+                if type(values) is not list: values = [values]
+                dom = domains.get(domname, [])
+                for value in values:
+                    if value not in dom and value not in new[domname]: new[domname].append(value)
+            new = dict([(d, v) for d, v in new.items() if v])
+            if new:
+                self.store.relayout(dict([(d, domains.get(d, []) + new.get(d, [])) for d in set(domains) | set(new)]))
+        elif domain is not None:
+            return self.store.index.domains.get(domain)
+        else:
+            return self.store.index.domains
+
+
+    def copy(self, mln=None):
+        if mln is None or mln is self.mln:
+            return ColumnarDatabase(self.mln, self.store.copy())
+        return Database.copy(self, mln)
+
+
+    def _extend(self, domains, evidence):
+        self.domain(dict([(d, list(v)) for d, v in domains.items()]))
+        for atom, truth in evidence.items():
+            _, predname, args = _parse_literal(self.mln.logic, atom)
+            self.store.set(predname, args, truth)
+        return self
+
+
+    def add(self, gndlit, truth=1):
+        pred, args, _, truth = self._parselit(gndlit, truth)
+        doms = defaultdict(list)
+        for domname, arg in zip(pred.argdoms, args):
+            doms[domname].append(arg)
+        self.domain(dict(doms))
+        self.store.set(pred.name, args, truth)
+        return self
+
+
+    def retract(self, gndatom):
+        predname, args = self._atomargs(gndatom)
+        if self.store.index.offset(predname, args) is None: return
+        self.store.set(predname, args, None)
+
+
+    def retractall(self, predname):
+        self.store.values[self.store.index.block(predname)] = numpy.nan
+
+
+    def rmval(self, domain, value):
+        domains = dict(self.store.index.domains)
+        domains[domain] = [v for v in domains[domain] if v != value]
+        self.store.relayout(domains)
+
+
+    def __iter__(self):
+        for (predname, args), truth in self.store.items():
+            yield '%s(%s)' % (predname, ','.join(args)), truth
+
+
+    def __getitem__(self, atom):
+        return self.truth(atom)
+
+
+    def __contains__(self, el):
+        return self.truth(el) is not None
+
+
+    def __len__(self):
+        return len(self.store)
+
+
+    def isempty(self):
+        return len(self.store) == 0 and not any(self.domains.values())
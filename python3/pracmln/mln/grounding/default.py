@@ -20,6 +20,9 @@
 # CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import pickle
+import tempfile
+
 from dnutils import logs, ProgressBar, ifnone
 
 from ..util import fstr, dict_union, StopWatch
@@ -33,6 +36,166 @@ logger = logs.getlogger(__name__)
 CACHE_SIZE = 100000
 
 
+class GroundingCache(object):
+    """
+    Cache of ground formulas with a bounded memory footprint.
+    
+    The first `maxsize` ground formulas are kept in memory, all further ones
+    are spilled into a temporary file in a compact encoding that refers to
+    ground atoms by their indices, and are rebuilt when the cache is replayed.
+    
+    :param mrf:        the MRF the ground formulas belong to.
+    :param maxsize:    the maximal number of ground formulas kept in memory.
+    :param watch:      a :class:`mln.util.StopWatch`, whose tags ``cache hits``
+                       and ``cache spills`` count the ground formulas replayed
+                       from the cache and written to disk, respectively.
+    """
+    
+    # the formula types that are encoded by their children
+    COMPLEX = ('Conjunction', 'Disjunction', 'Negation', 'Implication', 'Biimplication')
+    
+    def __init__(self, mrf, maxsize, watch=None):
+        self.mrf = mrf
+        self.maxsize = maxsize
+        self.watch = ifnone(watch, StopWatch())
+        self._memory = []
+        self._file = None
+        self._spilled = 0
+        
+        
+    def __len__(self):
+        return len(self._memory) + self._spilled
+    
+    
+    @property
+    def spilled(self):
+        return self._spilled
+    
+    
+    def append(self, gf):
+        if len(self._memory) < self.maxsize:
+            self._memory.append(gf)
+            return
+        record = self.encode(gf)
+        if record is None:
+            # formulas that cannot be encoded have to stay in memory
+            self._memory.append(gf)
+            return
+        self._spill(record)
+        
+    
+    def load(self, records):
+        """
+        Fills the cache with ground formulas in their encoded form (see :meth:`encode`).
+        """
+        for idx, code in records:
+            if len(self._memory) < self.maxsize:
+                gf = self._decode(code)
+                gf.idx = idx
+                self._memory.append(gf)
+            else:
+                self._spill((idx, code))
+    
+    
+    def records(self):
+        """
+        Iterates over the encoded ground formulas in the cache.
+        
+        :returns:    a generator of encoded ground formulas, or `None` values for
+                     the ground formulas that cannot be encoded.
+        """
+        for gf in self._memory:
+            yield self.encode(gf)
+        if not self._spilled: return
+        self._file.flush()
+        with open(self._file.name, 'rb') as f:
+            for _ in range(self._spilled):
+                yield pickle.load(f)
+    
+    
+    def _spill(self, record):
+        if self._file is None:
+            self._file = tempfile.NamedTemporaryFile(prefix='pracmln-', suffix='.gndcache')
+            logger.debug('Grounding cache exceeds %d ground formulas. Spilling to %s' % (self.maxsize, self._file.name))
+        self._file.seek(0, 2)
+        pickle.dump(record, self._file, pickle.HIGHEST_PROTOCOL)
+        self._spilled += 1
+        self.watch.count('cache spills')
+        
+    
+    def __iter__(self):
+        for gf in self._memory:
+            self.watch.count('cache hits')
+            yield gf
+        if not self._spilled: return
+        self._file.flush()
+        spilled = self._spilled
+        with open(self._file.name, 'rb') as f:
+            for _ in range(spilled):
+                idx, code = pickle.load(f)
+                gf = self._decode(code)
+                gf.idx = idx
+                self.watch.count('cache hits')
+                yield gf
+        
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory = []
+        self._spilled = 0
+        
+        
+    def __del__(self):
+        self.close()
+        
+    
+    def encode(self, gf):
+        """
+        Encodes a ground formula as a pair of its formula index and nested
+        tuples representing its structure, in which ground literals are
+        represented by their signed ground atom indices (starting from 1).
+        
+        :returns:    the encoded ground formula or `None`, if the formula contains
+                     elements that cannot be encoded.
+        """
+        code = self._encode(gf)
+        if code is None: return None
+        return gf.idx, code
+    
+    
+    def _encode(self, f):
+        name = type(f).__name__
+        if name == 'GroundLit':
+            return -(f.gndatom.idx + 1) if f.negated else f.gndatom.idx + 1
+        elif name == 'TrueFalse':
+            return (name, f.value)
+        elif name == 'Equality':
+            return (name, tuple(f.args), f.negated)
+        elif name in GroundingCache.COMPLEX:
+            children = []
+            for child in f.children:
+                c = self._encode(child)
+                if c is None: return None
+                children.append(c)
+            return (name, tuple(children))
+        return None
+    
+    
+    def _decode(self, code):
+        mln = self.mrf.mln
+        logic = mln.logic
+        if not isinstance(code, tuple):
+            return logic.gnd_lit(self.mrf.gndatom(abs(code) - 1), code < 0, mln)
+        clazz = getattr(logic, code[0])
+        if code[0] == 'TrueFalse':
+            return clazz(code[1], mln=mln)
+        elif code[0] == 'Equality':
+            return clazz(list(code[1]), code[2], mln=mln)
+        return clazz([self._decode(c) for c in code[1]], mln=mln)
+
+
 class DefaultGroundingFactory:
     """
     Implementation of the default grounding algorithm, which
@@ -81,41 +244,65 @@ class DefaultGroundingFactory:
         return self._cachesize is not None and self._cachesize > 0
     
     
+    @property
+    def _storagekey(self):
+        """
+        The name under which the ground formulas are stored in the `groundings`
+        of the MRF (see :class:`mln.mrfcache.GroundingStore`), or `None` if they
+        depend on the evidence and cannot be stored.
+        """
+        if self.mrf.groundings is None or self.simplify or self.unsatfailure: return None
+        if len(self.formulas) != len(self.mrf.formulas) or any([f is not g for f, g in zip(self.formulas, self.mrf.formulas)]): 
+            return None
+        return type(self).__name__
+    
+    
     def _cacheinit(self):
-        if False:#self.total_gf > self._cachesize:
-            logger.warning('Number of formula groundings (%d) exceeds cache size (%d). Caching is disabled.' % (self.total_gf, self._cachesize))
-        else:
-            self._cache = []
+        self._cache = GroundingCache(self.mrf, self._cachesize, watch=self.watch)
         self.__cacheinit = True
+        key = self._storagekey
+        if key is not None and key in self.mrf.groundings:
+            # the ground formulas have been computed before, e.g. restored from an MRFCache
+            self._cache.load(self.mrf.groundings.load(key))
+            self.__cachecomplete = True
+    
+    
+    def _store(self):
+        key = self._storagekey
+        if key is None or key in self.mrf.groundings: return
+        self.mrf.groundings.store(key, self._cache.records())
     
     
     def itergroundings(self):
         """
         Iterates over all formula groundings.
+        
+        Ground formulas that have been generated before are replayed from the
+        cache, if caching is enabled.
         """
         self.watch.tag('grounding', verbose=self.verbose)
         if self.grounder is None:
             self.grounder = iter(self._itergroundings(simplify=self.simplify, unsatfailure=self.unsatfailure))
         if self.usecache and not self.iscached:
             self._cacheinit()
-        counter = -1
-        while True:
-            counter += 1
-            if self.iscached and len(self._cache) > counter:
-                yield self._cache[counter]
-            elif not self.__cachecomplete:
-                try:
-                    gf = next(self.grounder)
-                except StopIteration:
-                    self.__cachecomplete = True
-                    return
-                else:
-                    if self._cache is not None:
-                        self._cache.append(gf)
-                    yield gf
-            else: return
-        self.watch.finish('grounding')
-        if self.verbose: print()
+        if self.iscached:
+            for gf in self._cache:
+                yield gf
+        while not self.__cachecomplete:
+            try:
+                gf = next(self.grounder)
+            except StopIteration:
+                self.__cachecomplete = True
+                self.watch.finish('grounding')
+                if self._cache is not None:
+                    self._store()
+                if self.verbose and self._cache is not None and self._cache.spilled:
+                    print('%d of %d ground formulas spilled to disk' % (self._cache.spilled, len(self._cache)))
+                return
+            else:
+                if self._cache is not None:
+                    self._cache.append(gf)
+                yield gf
             
             
     def _itergroundings(self, simplify=False, unsatfailure=False):
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# Markov Logic Networks
+#
+# (C) 2012-2015 by Daniel Nyga
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy
+
+from ..constants import HARD
+from ..errors import SatisfiabilityException
+from ...logic.common import Logic
+
+
+def _gather(offsets, idx):
+    """
+    Gathers the segments with indices `idx` of a segmented array given by its
+    `offsets`, i.e. segment i spans the elements ``offsets[i]:offsets[i+1]``.
+    
+    :returns:    a pair of the indices of the gathered elements and the
+                 offsets of the gathered segments.
+    """
+    starts = offsets[idx]
+    lengths = offsets[idx + 1] - starts
+    newoffsets = numpy.zeros(len(idx) + 1, dtype=numpy.int32)
+    numpy.cumsum(lengths, out=newoffsets[1:])
+    elements = numpy.arange(newoffsets[-1], dtype=numpy.int32) - numpy.repeat(newoffsets[:-1] - starts, lengths)
+    return elements, newoffsets
+
+
+class ClauseKB(object):
+    """
+    Compiled representation of a set of ground formulas in conjunctive 
+    normal form.
+    
+    The literals of all clauses are stored in a flat int32 array of signed
+    ground atom indices, where the ground atom with index `i` is represented
+    by `i+1` and its negation by `-(i+1)`. Clauses and formulas are given by
+    offset arrays, i.e. clause `c` consists of the literals
+    ``lits[clause_offsets[c]:clause_offsets[c+1]]`` and ground formula `f` 
+    consists of the clauses ``gf_offsets[f]:gf_offsets[f+1]``. This allows
+    to evaluate all clauses and formulas of the KB at once in a possible world 
+    (or in a matrix of worlds, one per row) by vectorized operations.
+    
+    Truth constants remaining in the clauses after simplification are folded
+    into a lower bound of the truth of every clause (and an upper bound of the
+    truth of every formula), such that the KB also evaluates formulas with
+    fuzzy evidence correctly. Ground formulas whose truth is fixed are not
+    part of the KB.
+    
+    :param mrf:            the MRF the ground formulas belong to.
+    :param gndformulas:    an iterable of (logical) ground formulas.
+    :param weights:        an iterable of the weights of the ground formulas. If `None`,
+                           the weights of the respective formulas in the MLN are used.
+    """
+    
+    def __init__(self, mrf, gndformulas=None, weights=None):
+        self.mrf = mrf
+        self.gndformulas = []
+        lits = []
+        clause_offsets = [0]
+        clause_floor = []
+        gf_offsets = [0]
+        gf_ceil = []
+        weights_ = []
+        gndformulas = [] if gndformulas is None else list(gndformulas)
+        for gf, weight in zip(gndformulas, (gf.weight for gf in gndformulas) if weights is None else weights):
+            clauses, floors, ceil = self._clauses(gf)
+            if not clauses:
+                if ceil == 0 and weight == HARD:
+                    raise SatisfiabilityException('MLN is unsatisfiable due to hard constraint violation: %s' % str(gf))
+                continue
+            for clause, floor in zip(clauses, floors):
+                lits.extend(clause)
+                clause_offsets.append(len(lits))
+                clause_floor.append(floor)
+            gf_offsets.append(len(clause_floor))
+            gf_ceil.append(ceil)
+            weights_.append(weight)
+            self.gndformulas.append(gf)
+        self._init(numpy.array(lits, dtype=numpy.int32),
+                   numpy.array(clause_offsets, dtype=numpy.int32),
+                   numpy.array(clause_floor, dtype=numpy.float64),
+                   numpy.array(gf_offsets, dtype=numpy.int32),
+                   numpy.array(gf_ceil, dtype=numpy.float64),
+                   numpy.array(weights_, dtype=numpy.float64))
+        
+        
+    def _init(self, lits, clause_offsets, clause_floor, gf_offsets, gf_ceil, weights):
+        self.lits = lits
+        self.clause_offsets = clause_offsets
+        self.clause_floor = clause_floor
+        self.gf_offsets = gf_offsets
+        self.gf_ceil = gf_ceil
+        self.weights = weights
+        self.hard = weights == HARD
+        self.atoms = numpy.abs(lits) - 1
+        self.positive = lits > 0
+        # clause index -> ground formula index
+        self.clause2gf = numpy.repeat(numpy.arange(len(weights), dtype=numpy.int32), numpy.diff(gf_offsets))
+        # literal index -> clause index
+        self.lit2clause = numpy.repeat(numpy.arange(len(clause_floor), dtype=numpy.int32), numpy.diff(clause_offsets))
+        self._atomindex = None
+        
+        
+    def _clauses(self, gf):
+        """
+        Converts the ground formula `gf` into a list of clauses of signed
+        ground atom indices, a list of the truth values of the constants in
+        every clause and the truth value of the constant clauses of the formula.
+        """
+        if not gf.islogical():
+            raise Exception('Cannot compile non-logical constraint %s into clauses.' % str(gf))
+        cnf = gf.cnf()
+        if isinstance(cnf, Logic.TrueFalse):
+            return [], [], cnf.value
+        clauses = []
+        floors = []
+        ceil = 1.
+        for c in (cnf.children if isinstance(cnf, Logic.Conjunction) else [cnf]):
+            clause = []
+            floor = 0.
+            for lit in (c.children if isinstance(c, Logic.Disjunction) else [c]):
+                if isinstance(lit, Logic.TrueFalse):
+                    floor = max(floor, lit.value)
+                elif isinstance(lit, Logic.GroundLit):
+                    clause.append(-(lit.gndatom.idx + 1) if lit.negated else lit.gndatom.idx + 1)
+                else:
+                    raise Exception('Cannot compile %s in ground formula %s into a clause.' % (repr(lit), str(gf)))
+            if floor == 1:
+                continue
+            if not clause:
+                ceil = min(ceil, floor)
+                continue
+            clauses.append(clause)
+            floors.append(floor)
+        if ceil == 0:
+            return [], [], 0
+        return clauses, floors, ceil
+            
+    
+    @property
+    def nclauses(self):
+        return len(self.clause_floor)
+    
+    
+    def __len__(self):
+        return len(self.weights)
+    
+    
+    def clause(self, cidx):
+        """
+        Returns the signed ground atom indices of the clause with index `cidx` as a list.
+        """
+        return self.lits[self.clause_offsets[cidx]:self.clause_offsets[cidx + 1]].tolist()
+    
+    
+    def littruth(self, world):
+        """
+        Returns the truth values of all literals in the given world(s).
+        
+        :param world:    a vector of truth values of all ground atoms, or a matrix
+                         holding such a vector in every row. 
+        """
+        truth = world[..., self.atoms]
+        return numpy.where(self.positive, truth, 1. - truth)
+    
+    
+    def clausetruth(self, world):
+        """
+        Returns the truth values of all clauses in the given world(s).
+        """
+        if not self.nclauses:
+            return numpy.zeros(world.shape[:-1] + (0,))
+        truth = numpy.maximum.reduceat(self.littruth(world), self.clause_offsets[:-1], axis=-1)
+        return numpy.maximum(truth, self.clause_floor)
+        
+        
+    def truth(self, world):
+        """
+        Returns the truth values of all ground formulas in the given world(s).
+        """
+        if not len(self):
+            return numpy.zeros(world.shape[:-1] + (0,))
+        truth = numpy.minimum.reduceat(self.clausetruth(world), self.gf_offsets[:-1], axis=-1)
+        return numpy.minimum(truth, self.gf_ceil)
+    
+    
+    def select(self, gfidx):
+        """
+        Returns a new KB consisting of the ground formulas with the given indices.
+        """
+        gfidx = numpy.asarray(gfidx, dtype=numpy.int32)
+        clauses, gf_offsets = _gather(self.gf_offsets, gfidx)
+        lits, clause_offsets = _gather(self.clause_offsets, clauses)
+        return self._copy([self.gndformulas[i] for i in gfidx], self.lits[lits], clause_offsets, 
+                          self.clause_floor[clauses], gf_offsets, self.gf_ceil[gfidx], self.weights[gfidx])
+    
+    
+    def localize(self, atoms=None):
+        """
+        Returns a copy of this KB whose literals refer to the positions in the
+        sorted array of the ground atoms it contains (instead of the ground atom
+        indices of the MRF), together with this array. Evaluating the copy
+        only requires the truth values of these atoms, e.g. ``world[atoms]``.
+        
+        :param atoms:    a sorted array of ground atom indices that is a superset of 
+                         the atoms in the KB, which is used instead of the atoms of the KB.
+        """
+        if atoms is None:
+            atoms, inverse = numpy.unique(self.atoms, return_inverse=True)
+        else:
+            inverse = numpy.searchsorted(atoms, self.atoms)
+        lits = numpy.where(self.positive, inverse + 1, -(inverse + 1)).astype(numpy.int32)
+        kb = self._copy(self.gndformulas, lits, self.clause_offsets, self.clause_floor,
+                        self.gf_offsets, self.gf_ceil, self.weights)
+        return kb, atoms.astype(numpy.int32)
+    
+    
+    def _copy(self, gndformulas, *arrays):
+        kb = ClauseKB.__new__(ClauseKB)
+        kb.mrf = self.mrf
+        kb.gndformulas = gndformulas
+        kb._init(*arrays)
+        return kb
+    
+    
+    def atomgfs(self, atomindices):
+        """
+        Returns the sorted indices of all ground formulas that contain any 
+        of the given ground atoms.
+        """
+        if self._atomindex is None:
+            # ground atom index -> literal indices, sorted by atom
+            order = numpy.argsort(self.atoms, kind='stable')
+            offsets = numpy.searchsorted(self.atoms[order], numpy.arange(len(self.mrf.gndatoms) + 1))
+            self._atomindex = (self.clause2gf[self.lit2clause[order]], offsets)
+        gfs, offsets = self._atomindex
+        return numpy.unique(numpy.concatenate([gfs[offsets[a]:offsets[a + 1]] for a in atomindices] + [numpy.zeros(0, dtype=numpy.int32)]))
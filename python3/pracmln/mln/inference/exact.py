@@ -23,19 +23,21 @@
 # CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
-from dnutils import logs, ProgressBar
+from collections import defaultdict
 
+import numpy
+from dnutils import logs, ProgressBar, ifnone
+
+from .clausekb import ClauseKB
 from .infer import Inference
 from multiprocessing import Pool
 from ..mrfvars import FuzzyVariable
 from ..constants import auto, HARD
 from ..errors import SatisfiabilityException
 from ..grounding.fastconj import FastConjunctionGrounding
-from ..util import Interval, colorize
+from ..util import colorize
 from ...utils.multicore import with_tracing
-from ...logic.fol import FirstOrderLogic
 from ...logic.common import Logic
-from numpy.ma.core import exp
 
 
 logger = logs.getlogger(__name__)
@@ -45,40 +47,48 @@ logger = logs.getlogger(__name__)
 global_enumAsk = None
 
 
-def eval_queries(world):
+def eval_worlds(args):
+    """
+    Computes the log-sums of the world weights of a component over a range of
+    its worlds.
+    
+    :param args:    a triple of the component index and the start and end
+                    index of the range of worlds.
+    """
+    cidx, start, stop = args
+    return global_enumAsk.components[cidx].logsums(start, stop)
+
+
+def logsumexp(a, axis=None):
     """
-    Evaluates the queries given a possible world.
+    Computes ``log(sum(exp(a)))`` in a numerically stable way.
     """
-    numerators = [0] * len(global_enumAsk.queries)
-    denominator = 0
-    expsum = 0
-    for gf in global_enumAsk.grounder.itergroundings():
-        if global_enumAsk.soft_evidence_formula(gf):
-            expsum += gf.noisyor(world) * gf.weight
-        else:
-            truth = gf(world)
-            if gf.weight == HARD:
-                if truth in Interval(']0,1['):
-                    raise Exception('No real-valued degrees of truth are allowed in hard constraints.')
-                if truth == 1:
-                    continue
-                else:
-                    return numerators, 0
-            expsum += gf(world) * gf.weight
-    expsum = exp(expsum)
-    # update numerators
-    for i, query in enumerate(global_enumAsk.queries):
-        if query(world):
-            numerators[i] += expsum
-    denominator += expsum
-    return numerators, denominator
+    m = numpy.max(a, axis=axis, keepdims=True) if numpy.size(a) else numpy.array(-numpy.inf)
+    m = numpy.where(numpy.isfinite(m), m, 0)
+    with numpy.errstate(divide='ignore'):
+        res = numpy.log(numpy.sum(numpy.exp(a - m), axis=axis, keepdims=True)) + m
+    return res.squeeze() if axis is None else numpy.squeeze(res, axis=axis)
 
 
 class EnumerationAsk(Inference):
     """
     Inference based on enumeration of (only) the worlds compatible with the
     evidence; supports soft evidence (assuming independence)
+    
+    The ground formulas of every component are compiled into a 
+    :class:`mln.inference.clausekb.ClauseKB` once, such that the weights of
+    a batch of worlds are computed from a single (worlds x formulas) truth matrix.
+    Worlds are addressed by their index in the enumeration of a component, and
+    the sums over the worlds are accumulated in log space.
+    
+    :param decompose:    (bool) if `True` (default), the ground network is decomposed
+                         into its connected components given the evidence, and the
+                         worlds of every component containing a query are enumerated
+                         separately.
     """
+    
+    # number of worlds that are evaluated at once
+    BATCHSIZE = 4096
 
     def __init__(self, mrf, queries, **params):
         Inference.__init__(self, mrf, queries, **params)
@@ -91,6 +101,100 @@ class EnumerationAsk(Inference):
             variable.consistent(self.mrf.evidence, strict=isinstance(variable, FuzzyVariable))
 
 
+    @property
+    def decompose(self):
+        return self._params.get('decompose', True)
+    
+    
+    class _Component(object):
+        """
+        A connected component of the ground network compiled for the vectorized
+        enumeration of its worlds.
+        
+        The worlds are numbered in the mixed radix system given by the numbers of
+        admissible values of the variables, i.e. the value indices of the variables
+        in world `i` are the digits of `i`.
+        """
+        
+        def __init__(self, mrf, variables, gndformulas, queries, qidx):
+            self.mrf = mrf
+            self.variables = variables
+            self.queries = qidx
+            evidence = mrf.evidence_dicti()
+            # non-logical constraints cannot be compiled and are evaluated world by world
+            self.others = [gf for gf in gndformulas if not gf.islogical()]
+            kb = ClauseKB(mrf, [gf for gf in gndformulas if gf.islogical()])
+            qkb = ClauseKB(mrf, queries, weights=[0] * len(queries))
+            # the truth values of queries that are constant in all worlds
+            qcols = dict([(id(q), i) for i, q in enumerate(qkb.gndformulas)])
+            self.qcols = numpy.array([qcols.get(id(q), -1) for q in queries], dtype=numpy.int32)
+            self.qconst = numpy.array([q.cnf().value if id(q) not in qcols else 0 for q in queries], dtype=numpy.float64)
+            varatoms = [a.idx for v in variables for a in v.gndatoms]
+            self.atoms = numpy.unique(numpy.concatenate([kb.atoms, qkb.atoms, numpy.array(varatoms, dtype=numpy.int32)]))
+            self.kb, _ = kb.localize(self.atoms)
+            self.qkb, _ = qkb.localize(self.atoms)
+            self.hard = self.kb.hard
+            self.weights = numpy.where(self.hard, 0, self.kb.weights)
+            self.base = numpy.array([ifnone(mrf.evidence[a], 0) for a in self.atoms], dtype=numpy.float64)
+            self.values = []
+            self.size = 1
+            for variable in variables:
+                values = numpy.array(list(variable.values(evidence)), dtype=numpy.float64)
+                positions = numpy.searchsorted(self.atoms, [a.idx for a in variable.gndatoms])
+                self.values.append((self.size, len(values), positions, values))
+                self.size *= len(values)
+                
+        
+        def worlds(self, start, stop):
+            """
+            Returns the matrix of the worlds with indices from `start` to `stop`, 
+            restricted to the atoms of the component.
+            """
+            idx = numpy.arange(start, stop, dtype=numpy.int64)
+            worlds = numpy.tile(self.base, (len(idx), 1))
+            for stride, radix, positions, values in self.values:
+                worlds[:, positions] = values[(idx // stride) % radix]
+            return worlds
+        
+        
+        def logweights(self, worlds):
+            """
+            Computes the logarithms of the unnormalized probabilities of the given worlds.
+            """
+            truth = self.kb.truth(worlds)
+            hard = truth[:, self.hard]
+            if numpy.any((hard > 0) & (hard < 1)):
+                raise Exception('No real-valued degrees of truth are allowed in hard constraints.')
+            logweights = truth.dot(self.weights)
+            logweights[numpy.any(hard < 1, axis=1)] = -numpy.inf
+            if self.others:
+                world = list(self.mrf.evidence)
+                for i, row in enumerate(worlds):
+                    for atom, truth in zip(self.atoms, row): world[atom] = truth
+                    for gf in self.others:
+                        truth = gf(world)
+                        if gf.weight == HARD:
+                            if 0 < truth < 1:
+                                raise Exception('No real-valued degrees of truth are allowed in hard constraints.')
+                            if truth < 1: logweights[i] = -numpy.inf
+                        else:
+                            logweights[i] += truth * gf.weight
+            return logweights
+        
+        
+        def logsums(self, start, stop):
+            """
+            Computes the log-sum of the weights of the worlds with indices from `start`
+            to `stop`, and the log-sums of the weights of those worlds in which
+            the respective queries hold.
+            """
+            worlds = self.worlds(start, stop)
+            logweights = self.logweights(worlds)
+            qtruth = self.qkb.truth(worlds)
+            qtruth = numpy.where(self.qcols >= 0, qtruth[:, numpy.maximum(self.qcols, 0)] if len(self.qkb) else 0, self.qconst)
+            return logsumexp(logweights), logsumexp(numpy.where(qtruth > 0, logweights[:, None], -numpy.inf), axis=0)
+
+
     def _run(self):
         """
         verbose: whether to print results (or anything at all, in fact)
@@ -110,15 +214,17 @@ class EnumerationAsk(Inference):
             if isinstance(gf, Logic.TrueFalse) and gf.truth() == .0:
                 raise SatisfiabilityException('MLN is unsatisfiable due to hard constraint violation by evidence: {} ({})'.format(str(gf), str(self.mln.formula(gf.idx))))
         self._watch.finish('check hard constraints')
+        # decompose the ground network into independent components and compile them
+        self._watch.tag('compiling components', verbose=self.verbose)
+        self.components = [EnumerationAsk._Component(self.mrf, variables, gndformulas, [self.queries[i] for i in qidx], qidx) 
+                           for variables, gndformulas, qidx in self._components()]
+        self._watch.finish('compiling components')
         # compute number of possible worlds
-        worlds = 1
-        for variable in self.mrf.variables:
-            values = variable.valuecount(self.mrf.evidence)
-            worlds *= values
-        numerators = [0.0 for i in range(len(self.queries))]
-        denominator = 0.
+        worlds = sum([c.size for c in self.components])
+        lognumerators = numpy.full(len(self.queries), -numpy.inf)
+        logdenominators = numpy.full(len(self.queries), -numpy.inf)
         # start summing
-        logger.debug("Summing over %d possible worlds..." % worlds)
+        logger.debug("Summing over %d possible worlds in %d component(s)..." % (worlds, len(self.components)))
         if worlds > 500000 and self.verbose:
             print(colorize('!!! %d WORLDS WILL BE ENUMERATED !!!' % worlds, (None, 'red', True), True))
         k = 0
@@ -128,49 +234,102 @@ class EnumerationAsk(Inference):
         bar = None
         if self.verbose:
             bar = ProgressBar(steps=worlds, color='green')
+        # the worlds are distributed in ranges of their indices
+        ranges = [(cidx, start, min(start + EnumerationAsk.BATCHSIZE, c.size)) for cidx, c in enumerate(self.components)
+                  for start in range(0, c.size, EnumerationAsk.BATCHSIZE)]
+        logz = [-numpy.inf] * len(self.components)
         if self.multicore:
             pool = Pool()
             logger.debug('Using multiprocessing on {} core(s)...'.format(pool._processes))
-            try:
-                for num, denum in pool.imap(with_tracing(eval_queries), self.mrf.worlds()):
-                    denominator += denum
-                    k += 1
-                    for i, v in enumerate(num):
-                        numerators[i] += v
-                    if self.verbose: bar.inc()
-            except Exception as e:
+        try:
+            for (cidx, start, stop), (logsum, lognums) in zip(ranges, pool.imap(with_tracing(eval_worlds), ranges) if self.multicore else map(eval_worlds, ranges)):
+                queries = self.components[cidx].queries
+                logz[cidx] = numpy.logaddexp(logz[cidx], logsum)
+                lognumerators[queries] = numpy.logaddexp(lognumerators[queries], lognums)
+                k += stop - start
+                if self.verbose:
+                    bar.update(float(k) / worlds)
+        except Exception as e:
+            if self.multicore:
                 logger.error('Error in child process. Terminating pool...')
                 pool.close()
-                raise e
-            finally:
+            raise e
+        finally:
+            if self.multicore:
                 pool.terminate()
                 pool.join()
-        else:  # do it single core
-            for world in self.mrf.worlds():
-                # compute exp. sum of weights for this world
-                num, denom = eval_queries(world)
-                denominator += denom
-                for i, _ in enumerate(self.queries):
-                    numerators[i] += num[i]
-                k += 1
-                if self.verbose:
-                    bar.update(float(k) / worlds)
+        for c, logsum in zip(self.components, logz):
+            if logsum == -numpy.inf:
+                raise SatisfiabilityException(
+                    'MLN is unsatisfiable. All probability masses returned 0.')
+            logdenominators[c.queries] = logsum
         logger.debug("%d worlds enumerated" % k)
         self._watch.finish('enumerating worlds')
         if 'grounding' in self.grounder.watch.tags:
             self._watch.tags['grounding'] = self.grounder.watch['grounding']
-        if denominator == 0:
-            raise SatisfiabilityException(
-                'MLN is unsatisfiable. All probability masses returned 0.')
         # normalize answers
-        dist = [float(x) / denominator for x in numerators]
+        dist = numpy.exp(lognumerators - logdenominators)
         result = {}
         for q, p in zip(self.queries, dist):
-            result[str(q)] = p
+            result[str(q)] = float(p)
         return result
-
-    def soft_evidence_formula(self, gf):
-        truths = [a.truth(self.mrf.evidence) for a in gf.gndatoms()]
-        if None in truths:
-            return False
-        return isinstance(self.mrf.mln.logic, FirstOrderLogic) and any([t in Interval('(0,1)') for t in truths])
+    
+    
+    def _components(self):
+        """
+        Partitions the variables that are not fully determined by the evidence
+        into the connected components of the ground network. Components that
+        do not contain any query are dropped, since they are independent of the
+        queries given the evidence. A query spanning multiple components merges them.
+        
+        :returns:    a list of (variables, ground formulas, query indices) triples.
+        """
+        evidence = self.mrf.evidence
+        parent = {}
+        def find(v):
+            while parent[v] != v:
+                parent[v] = parent[parent[v]]
+                v = parent[v]
+            return v
+        def openvars(f):
+            variables = set()
+            for atomidx in f.gndatom_indices():
+                if evidence[atomidx] is None:
+                    variables.add(self.mrf.variable(self.mrf.gndatom(atomidx)).idx)
+            return variables
+        def union(variables):
+            variables = list(variables)
+            for v in variables: parent.setdefault(v, v)
+            for v in variables[1:]:
+                parent[find(v)] = find(variables[0])
+        gndformulas = []
+        for gf in self.grounder.itergroundings():
+            variables = openvars(gf)
+            # ground formulas without open variables are constant in all worlds
+            if not variables: continue
+            union(variables)
+            gndformulas.append((gf, variables))
+        qvars = []
+        for q in self.queries:
+            variables = openvars(q)
+            union(variables)
+            qvars.append(variables)
+        if not self.decompose:
+            union(list(parent))
+        components = defaultdict(lambda: ([], [], []))
+        # queries without open variables have their own trivial component
+        trivial = []
+        for qidx, variables in enumerate(qvars):
+            if variables:
+                components[find(next(iter(variables)))][2].append(qidx)
+            else:
+                trivial.append(([], [], [qidx]))
+        components = dict([(root, c) for root, c in components.items()])
+        for gf, variables in gndformulas:
+            c = components.get(find(next(iter(variables))))
+            if c is not None: c[1].append(gf)
+        for variable in self.mrf.variables:
+            if variable.idx not in parent: continue
+            c = components.get(find(variable.idx))
+            if c is not None: c[0].append(variable)
+        return list(components.values()) + trivial
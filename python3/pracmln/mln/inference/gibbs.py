@@ -24,11 +24,10 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import random
-from collections import defaultdict
 
 import numpy
-from dnutils import ProgressBar
 
+from .clausekb import ClauseKB
 from .mcmc import MCMCInference
 from ..constants import ALL
 from ..grounding.fastconj import FastConjunctionGrounding
@@ -36,81 +35,84 @@ from ...logic.common import Logic
 
 
 class GibbsSampler(MCMCInference):
+    """
+    Gibbs sampling.
+    
+    The ground formulas are compiled into a :class:`mln.inference.clausekb.ClauseKB`.
+    For every variable that is not fully determined by the evidence, the formulas
+    in its Markov blanket are precomputed as a local KB over the ground atoms they 
+    contain, such that the conditional distribution of a variable is obtained 
+    from a single vectorized evaluation of all its values.
+    """
 
     def __init__(self, mrf, queries=ALL, **params):
         MCMCInference.__init__(self, mrf, queries, **params)
-        self.var2gf = defaultdict(set)
         grounder = FastConjunctionGrounding(mrf, simplify=True, unsatfailure=True, cache=None)
-        for gf in grounder.itergroundings():
-            if isinstance(gf, Logic.TrueFalse): continue
-            vars_ = set([self.mrf.variable(a).idx for a in gf.gndatoms()])
-            for v in vars_: self.var2gf[v].add(gf)
-    
-    @property
-    def chains(self):
-        return self._params.get('chains', 1)
+        self.kb = ClauseKB(mrf, [gf for gf in grounder.itergroundings() if not isinstance(gf, Logic.TrueFalse)])
+        evidence = self.mrf.evidence_dicti()
+        self.blankets = []
+        for var in self.mrf.variables:
+            values = list(var.values(evidence))
+            if len(values) > 1: 
+                self.blankets.append(GibbsSampler._Blanket(self.kb, var, values))
     
-    @property
-    def maxsteps(self):
-        return self._params.get('maxsteps', 500)
     
+    class _Blanket(object):
+        """
+        The ground formulas in the Markov blanket of a variable compiled as a local 
+        KB, together with the matrix of the admissible values of the variable.
+        """
+        
+        def __init__(self, kb, var, values):
+            self.var = var
+            self.values = values
+            self.kb, self.atoms = kb.select(kb.atomgfs([a.idx for a in var.gndatoms])).localize()
+            # the weights of the soft formulas and the mask of the hard ones
+            self.hard = self.kb.hard
+            self.weights = numpy.where(self.hard, 0, self.kb.weights)
+            # positions of the atoms of the variable among the local atoms, and the
+            # respective columns of the value matrix
+            cols = [i for i, a in enumerate(var.gndatoms) if a.idx in self.atoms]
+            self.positions = numpy.searchsorted(self.atoms, [var.gndatoms[i].idx for i in cols])
+            self.valuematrix = numpy.array(values, dtype=numpy.float64)[:, cols]
+            
+        
+        def logprobs(self, world):
+            """
+            Computes the log-probabilities of the values of the variable conditioned
+            on the world `world`. 
+            """
+            worlds = numpy.tile(world[self.atoms], (len(self.values), 1))
+            worlds[:, self.positions] = self.valuematrix
+            truth = self.kb.truth(worlds)
+            logits = truth.dot(self.weights)
+            # values violating hard constraints have zero probability. if all values violate
+            # some hard constraint (i.e. the current state is inconsistent with hard constraints
+            # outside the blanket), we keep the ones violating the fewest ones
+            violations = (truth[:, self.hard] < 1).sum(axis=1)
+            logits[violations > violations.min()] = -numpy.inf
+            maxlogit = logits.max()
+            # log-sum-exp
+            return logits - maxlogit - numpy.log(numpy.sum(numpy.exp(logits - maxlogit)))
+        
 
     class Chain(MCMCInference.Chain):
     
         def __init__(self, infer, queries):
             MCMCInference.Chain.__init__(self, infer, queries)
-            mrf = infer.mrf
+            self.state = numpy.array(self.state, dtype=numpy.float64)
             
-        def _valueprobs(self, var, world):
-            sums = [0] * var.valuecount()
-            for gf in self.infer.var2gf[var.idx]:
-                possible_values = []
-                for i, value in var.itervalues(self.infer.mrf.evidence):
-                    possible_values.append(i)
-                    world_ = var.setval(value, list(world))
-                    truth = gf(world_)
-                    if truth == 0 and gf.ishard:
-                        sums[i] = None
-                    elif sums[i] is not None and not gf.ishard:
-                        sums[i] += gf.weight * truth
-                # set all impossible values to None (i.e. prob 0) since they
-                # might still be have a value of 0 in sums 
-                for i in [j for j in range(len(sums)) if j not in possible_values]: sums[i] = None
-            expsums = numpy.array([numpy.exp(s) if s is not None else 0 for s in sums])
-            Z = sum(expsums) 
-            probs = expsums / Z
-            return probs
+        def _valueprobs(self, blanket, world):
+            return numpy.exp(blanket.logprobs(world))
         
         def step(self):
-            mrf = self.infer.mrf
             # reassign values by sampling from the conditional distributions given the Markov blanket
-            state = list(self.state)
-            for var in mrf.variables:
+            for blanket in self.infer.blankets:
                 # compute distribution to sample from
-                values = list(var.values())
-                if len(values) == 1: # do not sample if we have evidence 
-                    continue  
-                probs = self._valueprobs(var, self.state)
-                # check for soft evidence and greedily satisfy it if possible                
-                idx = None
-#                 if isinstance(var, BinaryVariable):
-#                     atom = var.gndatoms[0]
-#                     p = mrf.evidence[var.gndatoms[0]]
-#                     if p is not None:
-#                         belief = self.soft_evidence_frequency(atom)
-#                         if p > belief and expsums[1] > 0:
-#                             idx = 1
-#                         elif p < belief and expsums[0] > 0:
-#                             idx = 0
+                probs = self._valueprobs(blanket, self.state)
                 # sample value
-                if idx is None:
-                    r = random.uniform(0, 1)                    
-                    idx = 0
-                    s = probs[0]
-                    while r > s:
-                        idx += 1
-                        s += probs[idx]
-                var.setval(values[idx], self.state)
+                idx = min(numpy.searchsorted(numpy.cumsum(probs), random.uniform(0, 1)), len(probs) - 1)
+                blanket.var.setval(blanket.values[idx], self.state)
             # update results
             self.update(self.state)
     
@@ -126,35 +128,15 @@ class GibbsSampler(MCMCInference):
 #             self.softEvidence = self.mln.softEvidence
 #         else:
 #             self.softEvidence = softEvidence
-        # initialize chains
-        chains = MCMCInference.ChainGroup(self)
-        for i in range(self.chains):
-            chain = GibbsSampler.Chain(self, self.queries)
-            chains.chain(chain)
-#             if self.softEvidence is not None:
-#                 chain.setSoftEvidence(self.softEvidence)
         # do Gibbs sampling
-#         if verbose and details: print "sampling..."
-        converged = 0
-        steps = 0
-        if self.verbose:
-            bar = ProgressBar(color='green', steps=self.maxsteps)
-        while converged != self.chains and steps < self.maxsteps:
-            converged = 0
-            steps += 1
-            for chain in chains.chains:
-                chain.step()
-            if self.verbose:
-                bar.inc()
-                bar.label('%d / %d' % (steps, self.maxsteps))
-#                 if self.useConvergenceTest:
-#                     if chain.converged and numSteps >= minSteps:
-#                         converged += 1
-#             if verbose and details:
-#                 if numSteps % infoInterval == 0:
-#                     print "step %d (fraction converged: %.2f)" % (numSteps, float(converged) / numChains)
-#                 if numSteps % resultsInterval == 0:
-#                     chainGroup.getResults()
-#                     chainGroup.printResults(shortOutput=True)
+        chains = self._runchains()
         # get the results
         return chains.results()[0]
+    
+    
+    def _newchain(self):
+        return GibbsSampler.Chain(self, self.queries)
+    
+    
+    def _step(self, chain):
+        chain.step()
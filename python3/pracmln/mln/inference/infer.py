@@ -53,6 +53,8 @@ class Inference(object):
     
     :param cw:         (bool) if `True`, the closed-world assumption will be applied 
                        to all but the query atoms.
+    :param prune:      (bool) if `True`, inference is run on the subnetwork that is relevant
+                       for the queries given the evidence only.
     """
     
     def __init__(self, mrf, queries=ALL, **params):
@@ -135,6 +137,11 @@ class Inference(object):
         self._resultdb = db
 
 
+    @property
+    def prune(self):
+        return self._params.get('prune', False)
+
+
     @property
     def closedworld(self):
         return self._params.get('cw', False)
@@ -177,6 +184,27 @@ class Inference(object):
         raise Exception('%s does not implement _run()' % self.__class__.__name__)
 
 
+    def _run_pruned(self):
+        """
+        Runs the inference method on the subnetwork of the MRF that is relevant
+        for the queries given the evidence (see :class:`pruning.QuerySubnetwork`).
+        """
+        from .pruning import QuerySubnetwork
+        self._watch.tag('pruning', verbose=self.verbose)
+        self.subnetwork = QuerySubnetwork(self.mrf, self.queries)
+        self._watch.finish('pruning')
+        if self.verbose:
+            print('pruned %d of %d ground atoms and %d of %d ground formulas' % (self.subnetwork.pruned_atoms, len(self.mrf.gndatoms),
+                                                                                self.subnetwork.pruned_formulas, self.subnetwork.total_formulas))
+        params = dict(self._params)
+        params['prune'] = False
+        inference = type(self)(self.subnetwork.mrf, self.subnetwork.queries, **params)
+        results = inference.run().results
+        self._watch.tags.update(inference._watch.tags)
+        self._watch.counters.update(inference._watch.counters)
+        return dict([(str(q), results[str(q_)]) for q, q_ in zip(self.queries, self.subnetwork.queries)])
+    
+    
     def run(self):
         """
         Starts the inference process.
@@ -186,7 +214,10 @@ class Inference(object):
         if self.verbose: print('Inference engine: %s' % self.__class__.__name__)
         self._watch.tag('inference', verbose=self.verbose)
         _weights_backup = list(self.mln.weights)
-        self._results = self._run()
+        if self.prune:
+            self._results = self._run_pruned()
+        else:
+            self._results = self._run()
         self.mln.weights = _weights_backup
         self._watch.finish('inference')
         return self
@@ -242,6 +273,8 @@ class Inference(object):
         self._watch.finish()
         for t in sorted(list(self._watch.tags.values()), key=lambda t: t.elapsedtime, reverse=True):
             stream.write('%s %s %s\n' % (barstr(width=30, percent=t.elapsedtime / total, color=col), elapsed_time_str(t.elapsedtime), t.label))
+        for label, count in sorted(self._watch.counters.items()):
+            stream.write('%s: %d\n' % (label, count))
     
     
 
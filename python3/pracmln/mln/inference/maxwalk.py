@@ -25,12 +25,13 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import random
-from collections import defaultdict
 
+import numpy
 from dnutils import ProgressBar
 
+from .clausekb import ClauseKB
 from .mcmc import MCMCInference
-from ..constants import HARD, ALL
+from ..constants import ALL
 from ..grounding.fastconj import FastConjunctionGrounding
 from ...logic.common import Logic
 
@@ -38,6 +39,10 @@ from ...logic.common import Logic
 class SAMaxWalkSAT(MCMCInference):
     """
     A MaxWalkSAT MPE solver using simulated annealing.
+    
+    The ground formulas are compiled into a :class:`mln.inference.clausekb.ClauseKB`,
+    such that the cost of a move is computed by a vectorized evaluation of
+    the ground formulas in the Markov blanket of the modified variable.
     """
     
     
@@ -47,8 +52,6 @@ class SAMaxWalkSAT(MCMCInference):
             self.state = self.random_world(self.mrf.evidence)
         else:
             self.state = state
-        self.sum = 0
-        self.var2gf = defaultdict(set)
         self.weights = list(self.mrf.mln.weights)
         formulas = []
         for f in self.mrf.formulas:
@@ -56,12 +59,15 @@ class SAMaxWalkSAT(MCMCInference):
                 f_ = self.mrf.mln.logic.negate(f)
                 f_.weight = - f.weight
                 formulas.append(f_.nnf())
+            else:
+                formulas.append(f)
         grounder = FastConjunctionGrounding(mrf, formulas=formulas, simplify=True, unsatfailure=True)
-        for gf in grounder.itergroundings():
-            if isinstance(gf, Logic.TrueFalse): continue
-            vars_ = set([self.mrf.variable(a).idx for a in gf.gndatoms()])
-            for v in vars_: self.var2gf[v].add(gf)
-            self.sum += (self.hardw if gf.weight == HARD else gf.weight) * (1 - gf(self.state))
+        self.kb = ClauseKB(self.mrf, [gf for gf in grounder.itergroundings() if not isinstance(gf, Logic.TrueFalse)])
+        self._costs = numpy.where(self.kb.hard, self.hardw, self.kb.weights)
+        self._world = numpy.array(self.state, dtype=numpy.float64)
+        self.sum = float(numpy.sum(self._costs * (1 - self.kb.truth(self._world))))
+        # variable index -> (sub-KB of the ground formulas containing the variable, costs)
+        self._blankets = {}
         
         
     @property
@@ -79,35 +85,40 @@ class SAMaxWalkSAT(MCMCInference):
         return self._params.get('maxsteps', 500)
     
     
+    def _blanket(self, var):
+        blanket = self._blankets.get(var.idx)
+        if blanket is None:
+            gfs = self.kb.atomgfs([a.idx for a in var.gndatoms])
+            blanket = (self.kb.select(gfs), self._costs[gfs])
+            self._blankets[var.idx] = blanket
+        return blanket
+    
+    
     def _run(self):
         i = 0 
         i_max = self.maxsteps
         thr = self.thr
+        world = self._world
+        evidence = self.mrf.evidence_dicti()
+        values = dict([(v.idx, list(v.values(evidence))) for v in self.mrf.variables])
+        variables = [v for v in self.mrf.variables if len(values[v.idx]) > 1]
         if self.verbose:
             bar = ProgressBar(steps=i_max, color='green')
-        while i < i_max and self.sum > self.thr:
+        while variables and i < i_max and self.sum > self.thr:
             # randomly choose a variable to modify
-            var = self.mrf.variables[random.randint(0, len(self.mrf.variables)-1)]
-            evdict = var.value2dict(var.evidence_value(self.mrf.evidence))
-            valuecount = var.valuecount(evdict) 
-            if valuecount == 1: # this is evidence 
-                continue
+            var = variables[random.randint(0, len(variables)-1)]
+            kb, costs = self._blanket(var)
             # compute the sum of relevant gf weights before the modification
-            sum_before = 0
-            for gf in self.var2gf[var.idx]:
-                sum_before += (self.hardw if gf.weight == HARD else gf.weight) * (1 - gf(self.state)) 
+            sum_before = numpy.sum(costs * (1 - kb.truth(world)))
             # modify the state
-            validx = random.randint(0, valuecount - 1)
-            value = [v for _, v in var.itervalues(evdict)][validx]
-            oldstate = list(self.state)
-            var.setval(value, self.state)
+            value = values[var.idx][random.randint(0, len(values[var.idx]) - 1)]
+            oldvalue = var.evidence_value(world)
+            var.setval(value, world)
             # compute the sum after the modification
-            sum_after = 0
-            for gf in self.var2gf[var.idx]:
-                sum_after += (self.hardw if gf.weight == HARD else gf.weight) * (1 - gf(self.state))
+            sum_after = numpy.sum(costs * (1 - kb.truth(world)))
             # determine whether to keep the new state            
             keep = False
-            improvement = sum_after - sum_before
+            improvement = float(sum_after - sum_before)
             if improvement < 0 or sum_after <= thr: 
                 prob = 1.0
                 keep = True
@@ -117,7 +128,7 @@ class SAMaxWalkSAT(MCMCInference):
 #                 keep = False # !!! no annealing
             # apply new objective value
             if keep: self.sum += improvement
-            else: self.state = oldstate
+            else: var.setval(oldvalue, world)
             # next iteration
             i += 1
             if self.verbose:
@@ -125,5 +136,6 @@ class SAMaxWalkSAT(MCMCInference):
                 bar.inc()
         if self.verbose:
             print("SAMaxWalkSAT: %d iterations, sum=%f, threshold=%f" % (i, self.sum, self.thr))
+        self.state = world.tolist()
         self.mrf.mln.weights = self.weights
         return dict([(str(q), self.state[q.gndatom.idx]) for q in self.queries])
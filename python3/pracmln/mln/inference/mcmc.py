@@ -24,25 +24,132 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import random
+from math import sqrt
+from multiprocessing import Pool
 
-
-from dnutils import logs
+import numpy
+from dnutils import logs, ProgressBar
 
 from .infer import Inference
 from ..util import fstr
 from ..constants import ALL
+from ...utils.multicore import with_tracing
 
 
 logger = logs.getlogger(__name__)
 
+# chains are considered to agree if the potential scale reduction is below this value
+MAX_RHAT = 1.1
+# upper bound for the autocorrelation in the effective sample size estimates
+MAX_AUTOCORR = .999
+
+# this readonly global is for multiprocessing to exploit copy-on-write
+# on linux systems
+global_mcmc = None
+
+
+# multiprocessing function
+def run_chain(args):
+    """
+    Advances a Markov chain of the global inference by `steps` steps with
+    random number streams seeded by `seed`. A new chain is created if
+    `chain` is `None`.
+    """
+    chain, steps, seed = args
+    random.seed(seed)
+    numpy.random.seed(seed)
+    if chain is None:
+        chain = global_mcmc._newchain()
+    else:
+        chain.infer = global_mcmc
+        chain.queries = global_mcmc.queries
+    for _ in range(steps):
+        global_mcmc._step(chain)
+    return chain
+
 
 class MCMCInference(Inference):
     """
     Abstract super class for Markov chain Monte Carlo-based inference.
+    
+    Subclasses implement `_newchain()` and `_step()`, and run their chains
+    by `_runchains()`. If `multicore` is set and more than one chain is
+    requested, the chains are run in parallel in a process pool, each with
+    its own random number streams derived from `rndseed`.
+    
+    If a `tolerance` is given, sampling stops as soon as the standard
+    error of every query estimate is below the tolerance (and, for multiple
+    chains, the chains agree), but not before `minsteps` steps. The stopping
+    rule is checked every `checkinterval` steps over all chains, also if the
+    chains run in parallel. A query whose samples do not vary at all is only
+    considered converged if there are multiple chains, which all agree on it,
+    since a single chain may just be stuck in one state.
     """
     
     def __init__(self, mrf, queries=ALL, **params):
         Inference.__init__(self, mrf, queries, **params)
+        if self.checkinterval < 1:
+            raise Exception('checkinterval must be at least 1: %s' % self.checkinterval)
+        if self.tolerance is not None and not self.tolerance > 0:
+            raise Exception('tolerance must be positive: %s' % self.tolerance)
+        self._rhat = None
+        self._stderr = None
+        self._steps = 0
+    
+    
+    @property
+    def chains(self):
+        return self._params.get('chains', 1)
+    
+    
+    @property
+    def maxsteps(self):
+        return self._params.get('maxsteps', 500)
+    
+    
+    @property
+    def rndseed(self):
+        return self._params.get('rndseed', None)
+    
+    
+    @property
+    def tolerance(self):
+        return self._params.get('tolerance', None)
+    
+    
+    @property
+    def minsteps(self):
+        return self._params.get('minsteps', 100)
+    
+    
+    @property
+    def checkinterval(self):
+        return self._params.get('checkinterval', 50)
+    
+    
+    @property
+    def steps(self):
+        """
+        The number of steps the chains of the last run actually took.
+        """
+        return self._steps
+    
+    
+    @property
+    def stderr(self):
+        """
+        The Monte Carlo standard errors of the query estimates of the last run.
+        """
+        return self._stderr
+    
+    
+    @property
+    def rhat(self):
+        """
+        The Gelman-Rubin potential scale reduction factors of the queries
+        over all chains of the last run. Values close to 1 indicate that the chains agree.
+        """
+        return self._rhat
         
 
     def random_world(self, evidence=None):
@@ -62,6 +169,117 @@ class MCMCInference(Inference):
                 value = [v for _, v in var.itervalues(evdict)][validx]
                 var.setval(value, world)
         return world
+    
+    
+    def _newchain(self):
+        """
+        Creates a new chain in its initial state.
+        """
+        raise Exception('%s does not implement _newchain()' % self.__class__.__name__)
+    
+    
+    def _step(self, chain):
+        """
+        Advances the given chain by one step.
+        """
+        raise Exception('%s does not implement _step()' % self.__class__.__name__)
+    
+    
+    def _converged(self, chaingroup, step):
+        """
+        Checks the stopping rule after the given step, i.e. whether the
+        standard errors of all queries have dropped below `tolerance`.
+        """
+        if self.tolerance is None or step < self.minsteps or step % self.checkinterval:
+            return False
+        stderr = chaingroup.stderr()
+        if any([e > self.tolerance for e in stderr.values()]):
+            return False
+        # a vanishing standard error is only trusted if several chains agree on it
+        if len(chaingroup.chains) < 2 and any([e == 0 for e in stderr.values()]):
+            return False
+        if len(chaingroup.chains) > 1 and any([not r <= MAX_RHAT for r in chaingroup.rhat().values()]):
+            return False
+        return True
+    
+    
+    def _runchains(self):
+        """
+        Creates and runs the chains for `maxsteps` steps.
+        
+        :returns:    the :class:`MCMCInference.ChainGroup` of the chains.
+        """
+        chaingroup = MCMCInference.ChainGroup(self)
+        if self.multicore and self.chains > 1:
+            self._runchains_parallel(chaingroup)
+        else:
+            if self.rndseed is not None:
+                random.seed(self.rndseed)
+                numpy.random.seed(self.rndseed)
+            for _ in range(self.chains):
+                chaingroup.chain(self._newchain())
+            if self.verbose:
+                bar = ProgressBar(steps=self.maxsteps, color='green')
+            for step in range(1, self.maxsteps + 1):
+                # take one step in each chain
+                for chain in chaingroup.chains:
+                    self._step(chain)
+                if self.verbose:
+                    bar.inc()
+                    bar.label('%d / %d' % (step, self.maxsteps))
+                if self._converged(chaingroup, step):
+                    if self.verbose:
+                        bar.finish()
+                    break
+        self._steps = max([chain.steps for chain in chaingroup.chains])
+        self._stderr = chaingroup.stderr()
+        self._rhat = chaingroup.rhat()
+        logger.debug('MCMC stopped after %d of %d steps' % (self._steps, self.maxsteps))
+        if self.verbose:
+            print('%d chain(s) stopped after %d of %d steps, max. standard error=%.4f' % (len(chaingroup.chains), self._steps, self.maxsteps,
+                                                                                      max(list(self._stderr.values()) + [0.])))
+            if len(chaingroup.chains) > 1:
+                print('R-hat over %d chains: max=%.4f' % (len(chaingroup.chains), max(list(self._rhat.values()) + [1.])))
+        return chaingroup
+    
+    
+    def _runchains_parallel(self, chaingroup):
+        global global_mcmc
+        global_mcmc = self
+        # independent random number streams for every chain
+        seeds = numpy.random.SeedSequence(self.rndseed).spawn(self.chains)
+        # the chains are advanced in rounds, after which the stopping rule is checked
+        interval = self.maxsteps if self.tolerance is None else self.checkinterval
+        if self.verbose:
+            bar = ProgressBar(steps=self.maxsteps, color='green')
+        pool = Pool()
+        logger.debug('Running %d chains on %d core(s)...' % (self.chains, pool._processes))
+        try:
+            chains = [None] * self.chains
+            step = 0
+            while step < self.maxsteps:
+                steps = min(interval - step % interval, self.maxsteps - step)
+                args = [(chain, steps, int(seed.spawn(1)[0].generate_state(1)[0])) for chain, seed in zip(chains, seeds)]
+                chains = pool.map(with_tracing(run_chain), args)
+                step += steps
+                for chain in chains:
+                    chain.infer = self
+                    chain.queries = self.queries
+                chaingroup.chains = chains
+                if self.verbose:
+                    bar.update(step / float(self.maxsteps))
+                    bar.label('%d / %d' % (step, self.maxsteps))
+                if self._converged(chaingroup, step):
+                    if self.verbose:
+                        bar.finish()
+                    break
+        except Exception as e:
+            logger.error('Error in child process. Terminating pool...')
+            pool.close()
+            raise e
+        finally:
+            pool.terminate()
+            pool.join()
                 
 
     class Chain:
@@ -75,8 +293,9 @@ class MCMCInference(Inference):
             self.soft_evidence = None
             self.steps = 0
             self.truths = [0] * len(self.queries)
-            self.converged = False
-            self.lastresult = 10
+            self.sqtruths = [0] * len(self.queries)
+            self.lagtruths = [0] * len(self.queries)
+            self.lasttruths = None
             self.infer = infer
             # copy the current  evidence as this chain's state
             # initialize remaining variables randomly (but consistently with the evidence)
@@ -86,16 +305,14 @@ class MCMCInference(Inference):
         def update(self, state):
             self.steps += 1
             self.state = state
-            # keep track of counts for queries
-            for i, q in enumerate(self.queries):
-                self.truths[i] += q(self.state)
-            # check if converged !!! TODO check for all queries
-            if self.steps % 50 == 0:
-                result = self.results()[0]
-                diff = abs(result - self.lastresult)
-                if diff < 0.001:
-                    self.converged = True
-                self.lastresult = result
+            # keep track of counts for queries, their squares and lag-1 products
+            truths = [q(self.state) for q in self.queries]
+            for i, truth in enumerate(truths):
+                self.truths[i] += truth
+                self.sqtruths[i] += truth * truth
+                if self.lasttruths is not None:
+                    self.lagtruths[i] += truth * self.lasttruths[i]
+            self.lasttruths = truths
             # keep track of counts for soft evidence
             if self.soft_evidence is not None:
                 for se in self.soft_evidence:
@@ -113,6 +330,14 @@ class MCMCInference(Inference):
                 self.softev_counts[se["expr"]] = se["formula"](self.state)
         
         
+        def __getstate__(self):
+            # the inference and the queries are not sent between processes
+            state = dict(self.__dict__)
+            state['infer'] = None
+            state['queries'] = None
+            return state
+        
+        
         def soft_evidence_frequency(self, formula):
             if self.steps == 0: return 0
             return float(self.softev_counts[fstr(formula)]) / self.steps
@@ -123,6 +348,25 @@ class MCMCInference(Inference):
             for i in range(len(self.queries)):
                 results.append(float(self.truths[i]) / self.steps)
             return results
+        
+        
+        def ess(self):
+            """
+            Estimates the effective sample size of every query from the lag-1
+            autocorrelation of its samples, assuming a first-order autoregressive process.
+            """
+            n = self.steps
+            ess = []
+            for i in range(len(self.queries)):
+                mean = float(self.truths[i]) / n
+                var = float(self.sqtruths[i]) / n - mean ** 2
+                if n < 2 or var <= 0:
+                    ess.append(float(n))
+                    continue
+                rho = (float(self.lagtruths[i]) / (n - 1) - mean ** 2) / var
+                rho = min(max(rho, 0.), MAX_AUTOCORR)
+                ess.append(n * (1. - rho) / (1. + rho))
+            return ess
     
             
     class ChainGroup:
@@ -139,12 +383,12 @@ class MCMCInference(Inference):
         def results(self):
             chains = float(len(self.chains))
             queries = self.chains[0].queries
-            # compute average
+            # merge the counts of all chains
+            steps = sum([chain.steps for chain in self.chains])
             results = [0.0] * len(queries)
             for chain in self.chains:
-                cr = chain.results()
                 for i in range(len(queries)):
-                    results[i] += cr[i] / chains
+                    results[i] += float(chain.truths[i]) / steps
             # compute variance
             var = [0.0 for i in range(len(queries))]
             for chain in self.chains:
@@ -154,6 +398,46 @@ class MCMCInference(Inference):
             return dict([(str(q), p) for q, p in zip(queries, results)]), var
         
         
+        def stderr(self):
+            """
+            Computes the Monte Carlo standard error of every query estimate
+            over all chains based on their effective sample sizes.
+            """
+            queries = self.chains[0].queries
+            steps = sum([chain.steps for chain in self.chains])
+            ess = [chain.ess() for chain in self.chains]
+            stderr = {}
+            for i, q in enumerate(queries):
+                mean = sum([float(c.truths[i]) for c in self.chains]) / steps
+                var = sum([float(c.sqtruths[i]) for c in self.chains]) / steps - mean ** 2
+                stderr[str(q)] = sqrt(max(var, 0.) / sum([e[i] for e in ess]))
+            return stderr
+        
+        
+        def rhat(self):
+            """
+            Computes the Gelman-Rubin potential scale reduction factor
+            for every query from the within-chain and between-chain variances.
+            """
+            queries = self.chains[0].queries
+            rhat = {}
+            m = len(self.chains)
+            for i, q in enumerate(queries):
+                n = min([chain.steps for chain in self.chains])
+                if m < 2 or n < 2:
+                    rhat[str(q)] = float('nan')
+                    continue
+                means = [float(c.truths[i]) / c.steps for c in self.chains]
+                variances = [(float(c.sqtruths[i]) / c.steps - mean ** 2) * c.steps / (c.steps - 1) for c, mean in zip(self.chains, means)]
+                W = sum(variances) / m
+                B_n = sum([(mean - sum(means) / m) ** 2 for mean in means]) / (m - 1)
+                if W <= 0:
+                    rhat[str(q)] = 1. if B_n <= 0 else float('inf')
+                    continue
+                rhat[str(q)] = sqrt(((n - 1.) / n * W + B_n) / W)
+            return rhat
+        
+        
         def avgtruth(self, formula):
             """ returns the fraction of chains in which the given formula is currently true """
             t = 0.0 
@@ -28,8 +28,10 @@ import math
 import random
 from collections import defaultdict
 
-from dnutils import logs, ProgressBar, out
+import numpy
+from dnutils import logs, out
 
+from .clausekb import ClauseKB
 from .mcmc import MCMCInference
 from ..constants import ALL, HARD
 from ..grounding.fastconj import FastConjunctionGrounding
@@ -72,55 +74,25 @@ class MCSAT(MCMCInference):
 #             f.weight  = min(w_stdev, f.weight)
         grounder = FastConjunctionGrounding(self.mrf, formulas=self.formulas, simplify=True, verbose=self.verbose)
         self.gndformulas = []
+        self.nlcs = [] # non-logical ground constraints
         for gf in grounder.itergroundings():
             if isinstance(gf, Logic.TrueFalse): continue
-            self.gndformulas.append(gf.cnf())
+            if gf.islogical():
+                self.gndformulas.append(gf.cnf())
+            else:
+                self.nlcs.append(gf)
         self._watch.tags.update(grounder.watch.tags)
+        self._watch.counters.update(grounder.watch.counters)
 #         self.gndformulas, self.formulas = Logic.cnf(grounder.itergroundings(), self.mln.formulas, self.mln.logic, allpos=True)
-        # get clause data
-        logger.debug("gathering clause data...")
-        self.gf2clauseidx = {} # ground formula index -> tuple (idxFirstClause, idxLastClause+1) for use with range
-        self.clauses = [] # list of clauses, where each entry is a list of ground literals
-        #self.GAoccurrences = {} # ground atom index -> list of clause indices (into self.clauses)
-        i_clause = 0
-        # process all ground formulas
-        for i_gf, gf in enumerate(self.gndformulas):
-            # get the list of clauses
-            if isinstance(gf, Logic.Conjunction):
-                clauses = [clause for clause in gf.children if not isinstance(clause, Logic.TrueFalse)]
-            elif not isinstance(gf, Logic.TrueFalse):
-                clauses = [gf]
-            else: continue
-            self.gf2clauseidx[i_gf] = (i_clause, i_clause + len(clauses))
-            # process each clause
-            for c in clauses:
-                if hasattr(c, "children"):
-                    lits = c.children
-                else: # unit clause
-                    lits = [c]
-                # add clause to list
-                self.clauses.append(lits)
-                # next clause index
-                i_clause += 1
-        # add clauses for soft evidence atoms
-        for se in []:#self.softEvidence:
-            se["numTrue"] = 0.0
-            formula = self.mln.logic.parseFormula(se["expr"])
-            se["formula"] = formula.ground(self.mrf, {})
-            cnf = formula.toCNF().ground(self.mrf, {}) 
-            idxFirst = i_clause
-            for clause in self._formulaClauses(cnf):                
-                self.clauses.append(clause)
-                #print clause
-                i_clause += 1
-            se["idxClausePositive"] = (idxFirst, i_clause)
-            cnf = self.mln.logic.negation([formula]).toCNF().ground(self.mrf, {})
-            idxFirst = i_clause
-            for clause in self._formulaClauses(cnf):                
-                self.clauses.append(clause)
-                #print clause
-                i_clause += 1
-            se["idxClauseNegative"] = (idxFirst, i_clause)
+        # compile the clauses into flat arrays
+        logger.debug("compiling clauses...")
+        self.kb = ClauseKB(self.mrf, self.gndformulas)
+        self.gndformulas = self.kb.gndformulas
+        # indices of the clauses of the hard formulas
+        self._hardclauses = numpy.nonzero(self.kb.hard[self.kb.clause2gf])[0]
+        # probabilities of keeping a satisfied ground formula in M
+        with numpy.errstate(over='ignore'):
+            self._keepprobs = 1. - numpy.exp(-self.kb.weights)
             
             
     def _formula_clauses(self, f):
@@ -137,14 +109,6 @@ class MCSAT(MCMCInference):
                 yield [c]
                 
     
-    @property
-    def chains(self):
-        return self._params.get('chains', 1)
-    
-    @property
-    def maxsteps(self):
-        return self._params.get('maxsteps', 500)
-    
     @property
     def softevidence(self):
         return self._params.get('softevidence', False)
@@ -165,18 +129,19 @@ class MCSAT(MCMCInference):
     def historyfile(self):
         return self._params.get('historyfile', None)
     
-    @property
-    def rndseed(self):
-        return self._params.get('rndseed', None)
-    
     @property
     def initalgo(self):
         return self._params.get('initalgo', 'SampleSAT')
     
+    @property
+    def samplesat_maxsteps(self):
+        return self._params.get('samplesat_maxsteps', 10000)
+    
     
     def _run(self):
         """
         p: probability of a greedy (WalkSAT) move
+        samplesat_maxsteps: maximal number of SampleSAT moves per MC-SAT step. If no state satisfying the selected clauses is found within this budget, the chain keeps its current state
         initAlgo: algorithm to use in order to find an initial state that satisfies all hard constraints ("SampleSAT" or "SAMaxWalkSat")
         verbose: whether to display results upon completion
         details: whether to display information while the algorithm is running            
@@ -198,71 +163,57 @@ class MCSAT(MCMCInference):
         logger.debug("CNF KB:")
         for gf in self.gndformulas:
             logger.debug("%7.3f  %s" % (gf.weight, str(gf)))
-        print()
-        # set the random seed if it was given
-        if self.rndseed is not None:
-            random.seed(self.rndseed)
-        # create chains
-        chaingroup = MCMCInference.ChainGroup(self)
-        self.chaingroup = chaingroup
-        for i in range(self.chains):
-            chain = MCMCInference.Chain(self, self.queries)
-            chaingroup.chain(chain)
-            # satisfy hard constraints using initialization algorithm
-            M = []
-            NLC = []
-            for i, gf in enumerate(self.gndformulas):
-                if gf.weight == HARD:
-                    if gf.islogical():
-                        clause_range = self.gf2clauseidx[i]
-                        M.extend(list(range(*clause_range)))
-                    else:
-                        NLC.append(gf)
-            if M or NLC:
-                logger.debug('Running SampleSAT')
-                chain.state = SampleSAT(self.mrf, chain.state, M, NLC, self, p=self.p).run() # Note: can't use p=1.0 because there is a chance of getting into an oscillating state
-        if logger.level == logs.DEBUG:
-            self.mrf.print_world_vars(chain.state)
-        self.step = 1        
-        logger.debug('running MC-SAT with %d chains' % len(chaingroup.chains))
+        if self.verbose: print()
+        logger.debug('running MC-SAT with %d chains' % self.chains)
         self._watch.tag('running MC-SAT', self.verbose)
-        if self.verbose:
-            bar = ProgressBar(steps=self.maxsteps, color='green')
-        while self.step <= self.maxsteps:
-            # take one step in each chain
-            for chain in chaingroup.chains:
-                # choose a subset of the satisfied formulas and sample a state that satisfies them
-                state = self._satisfy_subset(chain)
-                # update chain counts
-                chain.update(state)
-            if self.verbose:
-                bar.inc()
-                bar.label('%d / %d' % (self.step, self.maxsteps))
-            # intermediate results
-            self.step += 1
+        chaingroup = self._runchains()
+        self.chaingroup = chaingroup
+        self.step = self.steps
         # get results
-        self.step -= 1
         results = chaingroup.results()
         return results[0]
     
     
+    def _newchain(self):
+        chain = MCMCInference.Chain(self, self.queries)
+        # satisfy hard constraints using initialization algorithm
+        M = self._hardclauses
+        NLC = [gf for gf in self.nlcs if gf.weight == HARD]
+        if len(M) or NLC:
+            logger.debug('Running SampleSAT')
+            sampler = SampleSAT(self.mrf, chain.state, M, NLC, self, p=self.p, maxsteps=self.samplesat_maxsteps)
+            chain.state = sampler.run() # Note: can't use p=1.0 because there is a chance of getting into an oscillating state
+            if not sampler.solved:
+                logger.warning('SampleSAT could not satisfy all hard constraints within %d steps (%d clauses remain unsatisfied).' % (self.samplesat_maxsteps, len(sampler.unsatisfied)))
+        if logger.level == logs.DEBUG:
+            self.mrf.print_world_vars(chain.state)
+        return chain
+    
+    
+    def _step(self, chain):
+        # choose a subset of the satisfied formulas and sample a state that satisfies them
+        state = self._satisfy_subset(chain)
+        # update chain counts
+        chain.update(state)
+    
+    
     def _satisfy_subset(self, chain):
         """
         Choose a set of logical formulas M to be satisfied (more specifically, M is a set of clause indices)
         and also choose a set of non-logical constraints NLC to satisfy
         """
-        M = []
+        world = numpy.array(chain.state, dtype=numpy.float64)
+        # keep the satisfied and the hard formulas with probability 1 - exp(-w)
+        candidates = (self.kb.truth(world) == 1) | self.kb.hard
+        keep = candidates & (numpy.random.random(len(self.kb)) < self._keepprobs)
+        M = numpy.nonzero(keep[self.kb.clause2gf])[0]
         NLC = []
-        for gfidx, gf in enumerate(self.gndformulas):
+        for gf in self.nlcs:
             if gf(chain.state) == 1 or gf.ishard:
                 expweight = math.exp(gf.weight)
                 u = random.uniform(0, expweight)
                 if u > 1:
-                    if gf.islogical():
-                        clause_range = self.gf2clauseidx[gfidx]
-                        M.extend(list(range(*clause_range)))
-                    else:
-                        NLC.append(gf)
+                    NLC.append(gf)
         # add soft evidence constraints
         if False:# self.softevidence:
             for se in self.softevidence:
@@ -289,7 +240,13 @@ class MCSAT(MCMCInference):
                         M.extend(list(range(*se["idxClauseNegative"])))
                     #print "negative case: add=%s, %s, %f should become %f" % (add, map(str, [map(str, self.clauses[i]) for i in range(*se["idxClauseNegative"])]), p, se["p"])
         # (uniformly) sample a state that satisfies them
-        return SampleSAT(self.mrf, chain.state, M, NLC, self, p=self.p).run()
+        sampler = SampleSAT(self.mrf, chain.state, M, NLC, self, p=self.p, maxsteps=self.samplesat_maxsteps)
+        state = sampler.run()
+        # if no satisfying state could be found within the step budget,
+        # the chain remains in its current state, which satisfies M by construction
+        if not sampler.solved:
+            return chain.state
+        return state
     
     
     def _prob_constraints_deviation(self):
@@ -321,29 +278,41 @@ class MCSAT(MCMCInference):
 class SampleSAT:
     """
     Sample-SAT algorithm.
+    
+    Mixes greedy WalkSAT moves with simulated annealing moves in order to
+    (near-)uniformly sample a state satisfying the given set of clauses. 
+    The set of currently unsatisfied clauses is kept in an index that
+    supports insertion, removal and random selection in O(1), and the
+    bottleneck information of the clauses is updated incrementally after
+    every flip, so the cost of a move only depends on the number of clauses
+    the flipped variable appears in.
     """
     
-    def __init__(self, mrf, state, clause_indices, nlcs, infer, p=1):
+    def __init__(self, mrf, state, clause_indices, nlcs, infer, p=1, maxsteps=None):
         """
         clause_indices: list of indices of clauses to satisfy
         p: probability of performing a greedy WalkSAT move
         state: the state (array of booleans) to work with (is reinitialized randomly by this constructor)
         NLConstraints: list of grounded non-logical constraints
+        maxsteps: the maximal number of moves before giving up (None means no limit)
         """
         self.debug = logger.level == logs.DEBUG
         self.infer = infer
         self.mrf = mrf
         self.mln = mrf.mln        
         self.p = p
+        self.maxsteps = maxsteps
+        self.steps = 0
         # initialize the state randomly (considering the evidence) and obtain block info
         self.blockInfo = {}
         self.state = self.infer.random_world()
 #         out(self.state, '(initial state)')
         self.init = list(state)
-        # these are the variables we need to consider for SampleSAT
-#         self.variables = [v for v in self.mrf.variables if v.valuecount(self.mrf.evidence) > 1]
+        self._evidence = mrf.evidence_dicti()
+        # admissible values of the variables wrt. the evidence (computed lazily)
+        self._varvalues = {}
         # list of unsatisfied constraints
-        self.unsatisfied = set()
+        self.unsatisfied = SampleSAT._ClauseIndex()
         # keep a map of bottlenecks: index of the ground atom -> list of constraints where the corresponding lit is a bottleneck
         self.bottlenecks = defaultdict(list) # bottlenecks are clauses with exactly one true literal
         # ground atom occurrences in constraints: ground atom index -> list of constraints
@@ -351,13 +320,15 @@ class SampleSAT:
         self.clauses = {}
         # instantiate clauses        
         for cidx in clause_indices:  
-            clause = SampleSAT._Clause(self.infer.clauses[cidx], self.state, cidx, self.mrf)
+            clause = SampleSAT._Clause(self.infer.kb.clause(cidx), self.state, cidx, self.mrf)
             self.clauses[cidx] = clause
             if clause.unsatisfied: 
                 self.unsatisfied.add(cidx)
             for v in clause.variables():
                 self.var2clauses[v].add(clause)
 #             stop('clause', 'v'.join(map(str, self.infer.clauses[cidx])), 'is', 'unsatisfied' if clause.unsatisfied else 'satisfied')
+        # these are the variables we need to consider for simulated annealing moves
+        self.variables = [v for v in self.var2clauses if len(self._values(v)) > 1]
         # instantiate non-logical constraints
         for nlc in nlcs:
             if isinstance(nlc, Logic.GroundCountConstraint): # count constraint
@@ -370,8 +341,54 @@ class SampleSAT:
         out("   %d unsatisfied:  %s" % (len(self.unsatisfied), list(map(str, [self.clauses[i] for i in self.unsatisfied]))), tb=2)
     
     
+    def _values(self, var):
+        """
+        Returns the list of values the variable `var` may take given the evidence.
+        """
+        values = self._varvalues.get(var)
+        if values is None:
+            values = list(var.values(self._evidence))
+            self._varvalues[var] = values
+        return values
+    
+    
+    @property
+    def solved(self):
+        """
+        Whether or not the current state satisfies all clauses.
+        """
+        return not self.unsatisfied
+    
+    
     def run(self):
-        # sampling by enumerating all worlds
+        """
+        Performs WalkSAT and simulated annealing moves until all clauses are
+        satisfied or the step budget `maxsteps` is exhausted. 
+        
+        :returns:    the current state. Check `solved` in order to find out if
+                     all clauses are satisfied by it.
+        """
+        while self.unsatisfied:
+            if self.maxsteps is not None and self.steps >= self.maxsteps:
+                logger.debug('SampleSAT: step budget of %d exhausted with %d unsatisfied clauses' % (self.maxsteps, len(self.unsatisfied)))
+                break
+            self.steps += 1
+            # make a WalkSat move or a simulated annealing move
+            if random.uniform(0, 1) <= self.p or not self.variables:
+                self._walksat_move()
+            else:
+                self._sa_move()
+        return self.state
+    
+    
+    def enumerate(self):
+        """
+        Samples a state uniformly from the set of satisfying states by enumerating
+        all possible worlds.
+        
+        .. warning:: this takes time exponential in the number of open variables
+                     and is only meant as a reference for very small problems.
+        """
         worlds = []
         for world in self.mrf.worlds():
             skip = False
@@ -383,15 +400,6 @@ class SampleSAT:
             worlds.append(world)
         state = worlds[random.randint(0, len(worlds)-1)]
         return state
-        steps = 0
-        while self.unsatisfied:
-            steps += 1
-            # make a WalkSat move or a simulated annealing move
-            if random.uniform(0, 1) <= self.p:
-                self._walksat_move()
-            else:
-                self._sa_move()
-        return self.state
     
     
     def _walksat_move(self):
@@ -399,14 +407,14 @@ class SampleSAT:
         Randomly pick one of the unsatisfied constraints and satisfy it
         (or at least make one step towards satisfying it
         """
-        clauseidx = list(self.unsatisfied)[random.randint(0, len(self.unsatisfied) - 1)]
+        clauseidx = self.unsatisfied.choice()
         # get the literal that makes the fewest other formulas false
         clause = self.clauses[clauseidx]
         varval_opt = []
         opt = None
         for var in clause.variables():
             bottleneck_clauses = [cl for cl in self.var2clauses[var] if cl.bottleneck is not None]
-            for _, value in var.itervalues(self.mrf.evidence_dicti()):
+            for value in self._values(var):
                 if not clause.turns_true_with(var, value): continue
                 unsat = 0
                 for c in bottleneck_clauses:
@@ -435,22 +443,16 @@ class SampleSAT:
         for c in self.var2clauses[var]:
             satisfied, _ = c.update(var, val)
             if satisfied:
-                if c.cidx in self.unsatisfied: self.unsatisfied.remove(c.cidx)
+                self.unsatisfied.discard(c.cidx)
             else:
                 self.unsatisfied.add(c.cidx)
                
                
     def _sa_move(self):
         # randomly pick a variable and flip its value
-        variables = list(set(self.var2clauses))
-        random.shuffle(variables)
-        var = variables[0]
-        ev = var.evidence_value()
-        values = var.valuecount(self.mrf.evidence)
-        for _, v in var.itervalues(self.mrf.evidence): break
-        if values == 1:
-            raise Exception('Only one remaining value for variable %s: %s. Please check your evidences.' % (var, v))
-        values = [v for _, v in var.itervalues(self.mrf.evidence) if v != ev]
+        var = self.variables[random.randint(0, len(self.variables) - 1)]
+        ev = var.evidence_value(self.state)
+        values = [v for v in self._values(var) if v != ev]
         val = values[random.randint(0, len(values)-1)]
         unsat = 0
         bottleneck_clauses = [c for c in self.var2clauses[var] if c.bottleneck is not None]
@@ -473,22 +475,70 @@ class SampleSAT:
             self._setvar(var, val)
         
     
+    class _ClauseIndex(object):
+        """
+        A set of clause indices supporting insertion, removal and uniform 
+        random selection in constant time.
+        """
+        
+        def __init__(self):
+            self._items = []
+            self._pos = {}
+            
+        
+        def add(self, cidx):
+            if cidx in self._pos: return
+            self._pos[cidx] = len(self._items)
+            self._items.append(cidx)
+            
+        
+        def discard(self, cidx):
+            pos = self._pos.pop(cidx, None)
+            if pos is None: return
+            last = self._items.pop()
+            if pos < len(self._items):
+                # move the last element into the gap
+                self._items[pos] = last
+                self._pos[last] = pos
+                
+        
+        def choice(self):
+            return self._items[random.randint(0, len(self._items) - 1)]
+        
+        
+        def __contains__(self, cidx):
+            return cidx in self._pos
+        
+        
+        def __len__(self):
+            return len(self._items)
+        
+        
+        def __iter__(self):
+            return iter(list(self._items))
+        
+    
     class _Clause(object):
         
         def __init__(self, lits, world, idx, mrf):
+            """
+            :param lits:    the literals of the clause given by signed ground atom indices
+                            as in :class:`mln.inference.clausekb.ClauseKB`.
+            """
             self.cidx = idx
             self.world = world
             self.bottleneck = None
             self.mrf = mrf
+            self._variables = None
             # check all the literals
             self.lits = lits
             self.truelits = set()
-            self.atomidx2lits = defaultdict(set)
+            self.atomidx2lits = {}
             for lit in lits:
-                if isinstance(lit, Logic.TrueFalse): continue
-                atomidx = lit.gndatom.idx
-                self.atomidx2lits[atomidx].add(0 if lit.negated else 1)
-                if lit(world) == 1:
+                atomidx = abs(lit) - 1
+                truth = 1 if lit > 0 else 0
+                self.atomidx2lits.setdefault(atomidx, set()).add(truth)
+                if world[atomidx] == truth:
                     self.truelits.add(atomidx)
             if len(self.truelits) == 1 and self._isbottleneck(item(self.truelits)):
                 self.bottleneck = item(self.truelits)
@@ -497,10 +547,8 @@ class SampleSAT:
         def _isbottleneck(self, atomidx):
             atomidx2lits = self.atomidx2lits
             if len(self.truelits) != 1 or atomidx not in self.truelits: return False
-            if len(atomidx2lits[atomidx]) == 1: return True
-            fst = item(atomidx2lits[atomidx])
-            if all([x == fst for x in atomidx2lits[atomidx]]): return False # the atom appears with different polarity in the clause, this is not a bottleneck
-            return True
+            # if the atom appears with different polarity in the clause, this is not a bottleneck
+            return len(atomidx2lits[atomidx]) == 1
         
         
         def turns_false_with(self, var, val):
@@ -508,9 +556,14 @@ class SampleSAT:
             Returns whether or not this clause would become false if the given variable would take
             the given value. Returns False if the clause is already False.
             """
+            if self.bottleneck is None: return False
+            turnsfalse = False
             for a, v in var.atomvalues(val):
-                if a.idx == self.bottleneck and v not in self.atomidx2lits[a.idx]: return True
-            return False
+                lits = self.atomidx2lits.get(a.idx)
+                if lits is None: continue
+                if v in lits: return False # another atom of the variable keeps the clause true
+                if a.idx == self.bottleneck: turnsfalse = True
+            return turnsfalse
         
         
         def turns_true_with(self, var, val):
@@ -518,8 +571,9 @@ class SampleSAT:
             Returns true if this clause will be rendered true by the given variable taking
             its given value.
             """
+            if not self.unsatisfied: return False
             for a, v in var.atomvalues(val):
-                if self.unsatisfied and v in self.atomidx2lits[a.idx]: return True
+                if v in self.atomidx2lits.get(a.idx, ()): return True
             return False
             
         
@@ -528,8 +582,10 @@ class SampleSAT:
             Updates the clause information with the given variable and value set in a SampleSAT state.
             """
             for a, v in var.atomvalues(val):
-                if v not in self.atomidx2lits[a.idx]:
-                    if a.idx in self.truelits: self.truelits.remove(a.idx)
+                lits = self.atomidx2lits.get(a.idx)
+                if lits is None: continue
+                if v not in lits:
+                    self.truelits.discard(a.idx)
                 else: self.truelits.add(a.idx)
             if len(self.truelits) == 1 and self._isbottleneck(item(self.truelits)):
                 self.bottleneck = item(self.truelits)
@@ -539,7 +595,7 @@ class SampleSAT:
                 
         
         def satisfied_in_world(self, world):
-            return self.mrf.mln.logic.disjugate(self.lits)(world) == 1
+            return any([world[abs(lit) - 1] == (1 if lit > 0 else 0) for lit in self.lits])
         
         @property
         def unsatisfied(self):
@@ -551,13 +607,18 @@ class SampleSAT:
         
         
         def variables(self):
-            return [self.mrf.variable(self.mrf.gndatom(a)) for a in self.atomidx2lits]
+            if self._variables is None:
+                self._variables = []
+                for a in self.atomidx2lits:
+                    var = self.mrf.variable(self.mrf.gndatom(a))
+                    if var not in self._variables: self._variables.append(var)
+            return self._variables
         
         def greedySatisfy(self):
-            self.ss._pickAndFlipLiteral([x.gndAtom.idx for x in self.lits], self)
+            self.ss._pickAndFlipLiteral([abs(x) - 1 for x in self.lits], self)
         
         def __str__(self):
-            return ' v '.join(map(str, self.lits))
+            return ' v '.join(['%s%s' % ('!' if lit < 0 else '', str(self.mrf.gndatom(abs(lit) - 1))) for lit in self.lits])
         
                 
     class _CountConstraint:
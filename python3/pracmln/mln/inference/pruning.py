@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Markov Logic Networks -- Query-relevant Subnetwork Extraction
+#
+# (C) 2012-2015 by Daniel Nyga
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+from collections import defaultdict
+
+from dnutils import logs
+
+from ..constants import HARD
+from ..database import Database
+from ..grounding.fastconj import FastConjunctionGrounding
+from ..mrf import MRF
+from ...logic.common import Logic
+
+
+logger = logs.getlogger(__name__)
+
+
+class QuerySubnetwork(object):
+    """
+    Extracts the part of an MRF that is relevant for answering a set of queries.
+
+    The formulas are grounded and simplified with respect to the evidence,
+    such that ground formulas whose truth is fixed by the evidence drop out.
+    The remaining ground formulas connect the variables of the MRF; the
+    variables connected to the query atoms, i.e. the Markov blanket closure
+    of the queries given the evidence, make up the relevant subnetwork. All
+    other variables are independent of the queries and are pruned.
+
+    The subnetwork is represented by a new MLN, whose formulas are the
+    relevant ground formulas, and its MRF, which contains the ground atoms of
+    the relevant variables only, so it can be passed to any inference method.
+
+    :param mrf:        the MRF to be pruned.
+    :param queries:    the list of ground query formulas of the MRF.
+
+    :member mrf:       the MRF of the relevant subnetwork.
+    :member queries:   the queries grounded in the MRF of the subnetwork, in the
+                       order of the original queries.
+    """
+
+    def __init__(self, mrf, queries):
+        self.original = mrf
+        grounder = FastConjunctionGrounding(mrf, simplify=True, unsatfailure=True, cache=0)
+        gndformulas = [gf for gf in grounder.itergroundings() if not isinstance(gf, Logic.TrueFalse)]
+        self.total_formulas = grounder.total_gf
+        # the variables connected by the non-constant ground formulas
+        neighbors = defaultdict(set)
+        gfvars = []
+        for gf in gndformulas:
+            variables = set([mrf.variable(mrf.gndatom(a)).idx for a in gf.gndatom_indices()])
+            gfvars.append(variables)
+            for v in variables:
+                neighbors[v].update(variables)
+        # the Markov blanket closure of the query variables
+        relevant = set()
+        for q in queries:
+            relevant.update([mrf.variable(mrf.gndatom(a)).idx for a in q.gndatom_indices()])
+        frontier = list(relevant)
+        while frontier:
+            v = frontier.pop()
+            for n in neighbors[v]:
+                if n not in relevant:
+                    relevant.add(n)
+                    frontier.append(n)
+        gndformulas = [gf for gf, variables in zip(gndformulas, gfvars) if variables & relevant]
+        variables = [v for v in mrf.variables if v.idx in relevant]
+        self.formulas = len(gndformulas)
+        self.atoms = sum([len(v.gndatoms) for v in variables])
+        self.mrf, self.queries = self._build(variables, gndformulas, queries)
+        logger.debug('pruned %d of %d ground atoms and %d of %d ground formulas' % (self.pruned_atoms, len(mrf.gndatoms),
+                                                                                      self.pruned_formulas, self.total_formulas))
+
+
+    @property
+    def pruned_atoms(self):
+        return len(self.original.gndatoms) - self.atoms
+
+
+    @property
+    def pruned_formulas(self):
+        return self.total_formulas - self.formulas
+
+
+    def _build(self, variables, gndformulas, queries):
+        mln = self.original.mln
+        mln_ = mln.copy()
+        mln_._rmformulas()
+        mln_._probreqs = []
+        # the domains comprise the constants of the relevant atoms only
+        mln_.domains = dict([(d, []) for d in mln_.domains])
+        for variable in variables:
+            for atom in variable.gndatoms:
+                for dom, arg in zip(mln.predicate(atom.predname).argdoms, atom.args):
+                    mln_.constant(dom, arg)
+        for gf in gndformulas:
+            mln_.formula(self._detach(gf, mln_), weight=HARD if gf.weight == HARD else float(gf.weight))
+        mln_._materialized = True
+        db = Database(mln_)
+        mrf = MRF(mln_, db)
+        evidence = {}
+        for variable in variables:
+            for atom in variable.gndatoms:
+                mrf.gndatom(atom.predname, *atom.args)
+                truth = self.original.evidence[atom.idx]
+                if truth is not None:
+                    evidence[str(atom)] = truth
+        mrf.set_evidence(evidence, erase=False)
+        queries_ = [self._detach(q, mln_).ground(mrf, {}) for q in queries]
+        return mrf, queries_
+
+
+    def _detach(self, f, mln):
+        """
+        Converts a ground formula of the original MRF into an equivalent
+        variable-free formula of the given MLN.
+        """
+        if isinstance(f, Logic.GroundLit):
+            return mln.logic.lit(f.negated, f.gndatom.predname, list(f.gndatom.args), mln=mln)
+        elif isinstance(f, Logic.TrueFalse):
+            return mln.logic.true_false(f.value, mln=mln)
+        elif isinstance(f, Logic.Equality):
+            return mln.logic.equality(list(f.args), f.negated, mln=mln)
+        elif hasattr(f, 'children'):
+            return mln.logic.create(type(f), [self._detach(c, mln) for c in f.children], mln=mln)
+        raise Exception('Unexpected formula type %s: %s' % (type(f).__name__, f))
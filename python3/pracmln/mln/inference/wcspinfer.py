@@ -22,6 +22,7 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 from collections import defaultdict
 
+import numpy
 from dnutils import logs
 
 from .infer import Inference
@@ -30,8 +31,9 @@ from ..errors import SatisfiabilityException, MRFValueException
 from ..grounding.fastconj import FastConjunctionGrounding
 from ..mrfvars import FuzzyVariable
 from ..util import (combinations, dict_union, Interval, temporary_evidence)
-from ...wcsp import Constraint, WCSP
+from ...wcsp import Constraint, WCSP, solver
 from ...logic.common import Logic
+from ...logic.fol import FirstOrderLogic
 
 
 logger = logs.getlogger(__name__)
@@ -43,6 +45,11 @@ class WCSPInference(Inference):
         Inference.__init__(self, mrf, queries, **params)
 
 
+    @property
+    def engine(self):
+        return self._params.get('engine')
+
+
     def _run(self):
         result_ = {}
         with temporary_evidence(self.mrf):
@@ -59,7 +66,7 @@ class WCSPInference(Inference):
         Returns a Database object with the most probable truth assignment.
         """
         wcsp = self.converter.convert()
-        solution, _ = wcsp.solve()
+        solution, _ = wcsp.solve(backend=solver(self.engine))
         if solution is None:
             raise Exception('MLN is unsatisfiable.')
         result = {}
@@ -70,16 +77,60 @@ class WCSPInference(Inference):
 
 
 
+def truthtable(formula, world, columns):
+    """
+    Evaluates a ground formula of first-order logic in a matrix of
+    crisp worlds at once.
+    
+    :param world:      a matrix holding the truth values of the ground atoms of a world in every row.
+    :param columns:    dict mapping the indices of the ground atoms to their columns in `world`.
+    :returns:          the vector of truth values of the formula in the worlds, or `None` if the
+                       formula contains constructs that cannot be evaluated this way.
+    """
+    if isinstance(formula, Logic.GroundLit):
+        truth = world[:, columns[formula.gndatom.idx]]
+        return 1 - truth if formula.negated else truth
+    if isinstance(formula, Logic.GroundAtom):
+        return world[:, columns[formula.idx]]
+    if isinstance(formula, Logic.TrueFalse):
+        return numpy.full(len(world), formula.value, dtype=numpy.float64)
+    if not isinstance(formula, (Logic.Negation, Logic.Conjunction, Logic.Disjunction, Logic.Implication, Logic.Biimplication)):
+        return None
+    children = [truthtable(c, world, columns) for c in formula.children]
+    if any([c is None for c in children]):
+        return None
+    if isinstance(formula, Logic.Negation):
+        return 1 - children[0]
+    if isinstance(formula, Logic.Conjunction):
+        return numpy.minimum.reduce(children)
+    if isinstance(formula, Logic.Disjunction):
+        return numpy.maximum.reduce(children)
+    if isinstance(formula, Logic.Implication):
+        return numpy.maximum(1 - children[0], children[1])
+    return (children[0] == children[1]).astype(numpy.float64)
+
+
 class WCSPConverter(object):
     """
     Class for converting an MLN into a WCSP problem for efficient
     MPE inference.
+    
+    The costs of all constraints with at most `TABLE_MAX` tuples are summed up in
+    dense cost tables, one per scope, which are turned into constraints with
+    default costs at the end of the conversion.
     """
     
+    # maximal number of tuples of a constraint that is represented by a dense cost table
+    TABLE_MAX = 4096
+    
+    # number of combinations of variable values that are evaluated at once
+    BATCHSIZE = 65536
+    
     
     def __init__(self, mrf, verbose=False, multicore=False):
         self.mrf = mrf
         self.constraints = {} # mapping the signature of a constaint to its constraint object
+        self.tables = {} # mapping a sorted scope to its dense cost table
         self.verbose = verbose
         self._createvars()
         self.wcsp = WCSP()
@@ -97,18 +148,21 @@ class WCSPConverter(object):
         self.atom2var = {} # maps ground atom indices to their variable index
         self.val2idx = defaultdict(dict)
         varidx = 0
+        evidence = self.mrf.evidence_dicti()
         for variable in self.mrf.variables:
             if isinstance(variable, FuzzyVariable): # fuzzy variables are not subject to reasoning
                 continue
-            if variable.valuecount(self.mrf.evidence_dicti()) == 1: # the var is fully determined by the evidence
-                for _, value in variable.itervalues(self.mrf.evidence_dicti()):
+            if variable.valuecount(evidence) == 1: # the var is fully determined by the evidence
+                for _, value in variable.itervalues(evidence):
                     break
-                self.mrf.set_evidence(variable.value2dict(value), erase=False)
+                value = variable.value2dict(value)
+                self.mrf.set_evidence(value, erase=False)
+                evidence.update(value)
                 continue
             self.variables[varidx] = variable
             for gndatom in variable.gndatoms:
                 self.atom2var[gndatom.idx] = varidx
-            for validx, (_, value) in enumerate(variable.itervalues(self.mrf.evidence_dicti())):
+            for validx, (_, value) in enumerate(variable.itervalues(evidence)):
                 self.domains[varidx].append(value)
                 self.val2idx[varidx][value] = validx
             varidx += 1
@@ -119,6 +173,7 @@ class WCSPConverter(object):
         """
         # mln to be restored after inference
         self._weights = list(self.mrf.mln.weights)
+        self.tables = {}
         mln = self.mrf.mln
         logic = mln.logic
         # preprocess the formulas
@@ -140,6 +195,9 @@ class WCSPConverter(object):
                 else:# formula is rendered true/false by the evidence -> equal in every possible world 
                     continue
             self.generate_constraint(gf)
+        for scope, table in self.tables.items():
+            self.wcsp.constraint(self._table2constraint(scope, table))
+        self.tables = {}
         self.mrf.mln.weights = self._weights
         return self.wcsp
 
@@ -160,6 +218,12 @@ class WCSPConverter(object):
         cost2assignments = self._gather_constraint_tuples(varindices, wf)
         if cost2assignments is None:
             return
+        if isinstance(cost2assignments, numpy.ndarray):
+            self._add_table(varindices, cost2assignments)
+            return
+        if numpy.prod([len(self.domains[v]) for v in varindices]) <= WCSPConverter.TABLE_MAX:
+            self._add_table(varindices, self._tuples2table(varindices, cost2assignments))
+            return
         defcost = max(cost2assignments, key=lambda x: infty if cost2assignments[x] == 'else' else len(cost2assignments[x]))
         del cost2assignments[defcost] # remove the default cost values
         
@@ -176,7 +240,9 @@ class WCSPConverter(object):
         given by a formula. In case of disjunctions and conjunctions,
         this is fairly efficient since not all combinations
         need to be evaluated. Returns a dictionary mapping the constraint
-        costs to the list of respective variable assignments.
+        costs to the list of respective variable assignments, or the dense
+        cost table (see :meth:`_cost_table`) if all combinations of values 
+        have to be evaluated.
         """
         logic = self.mrf.mln.logic
         # we can treat conjunctions and disjunctions fairly efficiently
@@ -251,45 +317,111 @@ class WCSPConverter(object):
                     raise MRFValueException('Illegal variable assignments. Variables: %s, Assignment: %s' % (varindices, assignment))
                 return {cost: [tuple(assignment)], defcost: 'else'}
         if defaultProcedure: 
-            # fallback: go through all combinations of truth assignments
-            domains = [self.domains[v] for v in varindices]
-            cost2assignments = defaultdict(list)
-            # compute number of worlds to be examined and print a warning
-            worlds = 1
-            for d in domains: worlds *= len(d)
-            if worlds > 1000000:
-                logger.warning('!!! WARNING: %d POSSIBLE WORLDS ARE GOING TO BE EVALUATED. KEEP IN SIGHT YOUR MEMORY CONSUMPTION !!!' % worlds)
-            for c in combinations(domains):
-                world = [0] * len(self.mrf.gndatoms)
-                assignment = []
-                for varidx, value in zip(varindices, c):
-                    world = self.variables[varidx].setval(value, world)
-                    assignment.append(self.val2idx[varidx][value])
-                # the MRF feature imposed by this formula 
-                truth = formula(world)
-                if truth is None:
-                    print('POSSIBLE WORLD:')
-                    print('===============')
-                    self.mrf.print_world_vars(world)
-                    print('GROUND FORMULA:')
-                    print('===============')
-                    formula.print_structure(world)
-                    raise Exception('Something went wrong: Truth of ground formula cannot be evaluated (see above)')
-                
-                if truth in Interval(']0,1[') and formula.weight == HARD:
-                    raise MRFValueException('No fuzzy truth values are allowed in hard constraints.')
-                if formula.weight == HARD:
-                    if truth == 1:
-                        cost = 0
-                    else:
-                        cost = self.wcsp.top
-                else:
-                    cost = ((1 - truth) * formula.weight)
-                cost2assignments[cost].append(tuple(assignment))
-            return cost2assignments
+            # fallback: evaluate all combinations of values
+            return self._cost_table(varindices, formula)
         assert False # unreachable
         
         
+    def _cost_table(self, varindices, formula):
+        """
+        Evaluates the formula in all combinations of values of the given variables.
+        
+        :returns:    an array with one axis per variable, holding the costs of the 
+                     respective combination of value indices, where `inf` stands
+                     for a violated hard constraint.
+        """
+        domains = [self.domains[v] for v in varindices]
+        shape = tuple([len(d) for d in domains])
+        worlds = int(numpy.prod(shape))
+        if worlds > 1000000:
+            logger.warning('!!! WARNING: %d POSSIBLE WORLDS ARE GOING TO BE EVALUATED. KEEP IN SIGHT YOUR MEMORY CONSUMPTION !!!' % worlds)
+        truth = None
+        if isinstance(self.mrf.mln.logic, FirstOrderLogic):
+            atoms = [a.idx for v in varindices for a in self.variables[v].gndatoms]
+            columns = dict([(a, i) for i, a in enumerate(atoms)])
+            values = [numpy.array(d, dtype=numpy.float64) for d in domains]
+            truth = numpy.empty(worlds, dtype=numpy.float64)
+            for start in range(0, worlds, WCSPConverter.BATCHSIZE):
+                idx = numpy.arange(start, min(start + WCSPConverter.BATCHSIZE, worlds))
+                # the value indices of the variables are the digits of the combination index
+                world = numpy.hstack([values_[digits] for values_, digits in zip(values, numpy.unravel_index(idx, shape))])
+                truth_ = truthtable(formula, world, columns)
+                if truth_ is None:
+                    truth = None
+                    break
+                truth[start:start + len(idx)] = truth_
+        if truth is None:
+            truth = numpy.array([self._truth(varindices, formula, c) for c in combinations(domains)], dtype=numpy.float64)
+        if formula.weight == HARD:
+            if numpy.any((truth > 0) & (truth < 1)):
+                raise MRFValueException('No fuzzy truth values are allowed in hard constraints.')
+            costs = numpy.where(truth == 1, 0., numpy.inf)
+        else:
+            costs = (1 - truth) * formula.weight
+        return costs.reshape(shape)
+    
+    
+    def _truth(self, varindices, formula, values):
+        """
+        Evaluates the formula in the world given by the values of the variables.
+        """
+        world = [0] * len(self.mrf.gndatoms)
+        for varidx, value in zip(varindices, values):
+            world = self.variables[varidx].setval(value, world)
+        truth = formula(world)
+        if truth is None:
+            print('POSSIBLE WORLD:')
+            print('===============')
+            self.mrf.print_world_vars(world)
+            print('GROUND FORMULA:')
+            print('===============')
+            formula.print_structure(world)
+            raise Exception('Something went wrong: Truth of ground formula cannot be evaluated (see above)')
+        return truth
+    
+    
+    def _tuples2table(self, varindices, cost2assignments):
+        """
+        Turns the tuples collected by :meth:`_gather_constraint_tuples` into a dense cost table.
+        """
+        table = None
+        for cost, tuples in cost2assignments.items():
+            cost = numpy.inf if cost == self.wcsp.top else cost
+            if tuples == 'else':
+                table = numpy.full([len(self.domains[v]) for v in varindices], cost, dtype=numpy.float64)
+        for cost, tuples in cost2assignments.items():
+            if tuples == 'else': continue
+            for t in tuples:
+                table[t] = numpy.inf if cost == self.wcsp.top else cost
+        return table
+    
+    
+    def _add_table(self, varindices, table):
+        """
+        Adds the cost table over the given variables to the table of its scope.
+        """
+        scope = tuple(sorted(varindices))
+        table = numpy.transpose(table, [varindices.index(v) for v in scope])
+        if scope in self.tables:
+            self.tables[scope] = self.tables[scope] + table
+        else:
+            self.tables[scope] = table
+    
+    
+    def _table2constraint(self, scope, table):
+        """
+        Creates a constraint from a dense cost table, whose default costs are 
+        the costs of the majority of the tuples.
+        """
+        costs, counts = numpy.unique(table, return_counts=True)
+        defcost = costs[numpy.argmax(counts)]
+        tuples = numpy.argwhere(table != defcost)
+        top = self.wcsp.top
+        constraint = Constraint(scope, defcost=top if defcost == numpy.inf else float(defcost))
+        constraint.tuples = dict(zip(map(tuple, tuples.tolist()), [top if c == numpy.inf else c for c in table[tuple(tuples.T)].tolist()]))
+        return constraint
+        
+        
     def forbid_gndatom(self, atom, truth=True):
         """
         Adds a unary constraint that prohibits the given ground atom
@@ -26,9 +26,8 @@
 from dnutils import logs
 from dnutils.console import barstr
 
-from collections import defaultdict
-
 import numpy
+from scipy import sparse
 from dnutils import logs, out
 from dnutils.console import barstr
 from numpy.ma.core import sqrt, log
@@ -37,11 +36,43 @@ from ..constants import HARD
 from ..errors import SatisfiabilityException
 from ..grounding.bpll import BPLLGroundingFactory
 from ..grounding.default import DefaultGroundingFactory
-from .common import DiscriminativeLearner, AbstractLearner
-from ..util import fsum, temporary_evidence
+from .common import DiscriminativeLearner, AbstractLearner, segment_softmax
+from .counting import ConstantGroups, itergroundings_with, itervaluetruths
+from ...utils.multicore import with_tracing
+from multiprocessing import Pool
 
 logger = logs.getlogger(__name__)
 
+# this readonly global is for multiprocessing to exploit copy-on-write
+# on linux systems
+global_bpll = None
+
+
+def formula_statistics(fidx):
+    '''
+    Computes the sufficient statistic of the formula with index `fidx`.
+    The values of the variables are set in a private copy of the evidence.
+    If the learner is lifted, only the groundings containing a representative
+    variable are instantiated.
+    
+    :returns:    a triple of the formula index, and the arrays of the row indices
+                 of the variable values in the statistics matrix and their counts.
+    '''
+    mrf = global_bpll.mrf
+    offsets = global_bpll._valoffsets
+    formula = mrf.formulas[fidx]
+    if global_bpll._reps is None:
+        grounder = DefaultGroundingFactory(mrf, formulas=[formula], simplify=False, unsatfailure=True, cache=0)
+        gndformulas = grounder.itergroundings()
+    else:
+        gndformulas = itergroundings_with(mrf, formula, global_bpll._repatoms, unsatfailure=True)
+    rows = []
+    data = []
+    for var, validx, truth in itervaluetruths(mrf, gndformulas, global_bpll._reps):
+        rows.append(offsets[var.idx] + validx)
+        data.append(truth)
+    return fidx, numpy.array(rows, dtype=numpy.int64), numpy.array(data, dtype=numpy.float64)
+
 
 class BPLL(AbstractLearner):
     '''
@@ -51,140 +82,217 @@ class BPLL(AbstractLearner):
     value from the same block.
     This learner is fairly efficient, as it computes f and grad based only
     on a sufficient statistic.
+    
+    The statistic is compiled into a sparse (variable-value x formula) matrix 
+    of the truth values of the formulas, in which the values of variable `i` 
+    are the rows ``_valoffsets[i]:_valoffsets[i+1]``. The pseudo-likelihoods and
+    the gradient are thus given by sparse matrix-vector products followed by
+    a log-sum-exp over the segments of the variables.
+    
+    If `lifted` is `True`, the variables are partitioned into orbits of 
+    interchangeable constants (see :class:`mln.learning.counting.ConstantGroups`), 
+    whose statistics are identical. Only the statistics of a representative
+    variable of every orbit are counted, which are weighted with the size
+    of the orbit. The pseudo-likelihoods of all other variables are undefined.
     '''
+
+    STATISTICS = ('_statmat', '_hardmat', '_valcounts', '_valoffsets', '_evrows', '_multiplicity',
+                  '_evidence', '_rowweights', '_reps')
     
     def __init__(self, mrf, **params):
         AbstractLearner.__init__(self, mrf, **params)
         self._pls = None
-        self._stat = None
-        self._varidx2fidx = None
+        self._statmat = None
         self._lastw = None
+        self._reps = None
+        
+    @property
+    def lifted(self):
+        return self._params.get('lifted', False)
         
     def _prepare(self):
         logger.debug("computing statistics...") 
         self._compute_statistics()
 #         print self._stat
+
+    @property
+    def _stat(self):
+        '''
+        Compatibility view of the sufficient statistic as a dict mapping formula indices
+        to dicts mapping variable indices to the list of counts of every value.
+        '''
+        if self._statmat is None: return None
+        stat = {}
+        mat = self._statmat.tocsc()
+        for fidx in range(mat.shape[1]):
+            rows = mat.indices[mat.indptr[fidx]:mat.indptr[fidx + 1]]
+            if not len(rows): continue
+            d = stat[fidx] = {}
+            for row, n in zip(rows, mat.data[mat.indptr[fidx]:mat.indptr[fidx + 1]]):
+                varidx = int(numpy.searchsorted(self._valoffsets, row, side='right')) - 1
+                if varidx not in d:
+                    d[varidx] = [0] * int(self._valcounts[varidx])
+                d[varidx][row - self._valoffsets[varidx]] = n
+        return stat
+
+    def _init_values(self):
+        '''
+        Computes the offsets of the values of the variables in the statistics matrix.
+        '''
+        self._valcounts = numpy.array([var.valuecount() for var in self.mrf.variables], dtype=numpy.int64)
+        self._valoffsets = numpy.zeros(len(self._valcounts) + 1, dtype=numpy.int64)
+        numpy.cumsum(self._valcounts, out=self._valoffsets[1:])
+        self._evrows = self._valoffsets[:-1] + numpy.array([var.evidence_value_index() for var in self.mrf.variables], dtype=numpy.int64)
+        self._multiplicity = numpy.ones(len(self._valcounts))
+
+    def _compile_statistics(self, stat):
+        '''
+        Compiles the sufficient statistic given as a dict of the form of :attr:`_stat`
+        into the sparse statistics matrix.
+        '''
+        self._init_values()
+        rows, cols, data = [], [], []
+        for fidx, varval in stat.items():
+            for varidx, counts in varval.items():
+                offset = self._valoffsets[varidx]
+                for validx, n in enumerate(counts):
+                    if n != 0:
+                        rows.append(offset + validx)
+                        cols.append(fidx)
+                        data.append(n)
+        self._build_statistics(numpy.array(rows, dtype=numpy.int64), numpy.array(cols, dtype=numpy.int64), 
+                               numpy.array(data, dtype=numpy.float64))
+
+    def _build_statistics(self, rows, cols, data):
+        '''
+        Builds the sparse statistics matrix from the coordinates and the (partial) counts
+        of its entries, whose duplicates are summed up.
+        '''
+        shape = (int(self._valoffsets[-1]), len(self.mrf.formulas))
+        self._statmat = sparse.csr_matrix((data, (rows, cols)), shape=shape)
+        # the values of the variables violating a hard formula they appear in
+        csc = self._statmat.tocsc()
+        hrows, hcols = [], []
+        for f in self.mrf.formulas:
+            if f.weight != HARD: continue
+            nonzero = csc.indices[csc.indptr[f.idx]:csc.indptr[f.idx + 1]]
+            varidx = numpy.unique(numpy.searchsorted(self._valoffsets, nonzero, side='right') - 1)
+            counts = self._valcounts[varidx]
+            values = numpy.repeat(self._valoffsets[varidx] - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+            values = numpy.setdiff1d(values, nonzero)
+            hrows.append(values)
+            hcols.append(numpy.full(len(values), f.idx))
+        hrows = numpy.concatenate(hrows + [numpy.zeros(0, dtype=numpy.int64)])
+        hcols = numpy.concatenate(hcols + [numpy.zeros(0, dtype=numpy.int64)])
+        self._hardmat = sparse.csr_matrix((numpy.ones(len(hrows)), (hrows, hcols)), shape=shape)
+        self._evidence = numpy.zeros(shape[0])
+        self._evidence[self._evrows] = 1
+        self._rowweights = numpy.repeat(self._multiplicity, self._valcounts)
+        self._pls = None
     
+    def _compute_pls(self, w):
+        '''
+        Computes the pseudo-likelihoods of all values of all variables under weights w. 
+        '''
+        w = numpy.array(w, dtype=numpy.float64)
+        if self._pls is not None and self._lastw is not None and numpy.array_equal(self._lastw, w):
+            return
+        hard = w == HARD
+        sums = self._statmat.dot(numpy.where(hard, 0, w))
+        # the prob mass of every value violating a hard constraint is 0
+        if hard.any():
+            sums[self._hardmat.dot(hard.astype(numpy.float64)) > 0] = -numpy.inf
+        self._pls, empty = segment_softmax(sums, self._valoffsets)
+        if len(empty):
+            raise SatisfiabilityException('MLN is unsatisfiable: all probability masses of variable %s are zero.' % str(self.mrf.variable(int(empty[0]))))
+        self._lastw = w
+
     def _pl(self, varidx, w):
         '''
         Computes the pseudo-likelihoods for the given variable under weights w. 
         '''
-        var = self.mrf.variable(varidx)
-        values = var.valuecount()
-        gfs = self._varidx2fidx.get(varidx)
-        if gfs is None: # no list was saved, so the truth of all formulas is unaffected by the variable's value
-            # uniform distribution applies
-            p = 1.0 / values
-            return [p] * values
-        sums = [0] * values#numpy.zeros(values)
-        for fidx in gfs:
-            for validx, n in enumerate(self._stat[fidx][varidx]):
-                if w[fidx] == HARD: 
-                    # set the prob mass of every value violating a hard constraint to None
-                    # to indicate a globally inadmissible value. We will set those ones to 0 afterwards.
-                    if n == 0: sums[validx] = None
-                elif sums[validx] is not None:
-                    # don't set it if this value has already been assigned marked as inadmissible.
-                    sums[validx] += n * w[fidx]
-        expsums = [numpy.exp(s) if s is not None else 0 for s in sums]#numpy.exp(numpy.array(sums))
-        z = sum(expsums)
-        if z == 0: raise SatisfiabilityException('MLN is unsatisfiable: all probability masses of variable %s are zero.' % str(var))
-        return [w_ / z for w_ in expsums]
-#         sum_max = numpy.max(sums)
-#         sums -= sum_max
-#         expsums = numpy.sum(numpy.exp(sums))
-#         s = numpy.log(expsums)    
-#         return numpy.exp(sums - s)
+        self._compute_pls(w)
+        return list(self._pls[self._valoffsets[varidx]:self._valoffsets[varidx + 1]])
 
     def write_pls(self):
         for var in self.mrf.variables:
             print(repr(var))
             for i, value in var.itervalues():
-                print('    ', barstr(width=50, color='magenta', percent=self._pls[var.idx][i]) + ('*' if var.evidence_value_index() == i else ' '), i, value)
-
-    def _compute_pls(self, w):
-        if self._pls is None or self._lastw is None or self._lastw != list(w):
-            self._pls = [self._pl(var.idx, w) for var in self.mrf.variables]
-            self._lastw = list(w)
-#             self.write_pls()
+                print('    ', barstr(width=50, color='magenta', percent=self._pls[self._valoffsets[var.idx] + i]) + ('*' if var.evidence_value_index() == i else ' '), i, value)
     
     def _f(self, w):
         self._compute_pls(w)
-        probs = []
-        for var in self.mrf.variables:
-            p = self._pls[var.idx][var.evidence_value_index()]
-            if p == 0: p = 1e-10 # prevent 0 probabilities
-            probs.append(p)
-        return fsum(list(map(log, probs)))
+        probs = self._pls[self._evrows]
+        probs[probs == 0] = 1e-10 # prevent 0 probabilities
+        return float(numpy.sum(numpy.log(probs) * self._multiplicity))
 
     def _grad(self, w):
         self._compute_pls(w)
-        grad = numpy.zeros(len(self.mrf.formulas), numpy.float64)        
-        for fidx, varval in self._stat.items():
-            for varidx, counts in varval.items():
-                evidx = self.mrf.variable(varidx).evidence_value_index()
-                g = counts[evidx]
-                for i, val in enumerate(counts):
-                    g -= val * self._pls[varidx][i]
-                grad[fidx] += g
-        self.grad_opt_norm = sqrt(float(fsum([x * x for x in grad])))
-        return numpy.array(grad)
-
-    def _addstat(self, fidx, varidx, validx, inc=1):
-        if fidx not in self._stat:
-            self._stat[fidx] = {}
-        d = self._stat[fidx]
-        if varidx not in d:
-            d[varidx] = [0] * self.mrf.variable(varidx).valuecount()
-        d[varidx][validx] += inc
+        grad = self._statmat.T.dot((self._evidence - self._pls) * self._rowweights)
+        self.grad_opt_norm = sqrt(float(numpy.dot(grad, grad)))
+        return grad
         
     def _compute_statistics(self):
         '''
         computes the statistics upon which the optimization is based
         '''
-        self._stat = {}
-        self._varidx2fidx = defaultdict(set)
-        grounder = DefaultGroundingFactory(self.mrf, simplify=False, unsatfailure=True, verbose=self.verbose, cache=0)
-        for f in grounder.itergroundings():
-            for gndatom in f.gndatoms():
-                var = self.mrf.variable(gndatom)
-                with temporary_evidence(self.mrf):
-                    for validx, value in var.itervalues():
-                        var.setval(value, self.mrf.evidence)
-                        truth = f(self.mrf.evidence) 
-                        if truth != 0:
-                            self._varidx2fidx[var.idx].add(f.idx)
-                            self._addstat(f.idx, var.idx, validx, truth)
+        self._init_values()
+        self._reps = None
+        if self.lifted:
+            reps, multiplicity = ConstantGroups(self.mrf).orbits(self.mrf.variables)
+            logger.debug('counting the statistics of %d of %d variables' % (len(reps), len(self.mrf.variables)))
+            self._reps = set([var.idx for var in reps])
+            self._repatoms = [a for var in reps for a in var.gndatoms]
+            self._multiplicity = numpy.zeros(len(self._valcounts))
+            self._multiplicity[[var.idx for var in reps]] = multiplicity
+        global global_bpll
+        global_bpll = self
+        fidxs = [f.idx for f in self.mrf.formulas]
+        if self.multicore:
+            pool = Pool()
+            logger.debug('Using multiprocessing on {} core(s)...'.format(pool._processes))
+            try:
+                results = list(pool.imap(with_tracing(formula_statistics), fidxs))
+            except Exception as e:
+                logger.error('Error in child process. Terminating pool...')
+                pool.close()
+                raise e
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            results = list(map(formula_statistics, fidxs))
+        self._build_statistics(numpy.concatenate([rows for _, rows, _ in results] + [numpy.zeros(0, dtype=numpy.int64)]),
+                               numpy.concatenate([numpy.full(len(rows), fidx) for fidx, rows, _ in results] + [numpy.zeros(0, dtype=numpy.int64)]),
+                               numpy.concatenate([data for _, _, data in results] + [numpy.zeros(0)]))
                 
                 
 class DPLL(BPLL, DiscriminativeLearner):
     '''
     Discriminative pseudo-log-likelihood learning.
     '''
+    
+    def _qrows(self):
+        '''
+        Returns the indicator vector of the values of the query variables.
+        '''
+        if getattr(self, '_qrowmask', None) is None or len(self._qrowmask) != len(self._evidence):
+            qvars = numpy.array([var.predicate.name not in self.epreds for var in self.mrf.variables], dtype=numpy.float64)
+            self._qrowmask = numpy.repeat(qvars, self._valcounts)
+        return self._qrowmask
 
     def _f(self, w, **params):
         self._compute_pls(w)
-        probs = []
-        for var in self.mrf.variables:
-            if var.predicate.name in self.epreds: continue
-            p = self._pls[var.idx][var.evidence_value_index()]
-            if p == 0: p = 1e-10 # prevent 0 probabilities
-            probs.append(p)
-        return fsum(list(map(log, probs)))
+        rows = self._evrows[self._qrows()[self._evrows] > 0]
+        probs = self._pls[rows]
+        probs[probs == 0] = 1e-10 # prevent 0 probabilities
+        return float(numpy.sum(numpy.log(probs) * self._rowweights[rows]))
 
     def _grad(self, w, **params):        
         self._compute_pls(w)
-        grad = numpy.zeros(len(self.mrf.formulas), numpy.float64)        
-        for fidx, varval in self._stat.items():
-            for varidx, counts in varval.items():
-                if self.mrf.variable(varidx).predicate.name in self.epreds: continue
-                evidx = self.mrf.variable(varidx).evidence_value_index()
-                g = counts[evidx]
-                for i, val in enumerate(counts):
-                    g -= val * self._pls[varidx][i]
-                grad[fidx] += g
-        self.grad_opt_norm = sqrt(float(fsum([x * x for x in grad])))
-        return numpy.array(grad)
+        grad = self._statmat.T.dot((self._evidence - self._pls) * self._qrows() * self._rowweights)
+        self.grad_opt_norm = sqrt(float(numpy.dot(grad, grad)))
+        return grad
 
 
 class BPLL_CG(BPLL):
@@ -192,8 +300,7 @@ class BPLL_CG(BPLL):
     def _prepare(self):
         grounder = BPLLGroundingFactory(self.mrf, multicore=self.multicore, verbose=self.verbose)
         for _ in grounder.itergroundings(): pass
-        self._stat = grounder._stat
-        self._varidx2fidx = grounder._varidx2fidx
+        self._compile_statistics(grounder._stat)
         
 
 class DBPLL_CG(DPLL):
@@ -201,5 +308,4 @@ class DBPLL_CG(DPLL):
     def _prepare(self):
         grounder = BPLLGroundingFactory(self.mrf, multicore=self.multicore, verbose=self.verbose)
         for _ in grounder.itergroundings(): pass
-        self._stat = grounder._stat
-        self._varidx2fidx = grounder._varidx2fidx
+        self._compile_statistics(grounder._stat)
@@ -22,16 +22,19 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 from dnutils import logs
 
-from .common import AbstractLearner, DiscriminativeLearner
+from .common import AbstractLearner, DiscriminativeLearner, segment_softmax
+from .counting import ConstantGroups, itergroundings_with, itervaluetruths
 import random
 from collections import defaultdict
-from ..util import fsum, dict_union, temporary_evidence
+from ..util import dict_union, temporary_evidence
 from numpy.ma.core import log, sqrt
 import numpy
 from ...logic.common import Logic
 from ..constants import HARD
 from ..errors import SatisfiabilityException
 
+from scipy import sparse
+
 
 logger = logs.getlogger(__name__)
 
@@ -39,6 +42,17 @@ logger = logs.getlogger(__name__)
 class CLL(AbstractLearner):
     """
     Implementation of composite-log-likelihood learning.
+    
+    The statistic is compiled into a sparse (partition-value x formula) matrix
+    of the truth values of the formulas, in which the values of partition `i`
+    are the rows ``_valoffsets[i]:_valoffsets[i+1]``, such that the probabilities
+    of all partition values are computed by a single sparse matrix-vector
+    product and a log-sum-exp over the segments of the partitions.
+    
+    If `lifted` is `True` and the partitions consist of single variables, only 
+    the statistics of a representative variable of every orbit of interchangeable
+    constants are counted (see :class:`mln.learning.counting.ConstantGroups`),
+    which are weighted with the size of the orbit.
     """
     
     def __init__(self, mrf, **params):
@@ -55,6 +69,11 @@ class CLL(AbstractLearner):
     @property
     def maxiter(self):
         return self._params.get('maxiter', 10)
+
+
+    @property
+    def lifted(self):
+        return self._params.get('lifted', False)
     
                 
     @property
@@ -69,13 +88,19 @@ class CLL(AbstractLearner):
         self.partition2formulas = defaultdict(set)
         self.evidx = {}
         self.valuecounts = {}
-        self.partitionProbValues = {}
         self.current_wts = None
         self.iter = 0
-        self.probs = {}
+        self.probs = None
         self._stat = {}
         size = self.partsize
         variables = list(self.variables)
+        reps = None
+        if self.lifted:
+            if size > 1:
+                logger.warning('Lifted CLL requires partitions of size 1. Statistics will not be lifted.')
+            else:
+                reps, multiplicity = ConstantGroups(self.mrf).orbits(variables)
+                logger.debug('counting the statistics of %d of %d variables' % (len(reps), len(variables)))
         if size > 1:
             random.shuffle(variables)
         while len(variables) > 0:
@@ -91,7 +116,15 @@ class CLL(AbstractLearner):
             self.evidx[partidx] = partition.evidenceidx()
             variables = variables[len(partition.variables):]
         logger.debug('CLL created %d partitions' % len(self.partitions))
-        self._compute_statistics()
+        self._multiplicity = numpy.ones(len(self.partitions))
+        if reps is None:
+            self._compute_statistics()
+        else:
+            partitions = dict([(self.atomidx2partition[var.gndatoms[0].idx].idx, m) for var, m in zip(reps, multiplicity)])
+            self._multiplicity = numpy.zeros(len(self.partitions))
+            self._multiplicity[list(partitions)] = list(partitions.values())
+            self._compute_lifted_statistics(reps)
+        self._compile_statistics()
 
         
     def repeat(self):
@@ -125,6 +158,23 @@ class CLL(AbstractLearner):
             self._compute_stat_rec(literals, [], {}, formula, isconj=isconj)
     
     
+    def _compute_lifted_statistics(self, reps):
+        """
+        Computes the statistics of the partitions of the given representative variables
+        from the groundings they appear in.
+        """
+        self._stat = {}
+        self.partition2formulas = defaultdict(set)
+        partitions = dict([(var.idx, self.atomidx2partition[var.gndatoms[0].idx]) for var in reps])
+        atoms = [a for var in reps for a in var.gndatoms]
+        for formula in self.mrf.formulas:
+            gndformulas = itergroundings_with(self.mrf, formula, atoms)
+            for var, validx, truth in itervaluetruths(self.mrf, gndformulas, partitions, pervariable=True):
+                partition = partitions[var.idx]
+                self.partition2formulas[partition.idx].add(formula.idx)
+                self._addstat(formula.idx, partition.idx, validx, truth)
+    
+    
     def _compute_stat_rec(self, literals, gndliterals, var_assign, formula, f_gndlit_parts=None, processed=None, isconj=False):
         """
         TODO: make sure that there are no equality constraints in the conjunction!
@@ -229,59 +279,69 @@ class CLL(AbstractLearner):
             self._compute_stat_rec(literals[1:], gndliterals + [gndlit_], dict_union(var_assign, assign), formula, f_gndlit_parts, processed, isconj) 
     
 
+    def _compile_statistics(self):
+        """
+        Compiles the statistics into the sparse statistics matrix.
+        """
+        counts = numpy.array([self.valuecounts[p.idx] for p in self.partitions], dtype=numpy.int64)
+        self._valoffsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=self._valoffsets[1:])
+        self._evrows = self._valoffsets[:-1] + numpy.array([self.evidx[p.idx] for p in self.partitions], dtype=numpy.int64)
+        rows, cols, data = [], [], []
+        # values of the partitions violating a hard formula
+        hrows, hcols = [], []
+        for fidx, partitions in self._stat.items():
+            hard = self.mrf.mln.weights[fidx] == HARD
+            for pidx, values in partitions.items():
+                offset = self._valoffsets[pidx]
+                for validx, v in enumerate(values):
+                    if v != 0:
+                        rows.append(offset + validx)
+                        cols.append(fidx)
+                        data.append(v)
+                    elif hard:
+                        hrows.append(offset + validx)
+                        hcols.append(fidx)
+        shape = (int(self._valoffsets[-1]), len(self.mrf.formulas))
+        self._statmat = sparse.csr_matrix((numpy.array(data, dtype=numpy.float64), (rows, cols)), shape=shape)
+        self._hardmat = sparse.csr_matrix((numpy.ones(len(hrows)), (hrows, hcols)), shape=shape)
+        self._evidence = numpy.zeros(shape[0])
+        self._evidence[self._evrows] = 1
+        self._rowweights = numpy.repeat(self._multiplicity, counts)
+        
+    
     def _compute_probs(self, w):
-        probs = {}#numpy.zeros(len(self.partitions))
-        for pidx in range(len(self.partitions)):
-            expsums = [0] * self.valuecounts[pidx]
-            for fidx in self.partition2formulas[pidx]:
-                for i, v in enumerate(self._stat[fidx][pidx]):
-                    if w[fidx] == HARD:
-                        if v == 0: expsums[i] = None
-                    elif expsums[i] is not None:
-#                         out('adding', v, '*', w[fidx], 'to', i)
-                        expsums[i] += v * w[fidx]
-#                         stop(expsums)
-#             sum_max = numpy.max(sums)
-#             sums -= sum_max
-#             expsums = numpy.sum(numpy.exp(sums))
-#             s = numpy.log(expsums)
-#             probs[pidx] = numpy.exp(sums - s)
-#             out(w)
-            expsum = numpy.array([numpy.exp(s) if s is not None else 0 for s in expsums])# leave out the inadmissible values
-            z = fsum(expsum)
-            if z == 0: raise SatisfiabilityException('MLN is unsatisfiable: all probability masses of partition %s are zero.' % str(self.partitions[pidx]))
-            probs[pidx] = expsum / z
-            self.probs[pidx] = expsum
+        """
+        Computes the probabilities of all values of all partitions under weights w.
+        The result is memoized until the weights change.
+        """
+        w = numpy.array(w, dtype=numpy.float64)
+        if self.current_wts is not None and numpy.array_equal(self.current_wts, w):
+            return self.probs
+        hard = w == HARD
+        sums = self._statmat.dot(numpy.where(hard, 0, w))
+        # leave out the inadmissible values
+        if hard.any():
+            sums[self._hardmat.dot(hard.astype(numpy.float64)) > 0] = -numpy.inf
+        probs, empty = segment_softmax(sums, self._valoffsets)
+        if len(empty):
+            raise SatisfiabilityException('MLN is unsatisfiable: all probability masses of partition %s are zero.' % str(self.partitions[empty[0]]))
+        self.current_wts = w
         self.probs = probs
         return probs
         
 
     def _f(self, w):
-        if self.current_wts is None or list(w) != self.current_wts:
-            self.current_wts = list(w)
-            self.probs = self._compute_probs(w)
-        likelihood = numpy.zeros(len(self.partitions))
-        for pidx in range(len(self.partitions)):
-            p = self.probs[pidx][self.evidx[pidx]]
-            if p == 0: p = 1e-10
-            likelihood[pidx] += p
+        probs = self._compute_probs(w)[self._evrows]
+        probs[probs == 0] = 1e-10
         self.iter += 1
-        return fsum(list(map(log, likelihood)))
+        return float(numpy.sum(numpy.log(probs) * self._multiplicity))
             
             
     def _grad(self, w, **params):    
-        if self.current_wts is None or not list(w) != self.current_wts:
-            self.current_wts = w
-            self.probs = self._compute_probs(w)
-        grad = numpy.zeros(len(w))
-        for fidx, partitions in self._stat.items():
-            for part, values in partitions.items():
-                v = values[self.evidx[part]]
-                for i, val in enumerate(values):
-                    v -= self.probs[part][i] * val
-                grad[fidx] += v
-        self.grad_opt_norm = sqrt(float(fsum([x * x for x in grad])))
-        return numpy.array(grad)
+        grad = self._statmat.T.dot((self._evidence - self._compute_probs(w)) * self._rowweights)
+        self.grad_opt_norm = sqrt(float(numpy.dot(grad, grad)))
+        return grad
     
     
     class Partition(object):
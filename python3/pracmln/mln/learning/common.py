@@ -39,16 +39,40 @@ except:
 logger = logs.getlogger(__name__)
 
 
+def segment_softmax(logits, offsets):
+    '''
+    Normalizes the exponentials of the segments ``logits[offsets[i]:offsets[i+1]]``
+    of a vector by a log-sum-exp over every segment.
+    
+    :returns:    a pair of the vector of the normalized values and the indices of
+                 the segments whose logits are all ``-inf``.
+    '''
+    counts = numpy.diff(offsets)
+    maxlogits = numpy.maximum.reduceat(logits, offsets[:-1])
+    empty = numpy.nonzero(maxlogits == -numpy.inf)[0]
+    maxlogits[empty] = 0
+    expsums = numpy.exp(logits - numpy.repeat(maxlogits, counts))
+    z = numpy.repeat(numpy.add.reduceat(expsums, offsets[:-1]), counts)
+    with numpy.errstate(invalid='ignore'):
+        return expsums / z, empty
+
+
 class AbstractLearner(object):
     '''
     Abstract base class for every MLN learning algorithm.
     '''
+
+    # the attributes holding the sufficient statistics computed by _prepare(),
+    # which may be persisted and restored (see mrfcache.MRFCache.learner).
+    # Empty if the statistics are not deterministic.
+    STATISTICS = ()
     
     def __init__(self, mrf=None, **params):
         self.mrf = mrf
         self._params = params
         self.mrf.apply_cw()
         self._w = None
+        self._prepared = False
 
     @property
     def prior_stdev(self):
@@ -128,6 +152,38 @@ class AbstractLearner(object):
                 grad[i] -= 1./(self.prior_stdev ** 2) * weight
         return self._filter_fixweights(grad)
 
+    @property
+    def ndbs(self):
+        '''
+        The number of independent databases the likelihood decomposes into.
+        '''
+        return 1
+
+    def f_batch(self, weights, dbs, total=None):
+        '''
+        Computes the mean log-likelihood of the databases with the indices in `dbs`.
+        If `total` is given, the `1/total` share of the log prior is added, such
+        that the mean over a partition of `total` databases equals `f / total`.
+        '''
+        w = self._add_fixweights(weights)
+        prior = 0
+        if total is not None and self.prior_stdev is not None:
+            for w_ in w:
+                prior -= 1. / (2. * (self.prior_stdev ** 2)) * w_ ** 2
+            prior /= total
+        return self._f_dbs(w, dbs) / len(dbs) + prior
+
+    def grad_batch(self, weights, dbs, total=None):
+        '''
+        Computes the gradient of :meth:`f_batch`.
+        '''
+        w = self._add_fixweights(weights)
+        grad = numpy.array(self._grad_dbs(w, dbs), dtype=numpy.float64) / len(dbs)
+        if total is not None and self.prior_stdev is not None:
+            for i, weight in enumerate(w):
+                grad[i] -= 1. / (self.prior_stdev ** 2) * weight / total
+        return self._filter_fixweights(grad)
+
     def __call__(self, weights):
         return self.likelihood(weights)
 
@@ -180,7 +236,9 @@ class AbstractLearner(object):
                 self._w[f.idx] = f.weight
         runs = 0
         while runs < self.maxrepeat:
-            self._prepare()
+            # the statistics may have been restored before the first run
+            if runs or not self._prepared:
+                self._prepare()
             self._optimize(**self._params)
             self._cleanup()
             runs += 1
@@ -199,6 +257,8 @@ class AbstractLearner(object):
             opt = optimize.DirectDescent(w, self, **params)        
         elif optimizer == "diagonalNewton":
             opt = optimize.DiagonalNewton(w, self, **params)  
+        elif optimizer in optimize.StochasticOpt.OPTIMIZERS:
+            opt = optimize.StochasticOpt(optimizer, w, self, **params)
         else:
             opt = optimize.SciPyOpt(optimizer, w, self, **params)        
         w = opt.run()
@@ -234,6 +294,12 @@ class AbstractLearner(object):
     def _f(self, wt, **params):
         raise Exception("The learner '%s' does not provide an objective function computation; use another optimizer!" % str(type(self)))
 
+    def _f_dbs(self, wt, dbs):
+        return self._f(wt)
+
+    def _grad_dbs(self, wt, dbs):
+        return self._grad(wt)
+
     @property
     def name(self):
         if self.prior_stdev is None:
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#
+# Markov Logic Networks -- Lifted Counting of Sufficient Statistics
+#
+# (C) 2012-2015 by Daniel Nyga
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+from collections import defaultdict
+
+from dnutils import logs
+
+from ..constants import HARD
+from ..errors import SatisfiabilityException
+from ...logic.common import Logic
+from ...utils.multicore import checkmem
+
+
+logger = logs.getlogger(__name__)
+
+
+class ConstantGroups(object):
+    '''
+    Groups of interchangeable constants of an MRF.
+
+    Two constants are interchangeable if swapping them in all ground atoms
+    leaves the evidence unchanged, and neither of them occurs in a formula
+    of the MLN. Constants are first bucketed by a signature of the evidence
+    of the atoms they appear in, and the buckets are then split into the
+    exact groups by testing the swaps. Any permutation of the constants
+    within their groups is an automorphism of the MRF and its evidence, so
+    variables that are mapped onto each other by such a permutation have
+    identical sufficient statistics. Learners only have to count the
+    statistics of one representative variable of every orbit and weight
+    it with the size of the orbit.
+
+    :param mrf:         the MRF.
+    :param evidence:    the evidence vector. Defaults to the evidence of the MRF.
+
+    :member groups:     the list of groups of at least two interchangeable constants.
+    '''
+
+    def __init__(self, mrf, evidence=None):
+        self.mrf = mrf
+        self.evidence = list(mrf.evidence) if evidence is None else list(evidence)
+        fixed = set()
+        for f in mrf.formulas:
+            formula_constants(f, fixed)
+        doms = defaultdict(set)
+        for domname, values in mrf.domains.items():
+            for value in values: doms[value].add(domname)
+        self._atoms = {}
+        index = defaultdict(list)
+        for atom in mrf.gndatoms:
+            self._atoms[(atom.predname, tuple(atom.args))] = atom.idx
+            for arg in set(atom.args):
+                index[arg].append(atom)
+        self._index = index
+        buckets = defaultdict(list)
+        for c in sorted(doms):
+            if c in fixed: continue
+            buckets[self._signature(c, doms[c])].append(c)
+        self.groups = []
+        for bucket in buckets.values():
+            classes = []
+            for c in bucket:
+                for cls in classes:
+                    if self._interchangeable(cls[0], c):
+                        cls.append(c)
+                        break
+                else:
+                    classes.append([c])
+            self.groups.extend([cls for cls in classes if len(cls) > 1])
+        self._group = {}
+        for gidx, group in enumerate(self.groups):
+            for c in group: self._group[c] = gidx
+        logger.debug('found %d groups of %d interchangeable constants' % (len(self.groups), len(self._group)))
+
+    def _signature(self, c, domains):
+        sig = []
+        for atom in self._index[c]:
+            truth = self.evidence[atom.idx]
+            sig.append((atom.predname, tuple([i for i, a in enumerate(atom.args) if a == c]), -1 if truth is None else truth))
+        return tuple(sorted(domains)), tuple(sorted(sig))
+
+    def _interchangeable(self, a, b):
+        swap = {a: b, b: a}
+        for atom in self._index[a] + self._index[b]:
+            idx = self._atoms.get((atom.predname, tuple([swap.get(x, x) for x in atom.args])))
+            if idx is None or self.evidence[idx] != self.evidence[atom.idx]:
+                return False
+        return True
+
+    def canonical(self, args):
+        '''
+        Returns a canonical form of the tuple of constants `args`, which is the
+        same for two tuples if and only if a permutation of the constants within
+        their groups maps the one onto the other.
+        '''
+        key = []
+        seen = defaultdict(dict)
+        for c in args:
+            gidx = self._group.get(c)
+            if gidx is None:
+                key.append(c)
+            else:
+                ordinals = seen[gidx]
+                key.append((gidx, ordinals.setdefault(c, len(ordinals))))
+        return tuple(key)
+
+    def orbits(self, variables):
+        '''
+        Partitions the given MRF variables into their orbits.
+
+        :returns:    a pair of the list of the representative variables of the orbits,
+                     in the order of `variables`, and the list of the orbit sizes.
+        '''
+        reps = {}
+        counts = defaultdict(int)
+        for var in variables:
+            args = [a.args for a in var.gndatoms]
+            positions = tuple([i for i in range(len(args[0])) if all([a[i] == args[0][i] for a in args])])
+            key = (type(var).__name__, var.predicate.name, positions, self.canonical([args[0][i] for i in positions]))
+            if key not in reps: reps[key] = var
+            counts[key] += 1
+        keys = sorted(reps, key=lambda k: reps[k].idx)
+        return [reps[k] for k in keys], [counts[k] for k in keys]
+
+
+def formula_constants(formula, constants=None):
+    '''
+    Returns the set of the constants occurring in the given formula.
+    '''
+    if constants is None: constants = set()
+    logic = formula.mln.logic
+    if isinstance(formula, Logic.GroundLit):
+        constants.update(formula.gndatom.args)
+    elif isinstance(formula, (Logic.Lit, Logic.LitGroup)):
+        constants.update([a for a in formula.args if not logic.isvar(a)])
+    elif isinstance(formula, Logic.Equality):
+        constants.update([a for a in formula.args if not logic.isvar(a)])
+    elif hasattr(formula, 'children'):
+        for child in formula.children:
+            formula_constants(child, constants)
+    return constants
+
+
+def _literals(formula):
+    '''
+    Returns the list of literals of the formula, or `None` if the formula contains
+    constituents whose groundings cannot be found by matching their literals
+    against ground atoms.
+    '''
+    if isinstance(formula, Logic.Lit):
+        return [formula]
+    elif isinstance(formula, (Logic.Exist, Logic.GroundLit, Logic.LitGroup)) or not formula.islogical():
+        return None
+    elif isinstance(formula, (Logic.Equality, Logic.TrueFalse)):
+        return []
+    literals = []
+    for child in formula.children:
+        lits = _literals(child)
+        if lits is None: return None
+        literals.extend(lits)
+    return literals
+
+
+def itergroundings_with(mrf, formula, gndatoms, unsatfailure=False):
+    '''
+    Yields the groundings of `formula` that contain at least one of the given
+    ground atoms, each of them once, without instantiating any other grounding.
+    The variables of the formula are bound by matching its literals against
+    the ground atoms and only the remaining variables are enumerated. Formulas
+    containing existential quantifiers or ground literals are grounded entirely.
+
+    :param unsatfailure:    if `True`, a :class:`SatisfiabilityException` is raised
+                            for a hard ground formula that is false given the evidence.
+    '''
+    literals = _literals(formula)
+    if literals is None:
+        gndformulas = formula.itergroundings(mrf)
+    else:
+        gndformulas = _itergroundings_with(mrf, formula, literals, gndatoms)
+    for gf in gndformulas:
+        if unsatfailure and gf.weight == HARD and gf(mrf.evidence) == 0:
+            raise SatisfiabilityException('MLN is unsatisfiable due to hard constraint violation %s' % str(gf))
+        yield gf
+
+
+def _itergroundings_with(mrf, formula, literals, gndatoms):
+    logic = mrf.mln.logic
+    bypred = defaultdict(list)
+    for lit in literals:
+        bypred[lit.predname].append(lit)
+    seen = set()
+    for atom in gndatoms:
+        for lit in bypred.get(atom.predname, []):
+            partial = {}
+            for p, c in zip(lit.args, atom.args):
+                if logic.isvar(p):
+                    if partial.setdefault(p, c) != c: break
+                elif p != c: break
+            else:
+                for rest in formula.itervargroundings(mrf, partial):
+                    assignment = dict(partial)
+                    assignment.update(rest)
+                    key = tuple(sorted(assignment.items()))
+                    if key in seen: continue
+                    seen.add(key)
+                    yield formula.ground(mrf, assignment)
+
+
+def itervaluetruths(mrf, gndformulas, variables=None, pervariable=False):
+    '''
+    Yields the triples ``(variable, value index, truth)`` of the nonzero truth
+    values of the ground formulas for every value of the variables they contain,
+    all other variables being set to the evidence.
+
+    :param variables:      the set of the indices of the variables to be considered.
+                           If `None`, all variables are considered.
+    :param pervariable:    if `True`, every variable is considered once per ground
+                           formula, otherwise once per ground atom of the variable
+                           in the ground formula.
+    '''
+    world = list(mrf.evidence)
+    for gf in gndformulas:
+        checkmem()
+        vars_ = [mrf.variable(a) for a in gf.gndatoms()]
+        if pervariable:
+            vars_ = list(dict([(v.idx, v) for v in vars_]).values())
+        for var in vars_:
+            if variables is not None and var.idx not in variables: continue
+            evidence = [world[a.idx] for a in var.gndatoms]
+            for validx, value in var.itervalues():
+                var.setval(value, world)
+                truth = gf(world)
+                if truth != 0:
+                    yield var, validx, truth
+            for a, truth in zip(var.gndatoms, evidence):
+                world[a.idx] = truth
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+#
+# Markov Logic Networks -- Incremental Weight Learning
+#
+# (C) 2012-2015 by Daniel Nyga
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from io import StringIO
+from multiprocessing import Pool
+
+from dnutils import logs, ProgressBar
+
+from .multidb import MultipleDatabaseLearner, _setup_learner
+from ..constants import HARD
+from ..mrf import MRF
+from ..util import StopWatch, edict, privatedir
+from ...utils import locs
+from ...utils.multicore import with_tracing, checkmem
+
+
+logger = logs.getlogger(__name__)
+
+# bump this whenever the layout of the persisted learners changes
+LEARNER_FORMAT = 2
+
+
+def _setup_prepared_learner(args):
+    i, algo = _setup_learner(args)
+    algo._prepare()
+    return i, algo
+
+
+class IncrementalLearner(MultipleDatabaseLearner):
+    '''
+    A :class:`MultipleDatabaseLearner` for corpora that grow over time.
+
+    The per-database learners are persisted after their sufficient statistics
+    have been computed, keyed by a content hash of the database, the structure
+    of the materialized MLN (i.e. its formulas without their soft weights), the
+    learning method and its parameters. When learning again, only the learners
+    of new or changed databases are grounded and prepared, all others are
+    restored from disk. The learned weights are persisted as well, keyed by the
+    structure, method and parameters, and serve as the initial weights of the
+    next run with the same key, such that the optimizer only has to account for
+    the change in the corpus.
+
+    Note that adding a constant to the domain of a template variable of the MLN
+    changes the materialized formulas and thus invalidates all learners.
+
+    The learner is used by :meth:`mln.base.MLN.learn` if the parameter
+    `incremental` is given, which is either `True` or the directory the
+    learners are persisted in (defaults to the ``learn`` folder in the user's
+    cache directory).
+
+    The learners are stored with :mod:`pickle`, so loading them can execute
+    arbitrary code. The directory is thus created accessible only by the current
+    user, and directories that other users can write to are refused. The weights
+    are stored as JSON.
+    '''
+
+    # parameters that only affect the optimization, not the statistics of the learners
+    OPTPARAMS = ('verbose', 'multicore', 'incremental', 'optimizer', 'gtol', 'epsilon', 'maxiter', 'avextol', 'xtol', 'ftol',
+                 'bounds', 'learning_rate', 'schedule', 'decay', 'batchsize', 'epochs', 'momentum', 'heldout', 'patience',
+                 'seed', 'prior_stdev', 'use_init_weights', 'maxrepeat', 'mrfcache')
+
+    def __init__(self, mln_, dbs, method, **params):
+        self.dbs = dbs
+        self._workers = None
+        self._params = edict(params)
+        if not mln_._materialized:
+            self.mln = mln_.materialize(*dbs)
+        else:
+            self.mln = mln_
+        self.watch = StopWatch()
+        self.learners = [None] * len(dbs)
+        self.watch.tag('setup learners', verbose=self.verbose)
+        self.structure = self._structurekey(method)
+        self.keys = [self._dbkey(self.structure, db) for db in dbs]
+        missing = []
+        for i, key in enumerate(self.keys):
+            learner = self._load(self._path(key))
+            if learner is None: missing.append(i)
+            else: self.learners[i] = learner
+        self.hits = len(dbs) - len(missing)
+        self.misses = len(missing)
+        logger.debug('restored %d learners, setting up %d learners' % (self.hits, self.misses))
+        if missing:
+            self._setup_learners(missing, method)
+        else:
+            # materialize the formula weights, which is otherwise a side effect of grounding
+            MRF(self.mln, dbs[0])
+        self.watch.finish('setup learners')
+
+    @property
+    def directory(self):
+        directory = self._params.get('incremental', True)
+        if isinstance(directory, str):
+            return directory
+        return os.path.join(locs.user_cache, 'learn')
+
+    @property
+    def name(self):
+        return "IncrementalLearner [{} x {}]".format(len(self.learners), self.learners[0].name)
+
+    def _setup_learners(self, indices, method):
+        if self.verbose:
+            bar = ProgressBar(steps=len(indices), color='green')
+        args = [(i, self.mln, self.dbs[i], method, self._params + {'verbose': False, 'multicore': False}) for i in indices]
+        if self.multicore and len(indices) > 1:
+            pool = Pool(maxtasksperchild=1)
+            try:
+                for i, learner in pool.imap(with_tracing(_setup_prepared_learner), args):
+                    self.learners[i] = learner
+                    self._dump(learner, self._path(self.keys[i]))
+                    if self.verbose: bar.inc()
+            except Exception as e:
+                logger.error('Error in child process. Terminating pool...')
+                pool.close()
+                raise e
+            finally:
+                pool.terminate()
+                pool.join()
+            # the formula weights have been materialized in the child processes only
+            MRF(self.mln, self.dbs[indices[0]])
+        else:
+            for a in args:
+                checkmem()
+                i, learner = _setup_prepared_learner(a)
+                self.learners[i] = learner
+                self._dump(learner, self._path(self.keys[i]))
+                if self.verbose: bar.inc()
+
+    def _structurekey(self, method):
+        '''
+        Computes the hash of everything but the database that the statistics
+        of a learner depend on.
+        '''
+        sha = hashlib.sha1()
+        def feed(s):
+            sha.update(s.encode('utf-8'))
+            sha.update(b'\0')
+        feed(str(LEARNER_FORMAT))
+        feed('%s.%s' % (method.__module__, method.__name__))
+        feed(repr(sorted([(k, repr(v)) for k, v in self._params.items() if k not in IncrementalLearner.OPTPARAMS])))
+        feed(type(self.mln.logic).__name__)
+        feed(type(self.mln.logic.grammar).__name__)
+        # the statistics do not depend on the soft weights
+        mln = self.mln.copy()
+        mln.weights = [HARD if w == HARD else 0 for w in self.mln.weights]
+        stream = StringIO()
+        mln.write(stream, color=False)
+        feed(stream.getvalue())
+        feed(repr(sorted([(d, list(v)) for d, v in self.mln.domains.items()])))
+        return sha.hexdigest()
+
+    @staticmethod
+    def _dbkey(structure, db):
+        sha = hashlib.sha1()
+        sha.update(structure.encode('utf-8'))
+        stream = StringIO()
+        db.write(stream, color=False, bars=False)
+        sha.update(stream.getvalue().encode('utf-8'))
+        sha.update(repr(sorted([(d, list(v)) for d, v in db.domains.items()])).encode('utf-8'))
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, '%s.lrn' % key)
+
+    def _weightspath(self):
+        return os.path.join(self.directory, 'weights-%s.json' % self.structure)
+
+    def _write(self, path, write):
+        # write to a temporary file first, so concurrent readers never see partial entries
+        privatedir(self.directory)
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmppath, path)
+        except Exception:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+    def _dump(self, learner, path):
+        self._write(path, lambda f: pickle.dump(learner, f, pickle.HIGHEST_PROTOCOL))
+
+    def _load(self, path):
+        if not os.path.exists(path): return None
+        privatedir(self.directory)
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (pickle.UnpicklingError, EOFError) as e:
+            logger.warning('Discarding corrupt learner file %s: %s' % (path, e))
+            os.remove(path)
+            return None
+
+    def _dumpweights(self, weights):
+        self._write(self._weightspath(), lambda f: f.write(json.dumps(weights).encode('utf-8')))
+
+    def _loadweights(self):
+        '''
+        Returns the persisted weights, a dict mapping formula strings to their weights.
+        '''
+        path = self._weightspath()
+        try:
+            with open(path) as f:
+                weights = json.load(f)
+            if not isinstance(weights, dict):
+                raise ValueError('Expected a JSON object')
+            return dict([(f, float(w)) for f, w in weights.items()])
+        except FileNotFoundError:
+            return {}
+        except (ValueError, TypeError) as e:
+            logger.warning('Discarding corrupt weights file %s: %s' % (path, e))
+            os.remove(path)
+            return {}
+
+    def _prepare(self):
+        # the learners have been prepared when they were set up
+        pass
+
+    def _warmstart(self):
+        '''
+        Sets the weights of the formulas that have been learned before to their
+        previous values. Only weights that have been learned with the same structure,
+        method and parameters are reused. Returns the number of formulas that have
+        been warm-started.
+        '''
+        weights = self._loadweights()
+        n = 0
+        for f in self.mln.formulas:
+            if f.ishard or self.mln.fixweights[f.idx]: continue
+            w = weights.get(str(f))
+            if w is not None:
+                f.weight = w
+                n += 1
+            elif not self.use_init_weights:
+                f.weight = 0
+        return n
+
+    def run(self, **params):
+        n = self._warmstart()
+        logger.debug('warm-starting %d of %d formulas' % (n, len(self.mln.formulas)))
+        use_init_weights = self._params.get('use_init_weights')
+        self._params['use_init_weights'] = True
+        try:
+            weights = MultipleDatabaseLearner.run(self, **params)
+        finally:
+            self._params['use_init_weights'] = use_init_weights
+        # merge the learned weights into the persisted ones
+        persisted = self._loadweights()
+        persisted.update([(str(f), float(w)) for f, w in zip(self.mln.formulas, weights) if not f.ishard])
+        self._dumpweights(persisted)
+        return weights
+
+    def clear(self):
+        '''
+        Removes all persisted learners and weights.
+        '''
+        if not os.path.exists(self.directory): return
+        for fname in os.listdir(self.directory):
+            if fname.endswith('.lrn') or fname.startswith('weights-'):
+                os.remove(os.path.join(self.directory, fname))
@@ -23,88 +23,206 @@
 # CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import itertools
+import math
+
 from dnutils import ProgressBar
 
 from .common import *
+from .counting import ConstantGroups
+from ..inference.clausekb import ClauseKB
 from ..grounding.default import DefaultGroundingFactory
 from ..constants import HARD
 from ..errors import SatisfiabilityException
+from ..mrfvars import FuzzyVariable
+
+
+logger = logs.getlogger(__name__)
 
 
 class LL(AbstractLearner):
     """
     Exact Log-Likelihood learner.
+    
+    The formulas are grounded once and compiled into a 
+    :class:`mln.inference.clausekb.ClauseKB`, by which the numbers of true 
+    groundings of all formulas are counted in batches of possible worlds. 
+    Worlds with identical counts have identical probabilities, so the 
+    statistic consists of the distinct count vectors only, together with 
+    the numbers of worlds they occur in.
+    
+    If `lifted` is `True`, the worlds are enumerated up to permutations of
+    interchangeable constants (see :class:`mln.learning.counting.ConstantGroups`).
+    The partition function does not depend on the evidence, so constants are
+    interchangeable if neither of them occurs in a formula and they appear in
+    the same ground atoms. If every variable of the MRF contains at most one
+    such constant, a world is determined up to permutation by the values of
+    the other variables and the multiset of the values, or types, of the
+    variables of every constant, and only one world per such orbit is counted,
+    weighted with the multinomial number of worlds in the orbit. Otherwise,
+    all possible worlds are enumerated.
     """
     
+    BATCHSIZE = 4096
+    
     def __init__(self, mrf, **params):
         AbstractLearner.__init__(self, mrf, **params)
         self._stat = None
+        self._logmult = None
         self._ls = None
         self._eworld_idx = None
         self._lastw = None
 
     
+    @property
+    def lifted(self):
+        return self._params.get('lifted', False)
+
+    
     def _prepare(self):
         self._compute_statistics()
         
 
     def _l(self, w):
         """
-        computes the likelihoods of all possible worlds under weights w
+        computes the probability masses of the worlds of every count vector under weights w
         """
         if self._lastw is None or list(w) != self._lastw:
             self._lastw = list(w)
-            expsums = []
-            for fvalues in self._stat:
-                s = 0
-                hc_violation = False
-                for fidx, val in fvalues.items():
-                    if self.mrf.mln.formulas[fidx].weight == HARD:
-                        if val == 0:
-                            hc_violation = True
-                            break
-                    else:
-                        s += val * w[fidx]
-                if hc_violation: 
-                    expsums.append(0)
-                else:
-                    expsums.append(exp(s))
-            z = sum(expsums)
-            if z == 0: raise SatisfiabilityException('MLN is unsatisfiable: probability masses of all possible worlds are zero.')
-            self._ls = [v / z for v in expsums] 
+            w = numpy.array(w, dtype=numpy.float64)
+            hard = w == HARD
+            sums = self._stat[:, ~hard].dot(w[~hard]) + self._logmult
+            # worlds violating a hard formula have zero probability mass
+            sums[(self._stat[:, hard] < self._ngroundings[hard]).any(axis=1)] = -numpy.inf
+            maxsum = sums.max()
+            if maxsum == -numpy.inf: raise SatisfiabilityException('MLN is unsatisfiable: probability masses of all possible worlds are zero.')
+            expsums = numpy.exp(sums - maxsum)
+            self._ls = expsums / expsums.sum()
         return self._ls 
             
 
     def _f(self, w):
         ls = self._l(w)
-        return numpy.log(ls[self._eworld_idx])
+        return numpy.log(ls[self._eworld_idx]) - self._logmult[self._eworld_idx]
                 
     
     def _grad(self, w):
         ls = self._l(w)
-        grad = numpy.zeros(len(self.mrf.formulas), numpy.float64)
-        for widx, values in enumerate(self._stat):
-            for fidx, count in values.items():
-                if widx == self._eworld_idx:
-                    grad[fidx] += count
-                grad[fidx] -= count * ls[widx]
-        return grad 
+        return self._stat[self._eworld_idx] - self._stat.T.dot(ls)
 
 
     def _compute_statistics(self):
-        self._stat = []
         grounder = DefaultGroundingFactory(self.mrf)
-        eworld = list(self.mrf.evidence)
+        gndformulas = list(grounder.itergroundings())
+        nformulas = len(self.mrf.formulas)
+        self._ngroundings = numpy.bincount([gf.idx for gf in gndformulas], minlength=nformulas).astype(numpy.float64)
+        logical = [gf for gf in gndformulas if gf.islogical()]
+        nonlogical = [gf for gf in gndformulas if not gf.islogical()]
+        kb = ClauseKB(self.mrf, logical, weights=[0] * len(logical))
+        compiled = set(map(id, kb.gndformulas))
+        # ground formulas with a constant truth value are not part of the KB
+        constants = [gf for gf in logical if id(gf) not in compiled]
+        # (ground formula x formula) indicator matrix
+        gf2f = numpy.zeros((len(kb), nformulas))
+        gf2f[numpy.arange(len(kb)), [gf.idx for gf in kb.gndformulas]] = 1
+        worlds = self._iterorbits() if self.lifted else None
+        if worlds is None:
+            worlds = ((list(world), 0.) for _, world in self.mrf.iterallworlds())
+            nworlds = self.mrf.countworlds()
+        else:
+            worlds, nworlds = worlds
+        counts = []
+        logmult = []
+        batch = []
         if self.verbose:
-            bar = ProgressBar(steps=self.mrf.countworlds(), color='green')
-        for widx, world in self.mrf.iterallworlds():
+            bar = ProgressBar(steps=nworlds, color='green')
+        for widx, (world, lm) in enumerate(worlds):
             if self.verbose:
                 bar.label(str(widx))
                 bar.inc()
-            values = {}
-            self._stat.append(values)
-            if self._eworld_idx is None and world == eworld:
-                self._eworld_idx = widx  
-            for gf in grounder.itergroundings():
-                truth = gf(world)
-                if truth != 0: values[gf.idx] = values.get(gf.idx, 0) + truth
+            batch.append(world)
+            logmult.append(lm)
+            if len(batch) == LL.BATCHSIZE:
+                counts.append(self._countbatch(batch, kb, gf2f, constants, nonlogical))
+                batch = []
+        # the counts of the evidence world, which does not add to the multiplicities
+        batch.append(list(self.mrf.evidence))
+        logmult.append(-numpy.inf)
+        counts.append(self._countbatch(batch, kb, gf2f, constants, nonlogical))
+        self._stat, inverse = numpy.unique(numpy.vstack(counts), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        # sum up the multiplicities of identical count vectors in log space
+        logmult = numpy.array(logmult)
+        maxlm = numpy.full(len(self._stat), -numpy.inf)
+        numpy.maximum.at(maxlm, inverse, logmult)
+        summult = numpy.zeros(len(self._stat))
+        numpy.add.at(summult, inverse, numpy.exp(logmult - maxlm[inverse]))
+        self._logmult = maxlm + numpy.log(summult)
+        self._eworld_idx = int(inverse[-1])
+        logger.debug('%d distinct count vectors in %d possible worlds' % (len(self._stat), len(inverse) - 1))
+        self._lastw = None
+
+
+    def _iterorbits(self):
+        """
+        Returns a generator of (world, log multiplicity) pairs of representative worlds of 
+        the orbits of the possible worlds under permutations of interchangeable constants,
+        together with the number of orbits, or `None` if the worlds cannot be lifted.
+        """
+        groups = ConstantGroups(self.mrf, evidence=[None] * len(self.mrf.evidence)).groups
+        group = {}
+        for gidx, g in enumerate(groups):
+            for c in g: group[c] = gidx
+        rest = []
+        percst = dict([(c, []) for c in group])
+        for var in self.mrf.variables:
+            if isinstance(var, FuzzyVariable): return None
+            cs = set([a for atom in var.gndatoms for a in atom.args if a in group])
+            if len(cs) > 1: return None
+            if cs: percst[cs.pop()].append(var)
+            else: rest.append(var)
+        if not groups: return None
+        # the variables of every constant in the same order for all constants of a group
+        def key(var, c):
+            return var.predicate.name, tuple([(a == c, '' if a == c else a) for a in var.gndatoms[0].args])
+        typevars = []
+        for g in groups:
+            keys = None
+            for c in g:
+                percst[c].sort(key=lambda v: key(v, c))
+                ks = [key(v, c) for v in percst[c]]
+                if keys is None: keys = ks
+                elif ks != keys: return None
+            typevars.append([percst[c] for c in g])
+        restvalues = [list(var.values({})) for var in rest]
+        types = [list(itertools.product(*[list(v.values({})) for v in vs[0]])) for vs in typevars]
+        nworlds = 1
+        for vals in restvalues: nworlds *= len(vals)
+        for g, ts in zip(groups, types): nworlds *= math.factorial(len(ts) + len(g) - 1) // (math.factorial(len(g)) * math.factorial(len(ts) - 1))
+        logger.debug('enumerating %d orbits of %d possible worlds' % (nworlds, self.mrf.countworlds()))
+        def orbits():
+            world = [None] * len(self.mrf.evidence)
+            multisets = [list(itertools.combinations_with_replacement(range(len(ts)), len(g))) for g, ts in zip(groups, types)]
+            for restval in itertools.product(*restvalues):
+                for var, val in zip(rest, restval): var.setval(val, world)
+                for mss in itertools.product(*multisets):
+                    logmult = 0.
+                    for vs, ts, ms in zip(typevars, types, mss):
+                        logmult += math.lgamma(len(ms) + 1) - sum([math.lgamma(ms.count(t) + 1) for t in set(ms)])
+                        for cvars, t in zip(vs, ms):
+                            for var, val in zip(cvars, ts[t]): var.setval(val, world)
+                    yield list(world), logmult
+        return orbits(), nworlds
+
+
+    def _countbatch(self, worlds, kb, gf2f, constants, nonlogical):
+        """
+        Counts the true groundings of all formulas in every world of the batch.
+        """
+        counts = kb.truth(numpy.array(worlds, dtype=numpy.float64)).dot(gf2f)
+        for gf in constants:
+            counts[:, gf.idx] += gf(worlds[0])
+        for gf in nonlogical:
+            for i, world in enumerate(worlds):
+                counts[i, gf.idx] += gf(world)
+        return counts
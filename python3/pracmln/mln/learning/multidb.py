@@ -20,12 +20,13 @@
 # CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
-from dnutils import logs, ProgressBar, out, first
+from dnutils import logs, ProgressBar, out, first, ifnone
 
 from .common import AbstractLearner
 import sys
 from ..util import StopWatch, edict
-from multiprocessing import Pool
+import traceback
+from multiprocessing import Pool, Process, Pipe, cpu_count
 from ...utils.multicore import with_tracing, _methodcaller, checkmem
 import numpy
 from ..constants import HARD
@@ -33,6 +34,10 @@ from ..constants import HARD
 
 logger = logs.getlogger(__name__)
 
+# this readonly global is for multiprocessing to exploit copy-on-write
+# on linux systems
+global_learners = None
+
 
 def _setup_learner(xxx_todo_changeme):
     (i, mln_, db, method, params) = xxx_todo_changeme
@@ -42,6 +47,96 @@ def _setup_learner(xxx_todo_changeme):
     return i, algo
 
 
+def _learner_worker(conn, shard):
+    '''
+    Main loop of a persistent worker process owning the learners with the indices
+    in `shard`. Receives triples of a method name (`_f` or `_grad`), a weight
+    vector and the indices of the learners to be evaluated (`None` for all) and
+    sends back the sum of the results of the respective learners of the shard. 
+    Terminates when receiving `None`.
+    '''
+    while True:
+        msg = conn.recv()
+        if msg is None: break
+        method, w, dbs = msg
+        if dbs is None:
+            learners = [global_learners[i] for i in shard]
+        else:
+            learners = [global_learners[i] for i in shard if i in dbs]
+        try:
+            if method == '_grad':
+                result = numpy.zeros(len(w), numpy.float64)
+                for learner in learners: result += learner._grad(w)
+            else:
+                result = sum([getattr(learner, method)(w) for learner in learners])
+            conn.send((True, result))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+    conn.close()
+
+
+class LearnerWorkers(object):
+    '''
+    A set of persistent worker processes, each of which owns a fixed shard of
+    the learners of a :class:`MultipleDatabaseLearner` for a whole optimization
+    run. For every evaluation, only the weight vector is sent to the workers,
+    which return the partial likelihood or gradient of their shard through a pipe.
+    
+    :param learners:     the list of learners.
+    :param processes:    the number of worker processes. Defaults to the number of CPUs.
+    '''
+    
+    def __init__(self, learners, processes=None):
+        global global_learners
+        global_learners = learners
+        processes = max(1, min(ifnone(processes, cpu_count()), len(learners)))
+        self.workers = []
+        for i in range(processes):
+            conn, childconn = Pipe()
+            process = Process(target=_learner_worker, args=(childconn, list(range(i, len(learners), processes))))
+            process.daemon = True
+            process.start()
+            childconn.close()
+            self.workers.append((process, conn))
+        logger.debug('Started {} persistent learner processes'.format(processes))
+        
+    def _call(self, method, w, dbs=None):
+        w = list(map(float, w))
+        if dbs is not None: 
+            dbs = set(map(int, dbs))
+        for _, conn in self.workers:
+            conn.send((method, w, dbs))
+        results = []
+        errors = []
+        for _, conn in self.workers:
+            ok, result = conn.recv()
+            if ok: results.append(result)
+            else: errors.append(result)
+        if errors:
+            logger.error('Error in child process:\n%s' % errors[0])
+            raise Exception('Error in child process:\n%s' % errors[0])
+        return sum(results[1:], results[0])
+    
+    def f(self, w, dbs=None):
+        return self._call('_f', w, dbs)
+    
+    def grad(self, w, dbs=None):
+        return self._call('_grad', w, dbs)
+    
+    def close(self):
+        for process, conn in self.workers:
+            try:
+                conn.send(None)
+                conn.close()
+            except (OSError, EOFError):
+                pass
+        for process, _ in self.workers:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.workers = []
+
+
 class MultipleDatabaseLearner(AbstractLearner):
     '''
     Learns from multiple databases using an arbitrary sub-learning method for
@@ -59,9 +154,13 @@ class MultipleDatabaseLearner(AbstractLearner):
                             :class:`mln.methods.LearningMethods`.
         :param **params:    additional parameters handed over to the base
                             learners.
+                            
+        If `multicore` is `True`, the learners are evaluated during the optimization 
+        by persistent worker processes (see :class:`LearnerWorkers`).
         '''
 
         self.dbs = dbs
+        self._workers = None
         self._params = edict(params)
         if not mln_._materialized:
             self.mln = mln_.materialize(*dbs)
@@ -112,46 +211,28 @@ class MultipleDatabaseLearner(AbstractLearner):
     def name(self):
         return "MultipleDatabaseLearner [{} x {}]".format(len(self.learners), self.learners[0].name)
 
+    @property
+    def ndbs(self):
+        return len(self.learners)
+
     def _f(self, w):
-        # it turned out that it doesn't pay off to evaluate the function  
-        # in separate processes, so we turn it off 
-        if False:  # self.multicore:
-            likelihood = 0
-            pool = Pool()
-            try:
-                for i, (f_, d_) in enumerate(pool.imap(with_tracing(_methodcaller('_f', sideeffects=True)), [(l, w) for l in self.learners])):
-                    self.learners[i].__dict__ = d_
-                    likelihood += f_
-            except Exception as e:
-                logger.error('Error in child process. Terminating pool...')
-                pool.close()
-                raise e
-            finally:
-                pool.terminate()
-                pool.join()
-            return likelihood
-        else:
-            return sum([l._f(w) for l in self.learners])
+        return self._f_dbs(w)
 
     def _grad(self, w):
+        return self._grad_dbs(w)
+
+    def _f_dbs(self, w, dbs=None):
+        if self._workers is not None:
+            return self._workers.f(w, dbs)
+        learners = self.learners if dbs is None else [self.learners[i] for i in dbs]
+        return sum([l._f(w) for l in learners])
+
+    def _grad_dbs(self, w, dbs=None):
+        if self._workers is not None:
+            return self._workers.grad(w, dbs)
+        learners = self.learners if dbs is None else [self.learners[i] for i in dbs]
         grad = numpy.zeros(len(self.mln.formulas), numpy.float64)
-        if False:  # self.multicore:
-            # it turned out that it doesn't pay off to evaluate the gradient  
-            # in separate processes, so we turn it off 
-            pool = Pool()
-            try:
-                for i, (grad_, d_) in enumerate(pool.imap(with_tracing(_methodcaller('_grad', sideeffects=True)), [(l, w) for l in self.learners])):
-                    self.learners[i].__dict__ = d_
-                    grad += grad_
-            except Exception as e:
-                logger.error('Error in child process. Terminating pool...')
-                pool.close()
-                raise e
-            finally:
-                pool.terminate()
-                pool.join()
-        else:
-            for learner in self.learners: grad += learner._grad(w)
+        for learner in learners: grad += learner._grad(w)
         return grad
 
     def _hessian(self, w):
@@ -229,7 +310,14 @@ class MultipleDatabaseLearner(AbstractLearner):
             for f in self.mln.formulas:
                 if self.mln.fixweights[f.idx] or self.use_init_weights or f.ishard:
                     self._w[f.idx] = f.weight
-            self._optimize(**self._params)
+            if self.multicore:
+                self._workers = LearnerWorkers(self.learners)
+            try:
+                self._optimize(**self._params)
+            finally:
+                if self._workers is not None:
+                    self._workers.close()
+                    self._workers = None
             self._cleanup()
             runs += 1
             if not any([l.repeat() for l in self.learners]): break
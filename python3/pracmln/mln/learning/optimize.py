@@ -244,6 +244,135 @@ class SciPyOpt(object):
         
         return wt
 
+class StochasticOpt(object):
+    """
+    Minibatch optimization for learners that decompose into independent
+    databases, such as :class:`mln.learning.multidb.MultipleDatabaseLearner`.
+    
+    In every step, the gradient is estimated from a random minibatch of the 
+    training databases, such that the cost of a step does not depend on the 
+    number of databases. The objective is the mean log-likelihood per database 
+    (plus the respective share of the log prior), which has the same optimum as 
+    the full-batch objective, but keeps the learning rate independent of the 
+    number of databases. A fraction of the databases can be held out from
+    training; the optimization stops when their mean log-likelihood has not 
+    improved for `patience` epochs and the best weights found are returned.
+    
+    :param optimizer:      the update rule, one of ``sgd`` (with momentum), 
+                           ``adam`` and ``adagrad``.
+    :param learning_rate:  the initial learning rate.
+    :param schedule:       the learning rate schedule: ``constant``, ``inverse``
+                           (``learning_rate / (1 + decay * epoch)``) or ``exponential``
+                           (``learning_rate * decay ** epoch``).
+    :param decay:          the decay parameter of the learning rate schedule.
+    :param batchsize:      the number of databases per minibatch.
+    :param epochs:         the maximal number of passes over the training databases.
+    :param momentum:       the momentum of ``sgd``.
+    :param heldout:        the fraction of the databases held out from training.
+    :param patience:       the number of epochs without improvement of the held-out
+                           likelihood after which the optimization is stopped.
+    :param gtol:           the optimization is stopped when the norm of the full
+                           training gradient falls below `gtol`. Only checked if no
+                           databases are held out.
+    :param seed:           the seed of the random number generator.
+    """
+    
+    OPTIMIZERS = ('sgd', 'adam', 'adagrad')
+    SCHEDULES = ('constant', 'inverse', 'exponential')
+    
+    def __init__(self, optimizer, wt, problem, learning_rate=None, schedule='constant', decay=None, batchsize=10, 
+                 epochs=100, momentum=.9, heldout=.1, patience=3, gtol=1e-3, seed=None, verbose=False, **params):
+        if optimizer not in StochasticOpt.OPTIMIZERS:
+            raise Exception("Unknown optimizer '%s'" % optimizer)
+        if schedule not in StochasticOpt.SCHEDULES:
+            raise Exception("Unknown learning rate schedule '%s'" % schedule)
+        if epochs < 1:
+            raise Exception('The number of epochs must be at least 1: %s' % epochs)
+        self.optimizer = optimizer
+        self.wt = numpy.array(wt, dtype=numpy.float64)
+        self.problem = problem
+        self.learning_rate = learning_rate if learning_rate is not None else {'sgd': .01, 'adam': .05, 'adagrad': .1}[optimizer]
+        self.schedule = schedule
+        self.decay = decay if decay is not None else {'constant': 0, 'inverse': .1, 'exponential': .95}[schedule]
+        self.batchsize = batchsize
+        self.epochs = epochs
+        self.momentum = momentum
+        self.heldout = heldout
+        self.patience = patience
+        self.gtol = gtol
+        self.rnd = numpy.random.RandomState(seed)
+        self.verbose = verbose
+        
+    def _learning_rate(self, epoch):
+        if self.schedule == 'inverse':
+            return self.learning_rate / (1. + self.decay * epoch)
+        elif self.schedule == 'exponential':
+            return self.learning_rate * self.decay ** epoch
+        return self.learning_rate
+    
+    def _split(self):
+        dbs = self.rnd.permutation(self.problem.ndbs)
+        n = int(round(len(dbs) * self.heldout))
+        if n == 0 or n == len(dbs):
+            return list(dbs), []
+        return list(dbs[n:]), list(dbs[:n])
+    
+    def run(self):
+        log = logs.getlogger(self.__class__.__name__)
+        p = self.problem
+        train, heldout = self._split()
+        batchsize = max(1, min(self.batchsize, len(train)))
+        log.info('starting optimization with %s: %d training and %d held-out databases, batch size %d' % 
+                 (self.optimizer, len(train), len(heldout), batchsize))
+        wt = self.wt
+        # first and second moment estimates (sgd: velocity, adagrad: sum of squared gradients)
+        m = numpy.zeros(len(wt))
+        v = numpy.zeros(len(wt))
+        eps = 1e-8
+        beta1, beta2 = .9, .999
+        step = 0
+        best, best_wt, bad_epochs = None, wt.copy(), 0
+        for epoch in range(self.epochs):
+            lr = self._learning_rate(epoch)
+            order = self.rnd.permutation(train)
+            for i in range(0, len(order), batchsize):
+                batch = list(order[i:i + batchsize])
+                grad = numpy.array(p.grad_batch(wt, batch, len(train)), dtype=numpy.float64)
+                step += 1
+                # gradient ascent on the log-likelihood
+                if self.optimizer == 'sgd':
+                    m = self.momentum * m + lr * grad
+                    wt = wt + m
+                elif self.optimizer == 'adagrad':
+                    v += grad ** 2
+                    wt = wt + lr * grad / (numpy.sqrt(v) + eps)
+                elif self.optimizer == 'adam':
+                    m = beta1 * m + (1 - beta1) * grad
+                    v = beta2 * v + (1 - beta2) * grad ** 2
+                    mhat = m / (1 - beta1 ** step)
+                    vhat = v / (1 - beta2 ** step)
+                    wt = wt + lr * mhat / (numpy.sqrt(vhat) + eps)
+            if heldout:
+                score = p.f_batch(wt, heldout)
+                if self.verbose: 
+                    print('epoch %d: held-out log-likelihood per database: %f (learning rate %f)' % (epoch + 1, score, lr))
+                if best is None or score > best:
+                    best, best_wt, bad_epochs = score, wt.copy(), 0
+                else:
+                    bad_epochs += 1
+                    if bad_epochs >= self.patience:
+                        log.info('held-out likelihood has not improved for %d epochs' % bad_epochs)
+                        break
+            else:
+                best_wt = wt
+                norm = numpy.linalg.norm(p.grad_batch(wt, train, len(train)))
+                if self.verbose: 
+                    print('epoch %d: |grad| = %f (learning rate %f)' % (epoch + 1, norm, lr))
+                if norm < self.gtol: break
+        log.info('optimization done with %s after %d epochs (%d steps)' % (self.optimizer, epoch + 1, step))
+        return best_wt
+
+
 # try:
 #     from playdoh import Fitness, maximize, MAXCPU, GA, PSO, print_table
 #     from numpy import exp, tile, array
@@ -20,36 +20,53 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from .inference.gibbs import GibbsSampler
-from .inference.mcsat import MCSAT
-from .inference.exact import EnumerationAsk
-from .inference.wcspinfer import WCSPInference
-from .inference.maxwalk import SAMaxWalkSAT
-from .learning.cll import CLL, DCLL
-from .learning.ll import LL
-from .learning.bpll import BPLL, DPLL , BPLL_CG, DBPLL_CG
+import importlib
+
 
 class Enum(object):
-    
+    '''
+    Registry of the inference or learning engines.
+
+    The items are given as (module, classname, name) triples, where module is
+    relative to this package. The engine classes are imported on demand only,
+    such that a registry lookup by id or name does not load any engine.
+    '''
+
     def __init__(self, items):
-        self.id2name = dict([(clazz.__name__, name) for (clazz, name) in items])
-        self.name2id = dict([(name, clazz.__name__) for (clazz, name) in items])
-        self.id2clazz = dict([(clazz.__name__, clazz) for (clazz, _) in items])
-    
+        self.id2name = dict([(clazz, name) for (_, clazz, name) in items])
+        self.name2id = dict([(name, clazz) for (_, clazz, name) in items])
+        self.id2module = dict([(clazz, module) for (module, clazz, _) in items])
+        self._classes = {}
+
+
+    @property
+    def id2clazz(self):
+        return dict([(id_, self._load(id_)) for id_ in self.id2module])
+
+
+    def _load(self, id_):
+        clazz = self._classes.get(id_)
+        if clazz is None:
+            module = importlib.import_module(self.id2module[id_], __package__)
+            clazz = self._classes[id_] = getattr(module, id_)
+        return clazz
+
     
     def __getattr__(self, id_):
-        if id_ in self.id2clazz:
-            return self.id2clazz[id_]
-        raise KeyError('Enum does not define %s, only %s' % (id_, list(self.id2clazz.keys())))
+        if id_.startswith('__') or 'id2module' not in self.__dict__:
+            raise AttributeError(id_)
+        if id_ in self.id2module:
+            return self._load(id_)
+        raise KeyError('Enum does not define %s, only %s' % (id_, list(self.id2module.keys())))
     
     
     def clazz(self, key):
         if type(key).__name__ == 'type':
             key = key.__name__ 
-        if key in self.id2clazz:
-            return self.id2clazz[str(key)]
+        if key in self.id2module:
+            return self._load(str(key))
         else:
-            return self.id2clazz[self.name2id[key]]
+            return self._load(self.name2id[key])
         raise KeyError('No such element "%s"' % key)
     
     def id(self, key):
@@ -72,25 +89,25 @@ class Enum(object):
     
 InferenceMethods = Enum(
     (
-     (GibbsSampler, 'Gibbs sampling'), 
-     (MCSAT, 'MC-SAT'), 
+     ('.inference.gibbs', 'GibbsSampler', 'Gibbs sampling'), 
+     ('.inference.mcsat', 'MCSAT', 'MC-SAT'), 
 #      (FuzzyMCSAT,  'Fuzzy MC-SAT'),
 #      (IPFPM, 'IPFP-M'), 
-     (EnumerationAsk, 'Enumeration-Ask (exact)'),
-     (WCSPInference, 'WCSP (exact MPE with toulbar2)'),
-     (SAMaxWalkSAT, 'Max-Walk-SAT with simulated annealing (approx. MPE)')
+     ('.inference.exact', 'EnumerationAsk', 'Enumeration-Ask (exact)'),
+     ('.inference.wcspinfer', 'WCSPInference', 'WCSP (exact MPE with toulbar2)'),
+     ('.inference.maxwalk', 'SAMaxWalkSAT', 'Max-Walk-SAT with simulated annealing (approx. MPE)')
     ))
 
 
 LearningMethods = Enum(
      (
-      (CLL, 'composite-log-likelihood'),
-      (DCLL, '[discriminative] composite-log-likelihood'),
-      (LL, "log-likelihood"),
-      (DPLL, '[discriminative] pseudo-log-likelihood'),
-      (BPLL, 'pseudo-log-likelihood'),
-      (BPLL_CG, 'pseudo-log-likelihood (fast conjunction grounding)'),
-      (DBPLL_CG, '[discriminative] pseudo-log-likelihood (fast conjunction grounding)')
+      ('.learning.cll', 'CLL', 'composite-log-likelihood'),
+      ('.learning.cll', 'DCLL', '[discriminative] composite-log-likelihood'),
+      ('.learning.ll', 'LL', "log-likelihood"),
+      ('.learning.bpll', 'DPLL', '[discriminative] pseudo-log-likelihood'),
+      ('.learning.bpll', 'BPLL', 'pseudo-log-likelihood'),
+      ('.learning.bpll', 'BPLL_CG', 'pseudo-log-likelihood (fast conjunction grounding)'),
+      ('.learning.bpll', 'DBPLL_CG', '[discriminative] pseudo-log-likelihood (fast conjunction grounding)')
 #     'MLNBoost': 'MLN-BOOST',
 #     'WPLL': 'Weighted Pseudo-likelihood',
       #"SLL": "sampling-based log-likelihood via direct descent",
@@ -121,6 +138,6 @@ if __name__ =='__main__':
     print(InferenceMethods.id2name)
     print(InferenceMethods.name2id)
     print(LearningMethods.names())
-    print(InferenceMethods.clazz(MCSAT))
+    print(InferenceMethods.clazz('MCSAT'))
     print(InferenceMethods.name('WCSPInference'))
     
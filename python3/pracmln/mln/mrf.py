@@ -71,6 +71,9 @@ class MRF(object):
         self._variables_by_gndatomidx = {} # gnd atom idx
         self._gndatoms = {}
         self._gndatoms_by_idx = {} 
+        # maps ground atoms to their indices without string lookups, if the
+        # MRF has been grounded completely (see evidence.AtomIndex)
+        self._atomindex = None
         # get combined domain
         self.domains = mergedom(self.mln.domains, db.domains)
 #         self.softEvidence = list(mln.posteriorProbReqs) # constraints on posterior 
@@ -87,6 +90,10 @@ class MRF(object):
         else:
             raise Exception("Not a valid database argument (type %s)" % (str(type(db))))
         self.db = db
+        # the persisted evidence-independent ground formulas of the grounding factories
+        # (see mrfcache.GroundingStore). This is only used for MRFs managed by an
+        # mrfcache.MRFCache, otherwise it is None.
+        self.groundings = None
         # materialize formula weights
         self._materialize_weights()
         return
@@ -103,6 +110,10 @@ class MRF(object):
     def gndatoms(self):
         return list(self._gndatoms.values())
     
+    @property
+    def atomindex(self):
+        return self._atomindex
+
     @property
     def evidence(self):
         return self._evidence
@@ -230,7 +241,7 @@ class MRF(object):
             if gndatom is None:
                 self.print_gndatoms()
                 raise MRFValueException('"%s" is not among the ground atoms.' % key)
-            atomvalues_[str(gndatom)] = value
+            atomvalues_[gndatom.idx] = value
             var = self.variable(gndatom)
             if isinstance(self.mln.logic, FuzzyLogic):
                 if (isinstance(var, MutexVariable) or isinstance(var, SoftMutexVariable) or isinstance(var, BinaryVariable)) and value is not None and value in Interval(']0,1['):
@@ -333,6 +344,10 @@ class MRF(object):
 #                     return self.new_gndatom(identifier.predname, *identifier.args)
             else: raise Exception('Illegal identifier type: %s' % type(identifier))
         else:
+            if self._atomindex is not None:
+                offset = self._atomindex.offset(identifier, args)
+                if offset is not None and offset in self._gndatoms_by_idx:
+                    return self._gndatoms_by_idx[offset]
             return self.new_gndatom(identifier, *args)
 
     def variable(self, identifier):
@@ -438,7 +453,7 @@ class MRF(object):
         .. note:: this method does not enumerate the possible worlds.
         '''
         worlds = 1
-        ev = self.evidence_dicti if withevidence else {}
+        ev = self.evidence_dicti() if withevidence else {}
         for var in self.variables:
             worlds *= var.valuecount(ev)
         return worlds
@@ -541,7 +556,7 @@ class MRF(object):
         for ga in sorted(l):
             stream.write(str(ga) + '\n')
 
-    def apply_prob_constraints(self, constraints, method=InferenceMethods.EnumerationAsk, 
+    def apply_prob_constraints(self, constraints, method='EnumerationAsk', 
                                    thr=1.0e-3, steps=20, fittingMCSATSteps=5000, 
                                    fittingParams=None, given=None, queries=None, 
                                    maxThreshold=None, greedy=False, probabilityFittingResultFileName=None, **args):
@@ -550,7 +565,7 @@ class MRF(object):
         modifying weights of the underlying MLN by applying iterative proportional fitting
 
         :param constraints: list of constraints
-        :param method:      one of the inference methods defined in InferenceMethods
+        :param method:      one of the inference methods defined in InferenceMethods (class, id or name)
         inferenceParams:    parameters to pass on to the inference method
         :param given:       if not None, fit parameters of posterior (given the evidence) rather than prior
         :param querie       queries to compute along the way, results for which will be returned
@@ -559,6 +574,7 @@ class MRF(object):
             if not None, then convergence is relaxed, and we stop when the *mean* absolute difference between desired and
             actual probability drops below "threshold" *and* the maximum is below "maxThreshold"
         '''
+        method = InferenceMethods.clazz(method)
         if fittingParams is None:
             fittingParams = {}
         inferenceParams = fittingParams
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+#
+# Markov Logic Networks -- Persistent MRF Cache
+#
+# (C) 2012-2015 by Daniel Nyga
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import hashlib
+import os
+import pickle
+import tempfile
+from io import StringIO
+
+from dnutils import logs
+
+from .util import privatedir
+from ..utils import locs
+
+
+logger = logs.getlogger(__name__)
+
+# bump this whenever the layout of the cached objects changes
+CACHE_FORMAT = 3
+
+
+class GroundingStore(object):
+    """
+    The ground formulas of an MRF obtained from an :class:`MRFCache`. The ground
+    formulas computed by a grounding factory are stored in the encoding of
+    :class:`mln.grounding.default.GroundingCache` in a file of their own, from
+    which they are streamed when they are replayed, so they are never held in
+    memory as a whole.
+
+    :param directory:    the directory of the cache.
+    :param key:          the key of the cache entry of the MRF.
+    """
+
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.key = key
+
+
+    def _path(self, name):
+        return os.path.join(self.directory, '%s.%s.gnd' % (self.key, name))
+
+
+    def __contains__(self, name):
+        return os.path.exists(self._path(name))
+
+
+    def load(self, name):
+        """
+        Iterates over the encoded ground formulas stored under `name`.
+        """
+        privatedir(self.directory)
+        with open(self._path(name), 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+
+    def store(self, name, records):
+        """
+        Stores the encoded ground formulas under `name`. Nothing is stored if
+        any of the ground formulas cannot be encoded, i.e. `records` yields `None`.
+
+        :returns:    `True` if the ground formulas have been stored.
+        """
+        privatedir(self.directory)
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for record in records:
+                    if record is None:
+                        break
+                    pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+                else:
+                    f.close()
+                    os.replace(tmppath, self._path(name))
+                    return True
+        finally:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+        return False
+
+
+class MRFCache(object):
+    """
+    Persistent, content-addressed cache of materialized MLNs and their ground MRFs.
+
+    Entries are keyed by a hash of the MLN text and weights, the database content,
+    and the logic and grammar of the MLN, so an entry is never reused once any of
+    its inputs has changed. An entry consists of the materialized MLN together
+    with the MRF (ground atoms, variables and evidence), the evidence-independent
+    ground formulas computed by the grounding factories while the MRF was in use
+    (see :class:`GroundingStore`), and the sufficient statistics of the learners
+    that have been applied to the MRF (see :meth:`learner`).
+
+    The entries are stored with :mod:`pickle`, so loading them can execute
+    arbitrary code. The cache directory is thus created accessible only by the
+    current user, and directories that other users can write to are refused.
+
+    :param directory:    the directory the cache files are stored in. Defaults
+                         to the ``mrf`` folder in the user's cache directory.
+
+    :Example:
+    >>> cache = MRFCache()
+    >>> mln_, mrf = cache.ground(mln, db)
+    >>> ... # run inference on mrf
+    >>> learner = cache.learner(mrf, BPLL)
+    >>> weights = learner.run()
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.join(locs.user_cache, 'mrf')
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def key(mln, db):
+        """
+        Computes the content hash of the given MLN and database.
+        """
+        sha = hashlib.sha1()
+        def feed(s):
+            sha.update(s.encode('utf-8'))
+            sha.update(b'\0')
+        feed(str(CACHE_FORMAT))
+        feed(type(mln.logic).__name__)
+        feed(type(mln.logic.grammar).__name__)
+        stream = StringIO()
+        mln.write(stream, color=False)
+        feed(stream.getvalue())
+        # the MLN file format truncates the weights
+        feed(repr(list(mln.weights)))
+        feed(repr(sorted([(d, list(v)) for d, v in mln.domains.items()])))
+        stream = StringIO()
+        db.write(stream, color=False, bars=False)
+        feed(stream.getvalue())
+        feed(repr(sorted([(d, list(v)) for d, v in db.domains.items()])))
+        return sha.hexdigest()
+
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, '%s.%s' % (key, ext))
+
+
+    def _dump(self, obj, path):
+        # write to a temporary file first, so concurrent readers never see partial entries
+        privatedir(self.directory)
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmppath, path)
+        except Exception:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+
+    def _load(self, path):
+        if not os.path.exists(path): return None
+        privatedir(self.directory)
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (pickle.UnpicklingError, EOFError) as e:
+            logger.warning('Discarding corrupt cache file %s: %s' % (path, e))
+            os.remove(path)
+            return None
+
+
+    def ground(self, mln, db):
+        """
+        Materializes the MLN with respect to the database and grounds it, or
+        restores both from the cache.
+
+        :returns:    a pair of the materialized MLN and the ground MRF.
+        """
+        key = MRFCache.key(mln, db)
+        entry = self._load(self._path(key, 'mrf'))
+        if entry is not None:
+            self.hits += 1
+            logger.debug('MRF cache hit: %s' % key)
+            mln_, mrf = entry
+        else:
+            self.misses += 1
+            logger.debug('MRF cache miss: %s' % key)
+            mln_ = mln.materialize(db)
+            mrf = mln_.ground(db)
+            self._dump((mln_, mrf), self._path(key, 'mrf'))
+        mrf._cachekey = key
+        mrf.groundings = GroundingStore(self.directory, key)
+        return mln_, mrf
+
+
+    def learner(self, mrf, method, **params):
+        """
+        Creates a learner of the given method for an MRF obtained from :meth:`ground`
+        and restores its sufficient statistics from the cache, or computes and
+        stores them. Learners whose statistics are not deterministic (see
+        :attr:`mln.learning.common.AbstractLearner.STATISTICS`) are returned as is.
+        """
+        from .learning.incremental import IncrementalLearner
+        learner = method(mrf, **params)
+        if not learner.STATISTICS: return learner
+        sha = hashlib.sha1()
+        sha.update(mrf._cachekey.encode('utf-8'))
+        sha.update(('%s.%s' % (method.__module__, method.__name__)).encode('utf-8'))
+        sha.update(repr(sorted([(k, repr(v)) for k, v in params.items() if k not in IncrementalLearner.OPTPARAMS])).encode('utf-8'))
+        path = self._path(sha.hexdigest(), 'stat')
+        stat = self._load(path)
+        if stat is not None:
+            self.hits += 1
+            logger.debug('statistics cache hit: %s' % path)
+            learner.__dict__.update(stat)
+        else:
+            self.misses += 1
+            learner._prepare()
+            self._dump(dict([(a, getattr(learner, a)) for a in learner.STATISTICS]), path)
+        learner._prepared = True
+        return learner
+
+
+    def clear(self):
+        """
+        Removes all entries from the cache.
+        """
+        if not os.path.exists(self.directory): return
+        for fname in os.listdir(self.directory):
+            if fname.endswith('.mrf') or fname.endswith('.gnd') or fname.endswith('.stat'):
+                os.remove(os.path.join(self.directory, fname))
@@ -48,7 +48,7 @@ class MRFVariable(object):
         """
         self.mrf = mrf
         self.gndatoms = list(gndatoms)
-        self.idx = len(mrf.variables)
+        self.idx = len(mrf._variables)
         self.name = name
         self.predicate = predicate
     
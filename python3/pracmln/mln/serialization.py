@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+#
+# Markov Logic Networks -- Binary Serialization
+#
+# (C) 2012-2015 by Daniel Nyga
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Binary file format for MLNs and databases.
+
+A binary file starts with the magic bytes :data:`MAGIC` followed by a header
+holding the format version and the kind of the file (``'mln'`` or ``'db'``).
+The files consist of length-prefixed JSON documents and NumPy arrays in the
+``.npy`` format, which are read without unpickling, so loading a file never
+executes code and does not depend on the layout of the classes of this package.
+
+An MLN file contains the predicates, the domains and the parsed formulas of an
+MLN in a single document. The formulas are stored as nested lists (see
+:func:`encode_formula`), in which all strings are ids in the symbol table of the
+file, so loading them does not involve the grammar.
+
+A database file contains one record per database, which can be read one after
+another. All strings (predicate names, domain names and constants) are interned
+in a symbol table that is shared by all databases in the file; every record only
+holds the symbols that have not occurred in the records before. The domains and
+the evidence of a database are stored as arrays of symbol ids, and the truth
+values as an array of floats.
+"""
+import json
+import struct
+
+import numpy
+
+from .errors import NoSuchPredicateError
+from .mlnpreds import Predicate, FuzzyPredicate, FunctionalPredicate, SoftFunctionalPredicate
+
+MAGIC = b'\x93PRACMLN'
+
+# bump this whenever the layout of the files changes
+BINARY_FORMAT = 2
+
+# the predicate types by their names in the files
+PREDICATES = dict([(p.__name__, p) for p in (Predicate, FuzzyPredicate, FunctionalPredicate, SoftFunctionalPredicate)])
+
+# the formula types that are stored by their children
+COMPLEX = ('Conjunction', 'Disjunction', 'Implication', 'Biimplication', 'Negation')
+
+
+def write_document(stream, doc):
+    data = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+    stream.write(struct.pack('<Q', len(data)))
+    stream.write(data)
+
+
+def read_document(stream):
+    """
+    Reads a JSON document from the binary stream.
+
+    :raises EOFError:    if the end of the stream has been reached.
+    """
+    size = stream.read(8)
+    if not size:
+        raise EOFError()
+    if len(size) != 8:
+        raise Exception('Truncated binary file: %s' % getattr(stream, 'name', stream))
+    size, = struct.unpack('<Q', size)
+    data = stream.read(size)
+    if len(data) != size:
+        raise Exception('Truncated binary file: %s' % getattr(stream, 'name', stream))
+    return json.loads(data.decode('utf-8'))
+
+
+def write_array(stream, array):
+    numpy.save(stream, array, allow_pickle=False)
+
+
+def read_array(stream):
+    return numpy.load(stream, allow_pickle=False)
+
+
+def write_header(stream, kind):
+    stream.write(MAGIC)
+    write_document(stream, {'format': BINARY_FORMAT, 'kind': kind})
+
+
+def read_header(stream, kind):
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise Exception('Not a binary MLN/database file: %s' % getattr(stream, 'name', stream))
+    header = read_document(stream)
+    if not isinstance(header, dict) or header.get('format') != BINARY_FORMAT:
+        raise Exception('Unsupported binary format: %s' % (header.get('format') if isinstance(header, dict) else header))
+    if header.get('kind') != kind:
+        raise Exception('Expected a binary %s file, got a %s file.' % (kind, header.get('kind')))
+    return header
+
+
+class SymbolTable(object):
+    """
+    Interns strings as consecutive integer ids.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.symbols = []
+
+    def __call__(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.symbols)
+            self.symbols.append(s)
+        return i
+
+
+def encode_formula(f, intern):
+    """
+    Encodes a formula (template) as nested lists, whose first element is the
+    name of the formula type. All strings are replaced by their ids given by `intern`.
+    """
+    name = type(f).__name__
+    if name in ('Lit', 'LitGroup'):
+        return [name, f.negated, intern(f.predname), [intern(a) for a in f.args]]
+    elif name == 'Equality':
+        return [name, f.negated, [intern(a) for a in f.args]]
+    elif name == 'TrueFalse':
+        return [name, f.value]
+    elif name == 'Exist':
+        return [name, [intern(v) for v in f.vars], encode_formula(f.formula, intern)]
+    elif name in COMPLEX:
+        return [name, [encode_formula(c, intern) for c in f.children]]
+    raise Exception('Formulas of type %s cannot be stored in the binary format.' % name)
+
+
+def decode_formula(code, symbols, mln, idx=None):
+    """
+    Creates the formula given by its encoding (see :func:`encode_formula`) in the logic of `mln`.
+    """
+    logic = mln.logic
+    name = code[0]
+    if name == 'Lit':
+        return logic.lit(code[1], symbols[code[2]], [symbols[a] for a in code[3]], mln=mln, idx=idx)
+    elif name == 'LitGroup':
+        return logic.litgroup(code[1], symbols[code[2]], [symbols[a] for a in code[3]], mln=mln, idx=idx)
+    elif name == 'Equality':
+        return logic.equality([symbols[a] for a in code[2]], code[1], mln=mln, idx=idx)
+    elif name == 'TrueFalse':
+        return logic.true_false(code[1], mln=mln, idx=idx)
+    elif name == 'Exist':
+        return logic.exist([symbols[v] for v in code[1]], decode_formula(code[2], symbols, mln), mln=mln, idx=idx)
+    elif name in COMPLEX:
+        return getattr(logic, name.lower())([decode_formula(c, symbols, mln) for c in code[1]], mln=mln, idx=idx)
+    raise Exception('Unknown formula type in binary file: %s' % name)
+
+
+def _weight(w):
+    # weights are either numbers or mathematical expressions
+    return w if isinstance(w, str) else float(w)
+
+
+def dump_mln(mln, stream):
+    """
+    Writes the given MLN to the binary stream.
+    """
+    write_header(stream, 'mln')
+    intern = SymbolTable()
+    predicates = []
+    for pred in mln.iterpreds():
+        if type(pred).__name__ not in PREDICATES:
+            raise Exception('Predicates of type %s cannot be stored in the binary format.' % type(pred).__name__)
+        predicates.append([type(pred).__name__, intern(pred.name), [intern(d) for d in pred.argdoms],
+                           getattr(pred, 'mutex', None)])
+    doc = {'logic': type(mln.logic).__name__,
+           'grammar': type(mln.logic.grammar).__name__,
+           'predicates': predicates,
+           'domains': [[intern(d), [intern(v) for v in values]] for d, values in mln.domains.items()],
+           'domain_decls': list(mln.domain_decls),
+           'vars': dict(mln.vars),
+           'formulas': [encode_formula(f, intern) for f in mln.formulas],
+           'weights': [_weight(w) for w in mln.weights],
+           'fixweights': [bool(w) for w in mln.fixweights],
+           'unique_templvars': [list(v) for v in mln._unique_templvars],
+           'probreqs': [[type(r).__name__, encode_formula(r.formula, intern), r.p] for r in mln.probreqs],
+           'fuzzypreds': list(mln.fuzzypreds),
+           'materialized': mln._materialized}
+    doc['symbols'] = intern.symbols
+    write_document(stream, doc)
+
+
+def load_mln(stream, mln=None):
+    """
+    Reads an MLN from the binary stream. If `mln` is given, the predicates, domains
+    and formulas are added to it, otherwise a new MLN is created with the logic and
+    grammar the MLN has been saved with.
+    """
+    from .base import MLN
+    read_header(stream, 'mln')
+    doc = read_document(stream)
+    symbols = doc['symbols']
+    if mln is None:
+        mln = MLN(logic=doc['logic'], grammar=doc['grammar'])
+    for kind, name, argdoms, mutex in doc['predicates']:
+        clazz = PREDICATES.get(kind)
+        if clazz is None:
+            raise Exception('Unknown predicate type in binary file: %s' % kind)
+        argdoms = [symbols[d] for d in argdoms]
+        if issubclass(clazz, FunctionalPredicate):
+            mln.predicate(clazz(symbols[name], argdoms, mutex))
+        else:
+            mln.predicate(clazz(symbols[name], argdoms))
+    mln.domain_decls.extend(doc['domain_decls'])
+    for code, weight, fixweight, templvars in zip(doc['formulas'], doc['weights'], doc['fixweights'], doc['unique_templvars']):
+        mln.formula(decode_formula(code, symbols, mln), weight=weight, fixweight=fixweight, unique_templvars=templvars)
+    for kind, code, p in doc['probreqs']:
+        f = decode_formula(code, symbols, mln)
+        if kind == 'PriorConstraint':
+            mln.prior(f, p)
+        elif kind == 'PosteriorConstraint':
+            mln.posterior(f, p)
+        else:
+            raise Exception('Unknown probability constraint in binary file: %s' % kind)
+    # restore the domains in the order they have been saved with
+    for d, values in doc['domains']:
+        mln.domains[symbols[d]] = [symbols[v] for v in values]
+    mln.vars.update(doc['vars'])
+    mln.fuzzypreds.extend([p for p in doc['fuzzypreds'] if p not in mln.fuzzypreds])
+    mln._materialized = doc['materialized']
+    return mln
+
+
+class DatabaseWriter(object):
+    """
+    Writes the records of databases to a binary stream.
+
+    :param stream:    a binary stream, whose header has already been written.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._intern = SymbolTable()
+
+    def write(self, domains, atoms):
+        """
+        Writes the record of a database.
+
+        :param domains:    dict mapping the domain names to their lists of values.
+        :param atoms:      iterable of (predicate name, arguments, truth value) triples.
+        """
+        intern = self._intern
+        known = len(intern.symbols)
+        domains_ = [(intern(d), [intern(v) for v in values]) for d, values in domains.items()]
+        preds, arities, args, truths = [], [], [], []
+        for predname, args_, truth in atoms:
+            preds.append(intern(predname))
+            arities.append(len(args_))
+            args.extend([intern(a) for a in args_])
+            truths.append(truth)
+        write_document(self.stream, {'symbols': intern.symbols[known:],
+                                     'domains': [[d, len(values)] for d, values in domains_]})
+        write_array(self.stream, numpy.array([v for _, values in domains_ for v in values], dtype=numpy.int32))
+        write_array(self.stream, numpy.array(preds, dtype=numpy.int32))
+        write_array(self.stream, numpy.array(arities, dtype=numpy.int32))
+        write_array(self.stream, numpy.array(args, dtype=numpy.int32))
+        write_array(self.stream, numpy.array(truths, dtype=numpy.float64))
+
+
+def iterdbrecords(stream, mln, ignore_unknown_preds=False):
+    """
+    Reads the records of the databases from a binary stream one by one.
+
+    :param mln:                     the MLN the databases are loaded for.
+    :param ignore_unknown_preds:    if `True`, atoms of predicates that are not
+                                    declared in `mln` are skipped, otherwise a
+                                    :class:`mln.errors.NoSuchPredicateError` is raised.
+    :returns:    a generator of (domains, evidence) pairs, where `domains` maps the
+                 domain names to the lists of their values and `evidence` maps
+                 ground atom strings to their truth values.
+    """
+    symbols = []
+    known = {}
+    while True:
+        try:
+            record = read_document(stream)
+        except EOFError:
+            return
+        values, preds, arities, args, truths_ = [read_array(stream).tolist() for _ in range(5)]
+        symbols.extend(record['symbols'])
+        domains = {}
+        i = 0
+        for d, n in record['domains']:
+            domains[symbols[d]] = [symbols[v] for v in values[i:i + n]]
+            i += n
+        atoms = []
+        i = 0
+        truths = []
+        for p, n, truth in zip(preds, arities, truths_):
+            if p not in known:
+                known[p] = mln.predicate(symbols[p]) is not None
+                if not known[p] and not ignore_unknown_preds:
+                    raise NoSuchPredicateError('Predicate %s is undefined.' % symbols[p])
+            if known[p]:
+                atoms.append('%s(%s)' % (symbols[p], ','.join([symbols[a] for a in args[i:i + n]])))
+                truths.append(truth)
+            i += n
+        yield domains, dict(zip(atoms, truths))
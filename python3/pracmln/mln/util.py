@@ -24,6 +24,7 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import os
 import re
 import time
 import logging
@@ -349,12 +350,13 @@ class StopWatchTag:
 
 class StopWatch(object):
     '''
-    Simple tagging of time spans.
+    Simple tagging of time spans and counting of events.
     '''
     
     
     def __init__(self):
         self.tags = {}
+        self.counters = {}
     
         
     def tag(self, label, verbose=True):
@@ -381,12 +383,21 @@ class StopWatch(object):
             tag.stoptime = now
 
     
+    def count(self, label, n=1):
+        '''
+        Increments the event counter with the given label. Counters are
+        kept apart from the timed tags.
+        '''
+        self.counters[label] = self.counters.get(label, 0) + n
+        
+    
     def __getitem__(self, key):
         return self.tags.get(key)
 
     
     def reset(self):
         self.tags = {}
+        self.counters = {}
 
         
     def printSteps(self):
@@ -395,6 +406,8 @@ class StopWatch(object):
                 print('{} took {}'.format(colorize(tag.label, (None, None, True), True), elapsed_time_str(tag.elapsedtime)))
             else:
                 print('{} is running for {} now...'.format(colorize(tag.label, (None, None, True), True), elapsed_time_str(tag.elapsedtime)))
+        for label, count in sorted(self.counters.items()):
+            print('{}: {}'.format(colorize(label, (None, None, True), True), count))
 
 
 def combinations(domains):
@@ -485,6 +498,23 @@ def item(s):
     for it in s: break
     return it
 
+def privatedir(path):
+    '''
+    Creates the directory `path` accessible only by the current user, or checks
+    that the existing directory is owned by the current user and cannot be written
+    by anyone else. Files that are unpickled from a directory must only be
+    writable by the user who loads them, since unpickling can execute code.
+    
+    :returns:    the path of the directory.
+    '''
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        stat = os.stat(path)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+            raise Exception('Refusing to use the directory %s, which is not owned by the current user or writable by others.' % path)
+    return path
+
+
 class temporary_evidence:
     '''
     Context guard class for enabling convenient handling of temporary evidence in
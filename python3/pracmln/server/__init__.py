@@ -0,0 +1,25 @@
+# The names are resolved lazily, such that the client does not need to
+# import the inference engines (see pracmln/__init__.py).
+import importlib
+
+
+_LAZY = {
+    'MLNServer': '.server',
+    'Metrics': '.server',
+    'ModelNotFoundError': '.server',
+    'RequestError': '.server',
+    'MLNClient': '.client',
+    'MLNServerError': '.client',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
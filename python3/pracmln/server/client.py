@@ -0,0 +1,193 @@
+# MLN Inference Server -- Client
+#
+# (C) 2012-2015 by Daniel Nyga (nyga@cs.uni-bremen.edu)
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import http.client
+import json
+import os
+import socket
+from urllib.parse import quote
+
+
+DEFAULT_ADDRESS = '127.0.0.1:8642'
+
+
+class MLNServerError(Exception):
+    '''
+    An error reported by the server, along with the HTTP status code.
+    '''
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class MLNClient(object):
+    '''
+    Blocking client of an :class:`MLNServer`, which keeps its connection
+    to the server open. A client must not be shared among threads.
+
+    :param address:    either ``host:port`` or the path of a Unix socket.
+    :param timeout:    the timeout of the socket operations in seconds.
+
+    :Example:
+    >>> client = MLNClient('/tmp/mln.sock')
+    >>> client.load('smokers', mlnfile='smokers.mln', dbfile='smokers.db')
+    >>> client.query('smokers', 'Cancer', evidence=['Smokes(Ann)', '!Friends(Ann,Bob)'])
+    {'Cancer(Ann)': 0.83, 'Cancer(Bob)': 0.41}
+    '''
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=None):
+        self.address = address
+        self.timeout = timeout
+        self._conn = None
+
+
+    def _connect(self):
+        if os.path.sep in self.address or self.address.startswith('unix:'):
+            path = self.address[5:] if self.address.startswith('unix:') else self.address
+            return _UnixConnection(path, timeout=self.timeout)
+        host, port = self.address.rsplit(':', 1)
+        return http.client.HTTPConnection(host, int(port), timeout=self.timeout)
+
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'}
+        for retry in (True, False):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.request(method, path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the server has closed the idle connection
+                self.close()
+                if not retry:
+                    raise
+            except Exception:
+                self.close()
+                raise
+        result = json.loads(data.decode('utf-8'))
+        if response.status != 200:
+            raise MLNServerError(response.status, result.get('error'))
+        return result
+
+
+    def load(self, name, mln=None, mlnfile=None, db=None, dbfile=None, **spec):
+        '''
+        Loads a model into the server. The files are read by the client. See
+        :meth:`MLNServer.load` for the arguments.
+        '''
+        if mlnfile is not None:
+            with open(mlnfile) as f:
+                mln = f.read()
+        if dbfile is not None:
+            with open(dbfile) as f:
+                db = f.read()
+        spec.update({'mln': mln, 'db': db})
+        return self._request('PUT', '/models/%s' % quote(name, safe=''), spec)
+
+
+    def unload(self, name):
+        self._request('DELETE', '/models/%s' % quote(name, safe=''))
+
+
+    def models(self):
+        return self._request('GET', '/models')
+
+
+    def query(self, name, queries=None, evidence=None, retract=None, method=None, **params):
+        '''
+        Runs a query against the model `name` and returns the dict mapping the ground
+        queries to their probabilities. See :meth:`MLNServer.query` for the arguments;
+        additional keyword arguments are passed to the inference method.
+        '''
+        return self._request('POST', '/models/%s/query' % quote(name, safe=''),
+                             {'queries': queries, 'evidence': evidence, 'retract': retract,
+                              'method': method, 'params': params})['results']
+
+
+    def metrics(self):
+        return self._request('GET', '/metrics')
+
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def main():
+    usage = 'PRACMLN Inference Server Client'
+
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("-a", "--address", dest="address", default=DEFAULT_ADDRESS, help="host:port or the Unix socket of the server (default: %s)" % DEFAULT_ADDRESS)
+    parser.add_argument("-n", "--name", dest="name", default='default', help="the name of the model")
+    parser.add_argument("-i", "--mln", dest="mlnarg", help="the MLN model file to load before querying")
+    parser.add_argument("-e", "--evidence", dest="dbarg", help="the base evidence database file of the model")
+    parser.add_argument("-q", "--queries", dest="queryarg", default=None, help="queries (comma-separated)")
+    parser.add_argument("-l", "--literal", dest="literals", action="append", default=[], help="an evidence literal to add to the base evidence (repeatable)")
+    parser.add_argument("-r", "--retract", dest="retract", action="append", default=[], help="a ground atom to remove from the base evidence (repeatable)")
+    parser.add_argument("-m", "--method", dest="method", default=None, help="the inference method")
+    parser.add_argument("--metrics", dest="metrics", action="store_true", default=False, help="print the metrics of the server")
+
+    args = parser.parse_args()
+
+    with MLNClient(args.address) as client:
+        if args.mlnarg is not None:
+            client.load(args.name, mlnfile=args.mlnarg, dbfile=args.dbarg)
+        if args.queryarg is not None or args.literals or args.retract:
+            results = client.query(args.name, args.queryarg, evidence=args.literals or None,
+                                   retract=args.retract or None, method=args.method)
+            for atom, p in sorted(results.items(), key=lambda a_p: (-a_p[1], a_p[0])):
+                print('%.3f  %s' % (p, atom))
+        if args.metrics:
+            print(json.dumps(client.metrics(), indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
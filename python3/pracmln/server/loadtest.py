@@ -0,0 +1,178 @@
+# MLN Inference Server -- Load Test
+#
+# (C) 2012-2015 by Daniel Nyga (nyga@cs.uni-bremen.edu)
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from .client import MLNClient, MLNServerError
+
+
+@contextmanager
+def spawn(workers=None, batchsize=32, batchwindow=2., timeout=60.):
+    '''
+    Starts a server in a subprocess listening on a Unix socket in a temporary
+    directory and yields the path of the socket once the server is ready.
+
+    :param batchwindow:    the batch window in milliseconds.
+    '''
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'mln.sock')
+    cmd = [sys.executable, '-m', 'pracmln.server', '--socket', path,
+           '--batch-size', str(batchsize), '--batch-window', str(batchwindow)]
+    if workers is not None:
+        cmd += ['--workers', str(workers)]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+    process = subprocess.Popen(cmd, env=env)
+    try:
+        client = MLNClient(path)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                client.metrics()
+                break
+            except OSError:
+                if process.poll() is not None or time.time() > deadline:
+                    raise Exception('Server did not start.')
+                time.sleep(.1)
+        client.close()
+        yield path
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(directory)
+
+
+def loadtest(address, name, requests=200, concurrency=8, queries=None, vary=None, method=None, params=None, seed=0):
+    '''
+    Sends `requests` queries against the model `name` from `concurrency` threads,
+    each of which has its own connection and sends its next request as soon as
+    the reply to the previous one has arrived.
+
+    :param vary:       list of ground atoms, which are asserted as evidence with
+                       random truth values, such that the requests differ in their
+                       evidence. If empty, all requests have the same evidence.
+    :returns:          dict of the number of requests and errors, the total time,
+                       the throughput and the latency statistics as seen by the clients.
+    '''
+    rnd = random.Random(seed)
+    evidence = [[('' if rnd.random() < .5 else '!') + atom for atom in vary] if vary else None
+                for _ in range(requests)]
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+    def run():
+        with MLNClient(address) as client:
+            while True:
+                with lock:
+                    i = next(counter)
+                if i >= requests:
+                    break
+                start = time.time()
+                try:
+                    client.query(name, queries, evidence=evidence[i], method=method, **(params or {}))
+                except MLNServerError as e:
+                    errors.append(str(e))
+                latencies.append(time.time() - start)
+    threads = [threading.Thread(target=run) for _ in range(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    secs = time.time() - start
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    return {'requests': len(latencies), 'errors': len(errors), 'seconds': secs,
+            'throughput': len(latencies) / secs,
+            'latency': {'mean': sum(latencies) / len(latencies), 'p50': percentile(.5),
+                        'p90': percentile(.9), 'p99': percentile(.99), 'max': latencies[-1]}}
+
+
+def _report(stats, metrics):
+    print('requests:     %d (%d errors) in %.2f s' % (stats['requests'], stats['errors'], stats['seconds']))
+    print('throughput:   %.1f requests/s' % stats['throughput'])
+    print('latency:      mean %.1f ms, p50 %.1f ms, p90 %.1f ms, p99 %.1f ms, max %.1f ms' %
+          tuple([stats['latency'][k] * 1000. for k in ('mean', 'p50', 'p90', 'p99', 'max')]))
+    print('server:       %d batches (mean size %.1f), %d inference runs, %.1f ms worker time per batch' %
+          (metrics['batches'], metrics['mean_batchsize'] or 0, metrics['inferences'], (metrics['mean_worktime'] or 0) * 1000.))
+
+
+def main():
+    usage = 'PRACMLN Inference Server Load Test'
+
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("-a", "--address", dest="address", default=None, help="host:port or the Unix socket of a running server. If not given, a server is started.")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, default=None, help="the number of worker processes of the started server")
+    parser.add_argument("-b", "--batch-size", dest="batchsize", type=int, default=32, help="the maximal batch size of the started server")
+    parser.add_argument("-n", "--name", dest="name", default='default', help="the name of the model")
+    parser.add_argument("-i", "--mln", dest="mlnarg", help="the MLN model file to load")
+    parser.add_argument("-e", "--evidence", dest="dbarg", help="the base evidence database file of the model")
+    parser.add_argument("--logic", dest="logic", default='FirstOrderLogic', help="the logic of the model")
+    parser.add_argument("--grammar", dest="grammar", default='PRACGrammar', help="the grammar of the model")
+    parser.add_argument("-q", "--queries", dest="queryarg", default=None, help="queries (comma-separated)")
+    parser.add_argument("-m", "--method", dest="method", default=None, help="the inference method")
+    parser.add_argument("-P", "--param", dest="params", action="append", default=[], help="a parameter key=value of the inference method (repeatable)")
+    parser.add_argument("--vary", dest="vary", action="append", default=[], help="a ground atom asserted with random truth values (repeatable)")
+    parser.add_argument("-r", "--requests", dest="requests", type=int, default=200, help="the number of requests")
+    parser.add_argument("-c", "--concurrency", dest="concurrency", type=int, default=8, help="the number of concurrent clients")
+
+    args = parser.parse_args()
+    params = {}
+    for p in args.params:
+        key, value = p.split('=', 1)
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+
+    def test(address):
+        with MLNClient(address) as client:
+            if args.mlnarg is not None:
+                client.load(args.name, mlnfile=args.mlnarg, dbfile=args.dbarg, logic=args.logic, grammar=args.grammar)
+            stats = loadtest(address, args.name, requests=args.requests, concurrency=args.concurrency, queries=args.queryarg,
+                             vary=args.vary, method=args.method, params=params)
+            _report(stats, client.metrics())
+
+    if args.address is not None:
+        test(args.address)
+    else:
+        with spawn(workers=args.workers, batchsize=args.batchsize) as path:
+            test(path)
+
+
+if __name__ == '__main__':
+    main()
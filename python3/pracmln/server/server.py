@@ -0,0 +1,470 @@
+# MLN Inference Server
+#
+# (C) 2012-2015 by Daniel Nyga (nyga@cs.uni-bremen.edu)
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from multiprocessing import cpu_count
+from urllib.parse import urlsplit, unquote
+
+from dnutils import logs, ifnone
+
+from . import worker
+from ..utils.project import mlnpath
+
+
+logger = logs.getlogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+
+
+class ModelNotFoundError(Exception): pass
+class RequestError(Exception): pass
+
+
+class Metrics(object):
+    '''
+    Latency and throughput statistics of an :class:`MLNServer`.
+
+    Latencies are measured from the arrival of a request until its reply is
+    available, i.e. they include the time spent in the queue of the model.
+    The percentiles and the recent throughput are computed over the
+    requests of the last `window` seconds.
+
+    :param window:     the length of the sliding window in seconds.
+    :param samples:    the maximal number of latencies kept in the window.
+    '''
+
+    def __init__(self, window=60., samples=10000):
+        self.window = window
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched = 0
+        self.inferences = 0
+        self.worktime = 0.
+        self.models = {}
+        self._latencies = deque(maxlen=samples)
+
+
+    def request(self, model, latency, error=False):
+        now = time.time()
+        self.requests += 1
+        self._latencies.append((now, latency))
+        stats = self.models.setdefault(model, {'requests': 0, 'errors': 0, 'batches': 0})
+        stats['requests'] += 1
+        if error:
+            self.errors += 1
+            stats['errors'] += 1
+
+
+    def batch(self, model, size, inferences, worktime):
+        self.batches += 1
+        self.batched += size
+        self.inferences += inferences
+        self.worktime += worktime
+        self.models.setdefault(model, {'requests': 0, 'errors': 0, 'batches': 0})['batches'] += 1
+
+
+    def snapshot(self, queued=0):
+        '''
+        Returns a dict of the current statistics.
+        '''
+        now = time.time()
+        while self._latencies and self._latencies[0][0] < now - self.window:
+            self._latencies.popleft()
+        latencies = sorted([l for _, l in self._latencies])
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+        uptime = now - self.started
+        return {'uptime': uptime,
+                'requests': self.requests,
+                'errors': self.errors,
+                'queued': queued,
+                'batches': self.batches,
+                'inferences': self.inferences,
+                'mean_batchsize': self.batched / self.batches if self.batches else None,
+                'mean_worktime': self.worktime / self.batches if self.batches else None,
+                'throughput': {'total': self.requests / uptime if uptime else 0.,
+                               'recent': len(latencies) / min(uptime, self.window) if uptime else 0.},
+                'latency': {'mean': sum(latencies) / len(latencies) if latencies else None,
+                            'p50': percentile(.5),
+                            'p90': percentile(.9),
+                            'p99': percentile(.99),
+                            'max': latencies[-1] if latencies else None},
+                'models': dict([(m, dict(s)) for m, s in self.models.items()])}
+
+
+class MLNServer(object):
+    '''
+    Long-running inference server, which keeps parsed and materialized MLNs
+    resident in a pool of worker processes and answers queries against them
+    given deltas of their evidence.
+
+    Concurrent requests against the same model are collected into batches,
+    which are dispatched to the workers as a whole. A batch is closed if it
+    has reached `batchsize` requests, or `batchwindow` seconds after it has been
+    opened, but not before a worker is available, such that the batches grow
+    with the load. Within a batch, requests with the same evidence share the
+    grounding and the inference run (see :meth:`worker.ResidentModel.run`).
+
+    The server speaks JSON over HTTP/1.1, on a TCP port or a Unix socket:
+
+    ==========================  ========  ============================================
+    ``/models``                 GET       the loaded models
+    ``/models/<name>``          PUT       load a model (see :meth:`load`)
+    ``/models/<name>``          DELETE    unload a model
+    ``/models/<name>/query``    POST      run a query (see :meth:`query`)
+    ``/metrics``                GET       latency and throughput statistics
+    ==========================  ========  ============================================
+
+    :param workers:        the number of worker processes. Defaults to the number of CPUs.
+                           If 0, inference runs in a thread of the server process.
+    :param batchsize:      the maximal number of requests per batch.
+    :param batchwindow:    the maximal time in seconds a batch is kept open for
+                           further requests once a worker is available.
+    '''
+
+    def __init__(self, workers=None, batchsize=32, batchwindow=.002):
+        self.workers = ifnone(workers, cpu_count())
+        self.batchsize = batchsize
+        self.batchwindow = batchwindow
+        self.metrics = Metrics()
+        self._models = {}
+        self._queues = {}
+        self._batchers = {}
+        self._versions = itertools.count()
+        self._executor = None
+        self._slots = None
+        self._servers = []
+        self._connections = {}
+
+
+    def _start_executor(self):
+        if self._executor is None:
+            if self.workers:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                # the resident models are not thread-safe
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            self._slots = asyncio.Semaphore(max(1, self.workers))
+        return self._executor
+
+
+    async def _execute(self, f, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._start_executor(), f, *args)
+
+
+    def models(self):
+        '''
+        Returns a dict mapping the names of the loaded models to their summaries.
+        '''
+        return dict([(name, dict(m['summary'])) for name, m in self._models.items()])
+
+
+    async def load(self, name, mln, db=None, logic='FirstOrderLogic', grammar='PRACGrammar', method=None,
+                   params=None, ignore_unknown_preds=False):
+        '''
+        Loads a model, replacing the model of the same name if existent.
+
+        Models are only given by their contents, such that clients cannot make the
+        server read its files. Files are read by the client (see :meth:`client.MLNClient.load`),
+        or by :func:`main` for the model given on the command line.
+
+        :param name:       the name of the model.
+        :param mln:        the content of the MLN file.
+        :param db:         the content of the database holding the base evidence of the model.
+                           Queries specify deltas to this evidence.
+        :param method:     the default inference method of queries (id or name).
+        :param params:     dict of default parameters of the inference method.
+        :returns:          a summary of the model.
+        '''
+        if not isinstance(mln, str) or (db is not None and not isinstance(db, str)):
+            raise RequestError('The MLN and the database must be given by their contents.')
+        spec = {'mln': mln, 'db': db, 'logic': logic, 'grammar': grammar, 'method': method,
+                'params': dict(params or {}), 'ignore_unknown_preds': ignore_unknown_preds}
+        version = next(self._versions)
+        try:
+            summary = await self._execute(worker.load, name, version, spec)
+        except Exception as e:
+            raise RequestError('Cannot load model %s: %s' % (name, e))
+        self._models[name] = {'version': version, 'spec': spec, 'summary': summary}
+        if name not in self._queues:
+            self._queues[name] = asyncio.Queue()
+            self._batchers[name] = asyncio.ensure_future(self._batches(name))
+        logger.info('loaded model %s' % name)
+        return summary
+
+
+    async def unload(self, name):
+        if name not in self._models:
+            raise ModelNotFoundError('No such model: %s' % name)
+        del self._models[name]
+        self._batchers.pop(name).cancel()
+        queue = self._queues.pop(name)
+        while not queue.empty():
+            _, future, _ = queue.get_nowait()
+            future.set_exception(ModelNotFoundError('Model %s has been unloaded.' % name))
+        logger.info('unloaded model %s' % name)
+
+
+    async def query(self, name, queries=None, evidence=None, retract=None, method=None, params=None):
+        '''
+        Runs inference on the model `name`.
+
+        :param queries:    list of queries or a string of comma-separated queries, i.e. formulas
+                           or predicate names. If empty, all unknown ground atoms are queried.
+        :param evidence:   list of ground literals (e.g. ``'!Cancer(Ann)'``) or pairs of a
+                           ground atom and its truth value, which are added to the base evidence.
+        :param retract:    list of ground atoms, whose evidence is removed from the base evidence.
+        :param method:     the inference method (id or name).
+        :param params:     dict of parameters of the inference method.
+        :returns:          dict with the `results`, mapping the ground queries to their
+                           probabilities, and the number of requests the inference run
+                           has been `shared` by.
+        '''
+        if name not in self._queues:
+            raise ModelNotFoundError('No such model: %s' % name)
+        request = {'queries': queries, 'evidence': evidence, 'retract': retract,
+                   'method': method, 'params': params}
+        future = asyncio.get_running_loop().create_future()
+        start = time.time()
+        self._queues[name].put_nowait((request, future, start))
+        try:
+            reply = await future
+        except Exception:
+            self.metrics.request(name, time.time() - start, error=True)
+            raise
+        self.metrics.request(name, time.time() - start, error=reply[0] != 'ok')
+        if reply[0] != 'ok':
+            raise RequestError(reply[1])
+        return {'results': reply[1], 'shared': reply[2]}
+
+
+    async def _batches(self, name):
+        loop = asyncio.get_running_loop()
+        queue = self._queues[name]
+        while True:
+            batch = [await queue.get()]
+            await self._slots.acquire()
+            # everything that has queued up while waiting for a worker joins the batch
+            deadline = loop.time() + self.batchwindow
+            while len(batch) < self.batchsize:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(queue.get_nowait())
+            asyncio.ensure_future(self._dispatch(name, batch))
+
+
+    async def _dispatch(self, name, batch):
+        try:
+            model = self._models.get(name)
+            if model is None:
+                raise ModelNotFoundError('Model %s has been unloaded.' % name)
+            requests = [request for request, _, _ in batch]
+            names = list(self._models)
+            # the model is only shipped to workers that do not have it yet
+            result = await self._execute(worker.process, name, model['version'], None, requests, names)
+            if result is None:
+                result = await self._execute(worker.process, name, model['version'], model['spec'], requests, names)
+            replies, worktime = result
+            # a reply shared by k requests accounts for 1/k of an inference run
+            inferences = int(round(sum([1. / r[2] for r in replies if r[0] == 'ok'])))
+            self.metrics.batch(name, len(batch), inferences, worktime)
+            for (_, future, _), reply in zip(batch, replies):
+                if not future.done():
+                    future.set_result(reply)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+
+    async def start(self, host=None, port=None, path=None):
+        '''
+        Starts serving on the given TCP address and/or Unix socket.
+        '''
+        # create the worker processes before any sockets are opened
+        await self._execute(os.getpid)
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            self._servers.append(await asyncio.start_unix_server(self._handle, path=path))
+            logger.info('serving on %s' % path)
+        if port is not None or path is None:
+            server = await asyncio.start_server(self._handle, ifnone(host, DEFAULT_HOST), ifnone(port, DEFAULT_PORT))
+            self._servers.append(server)
+            logger.info('serving on %s:%d' % server.sockets[0].getsockname()[:2])
+        return self._servers
+
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        # let the handlers of open connections terminate regularly
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        for name in list(self._models):
+            await self.unload(name)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+    def run(self, host=None, port=None, path=None, models=None):
+        '''
+        Runs the server until interrupted.
+
+        :param models:    dict mapping model names to the keyword arguments
+                          of :meth:`load` for the models to be loaded at startup.
+        '''
+        async def serve():
+            for name, spec in (models or {}).items():
+                await self.load(name, **spec)
+            await self.start(host, port, path)
+            stop = asyncio.Event()
+            # shut down the worker processes on termination
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+            try:
+                await stop.wait()
+            finally:
+                await self.close()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+
+
+    async def _route(self, method, target, body):
+        parts = [unquote(p) for p in urlsplit(target).path.split('/') if p]
+        payload = json.loads(body.decode('utf-8')) if body else {}
+        if parts == ['metrics'] and method == 'GET':
+            return self.metrics.snapshot(queued=sum([q.qsize() for q in self._queues.values()]))
+        if parts == ['models'] and method == 'GET':
+            return self.models()
+        if len(parts) == 2 and parts[0] == 'models':
+            if method == 'PUT':
+                return await self.load(parts[1], **payload)
+            if method == 'DELETE':
+                await self.unload(parts[1])
+                return {}
+        if len(parts) == 3 and parts[0] == 'models' and parts[2] == 'query' and method == 'POST':
+            return await self.query(parts[1], **payload)
+        raise ModelNotFoundError('No such resource: %s %s' % (method, target))
+
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = header.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, payload = HTTPStatus.OK, await self._route(method, target, body)
+                except ModelNotFoundError as e:
+                    status, payload = HTTPStatus.NOT_FOUND, {'error': str(e)}
+                except (RequestError, TypeError, ValueError) as e:
+                    status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+                except Exception as e:
+                    logger.error('error processing %s %s: %s' % (method, target, e))
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': '%s: %s' % (type(e).__name__, e)}
+                data = json.dumps(payload).encode('utf-8')
+                keepalive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n%s\r\n' %
+                              (status.value, status.phrase, len(data), '' if keepalive else 'Connection: close\r\n')).encode('latin-1'))
+                writer.write(data)
+                await writer.drain()
+                if not keepalive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+
+
+def main():
+    usage = 'PRACMLN Inference Server'
+
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("--host", dest="host", default=None, help="the address to listen on (default: %s)" % DEFAULT_HOST)
+    parser.add_argument("-p", "--port", dest="port", type=int, default=None, help="the TCP port to listen on (default: %d)" % DEFAULT_PORT)
+    parser.add_argument("-s", "--socket", dest="socket", default=None, help="the path of a Unix socket to listen on")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, default=None, help="the number of worker processes (default: number of CPUs)")
+    parser.add_argument("-b", "--batch-size", dest="batchsize", type=int, default=32, help="the maximal number of requests per batch")
+    parser.add_argument("--batch-window", dest="batchwindow", type=float, default=2., help="the time in ms a batch is kept open")
+    parser.add_argument("-n", "--name", dest="name", default='default', help="the name of the model given by -i/-e")
+    parser.add_argument("-i", "--mln", dest="mlnarg", help="the MLN model file to load at startup")
+    parser.add_argument("-e", "--evidence", dest="dbarg", help="the evidence database file of the model")
+    parser.add_argument("--logic", dest="logic", default='FirstOrderLogic', help="the logic of the model")
+    parser.add_argument("--grammar", dest="grammar", default='PRACGrammar', help="the grammar of the model")
+    parser.add_argument("-m", "--method", dest="method", default=None, help="the default inference method of the model")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", default=False, help="log debug messages")
+
+    args = parser.parse_args()
+    logger.level = logs.DEBUG if args.verbose else logs.INFO
+
+    models = {}
+    if args.mlnarg is not None:
+        # model files are only read from the command line, never on request
+        models[args.name] = {'mln': mlnpath(args.mlnarg).content, 'logic': args.logic,
+                             'grammar': args.grammar, 'method': args.method,
+                             'db': mlnpath(args.dbarg).content if args.dbarg is not None else None}
+    server = MLNServer(workers=args.workers, batchsize=args.batchsize, batchwindow=args.batchwindow / 1000.)
+    server.run(host=args.host, port=args.port, path=args.socket, models=models)
+
+
+if __name__ == '__main__':
+    main()
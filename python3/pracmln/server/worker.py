@@ -0,0 +1,222 @@
+# MLN Inference Server -- Worker Processes
+#
+# (C) 2012-2015 by Daniel Nyga (nyga@cs.uni-bremen.edu)
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import time
+import traceback
+from collections import OrderedDict
+
+from dnutils import logs
+
+from ..mln.base import parse_mln
+from ..mln.database import Database, parse_db
+from ..mln.methods import InferenceMethods
+from ..mln.util import parse_queries
+
+
+logger = logs.getlogger(__name__)
+
+# the models that are resident in this process, mapping the model names
+# to pairs of the model version and the ResidentModel instance
+resident = {}
+
+
+class ResidentModel(object):
+    '''
+    A parsed MLN together with its base evidence, which is kept in memory
+    by a worker process for answering many queries.
+
+    Since the materialization of an MLN only depends on the domains of the
+    evidence, the materialized MLNs are cached by their domains, such that
+    evidence deltas which do not introduce new constants never need to
+    materialize the model again.
+
+    :param spec:          dict of the model specification as given to :meth:`MLNServer.load`.
+    :param maxmaterialized:  the maximal number of materialized MLNs kept per model.
+    '''
+
+    def __init__(self, spec, maxmaterialized=8):
+        self.spec = spec
+        self.mln = parse_mln(spec['mln'], logic=spec.get('logic', 'FirstOrderLogic'),
+                             grammar=spec.get('grammar', 'PRACGrammar'))
+        dbs = parse_db(self.mln, spec.get('db') or '', ignore_unknown_preds=spec.get('ignore_unknown_preds', False))
+        if len(dbs) > 1:
+            raise Exception('Got %d base databases. A model can only have one.' % len(dbs))
+        self.db = dbs[0] if dbs else Database(self.mln)
+        self.maxmaterialized = maxmaterialized
+        self._materialized = OrderedDict()
+        self.materialize(self.db)
+
+
+    def materialize(self, db):
+        '''
+        Returns the MLN materialized with respect to the domains of `db`.
+        '''
+        key = tuple(sorted([(d, frozenset(v)) for d, v in db.domains.items() if v]))
+        mln_ = self._materialized.get(key)
+        if mln_ is None:
+            mln_ = self._materialized[key] = self.mln.materialize(db)
+            if len(self._materialized) > self.maxmaterialized:
+                self._materialized.popitem(last=False)
+        else:
+            self._materialized.move_to_end(key)
+        return mln_
+
+
+    def evidence(self, delta=None, retract=None):
+        '''
+        Returns a copy of the base evidence with the given delta applied.
+
+        :param delta:      list of ground literals (e.g. ``'!Cancer(Ann)'``) or pairs
+                           of a ground atom and its (soft) truth value to be asserted.
+        :param retract:    list of ground atoms whose evidence is to be removed.
+        '''
+        db = Database(self.mln)._extend(self.db.domains, self.db.evidence)
+        for atom in retract or []:
+            db.retract(atom)
+        for lit in delta or []:
+            if isinstance(lit, str):
+                db << lit
+            else:
+                db << tuple(lit)
+        return db
+
+
+    def run(self, requests):
+        '''
+        Answers a batch of query requests. Requests with the same evidence, method
+        and parameters share the grounding and a single inference run over the
+        union of their queries. Inference with the closed-world assumption depends
+        on the queries, so these requests are never merged.
+
+        :returns:    the list of the replies of the requests in the same order, each
+                     of which is either ``('ok', results, shared)`` with the dict of
+                     results and the number of requests sharing the inference run,
+                     or ``('error', message)``.
+        '''
+        groups = OrderedDict()
+        replies = [None] * len(requests)
+        queries = [None] * len(requests)
+        for i, req in enumerate(requests):
+            try:
+                queries[i] = self._queries(req)
+            except Exception as e:
+                replies[i] = ('error', '%s: %s' % (type(e).__name__, e))
+                continue
+            params = dict(self.spec.get('params') or {})
+            params.update(req.get('params') or {})
+            key = (repr(req.get('evidence')), repr(req.get('retract')),
+                   req.get('method') or self.spec.get('method') or 'MC-SAT',
+                   repr(sorted(params.items())))
+            # without queries, all unknown ground atoms are queried
+            if not queries[i] or params.get('cw'):
+                key += (i,)
+            groups.setdefault(key, []).append(i)
+        for key, members in groups.items():
+            self._answer(requests, queries, members, key[2], replies)
+        return replies
+
+
+    def _answer(self, requests, queries, members, method, replies):
+        first = requests[members[0]]
+        try:
+            method = InferenceMethods.clazz(method)
+            params = dict(self.spec.get('params') or {})
+            params.update(first.get('params') or {})
+            db = self.evidence(first.get('evidence'), first.get('retract'))
+            mrf = self.materialize(db).ground(db)
+            union = []
+            for i in members:
+                union.extend([q for q in queries[i] if q not in union])
+            inference = method(mrf, union, **params)
+            results = inference.run().results
+            for i in members:
+                if queries[i]:
+                    keys = [str(q) for q in inference._expand_queries(queries[i])]
+                else:
+                    keys = list(results)
+                replies[i] = ('ok', dict([(k, float(results[k])) for k in keys]), len(members))
+        except Exception as e:
+            if len(members) > 1:
+                # do not let a single malformed request spoil the others
+                for i in members:
+                    self._answer(requests, queries, [i], method, replies)
+                return
+            logger.debug(traceback.format_exc())
+            replies[members[0]] = ('error', '%s: %s' % (type(e).__name__, e))
+
+
+    def _queries(self, request):
+        queries = request.get('queries') or []
+        if isinstance(queries, str):
+            return parse_queries(self.mln, queries)
+        return [q.strip() for q in queries if q.strip()]
+
+
+def model(name, version, spec):
+    '''
+    Returns the resident model `name` of this process in the given version,
+    which is parsed and materialized from `spec` if not yet present. Returns
+    `None` if the model is not present and no `spec` is given.
+    '''
+    entry = resident.get(name)
+    if entry is None or entry[0] != version:
+        if spec is None:
+            return None
+        resident[name] = entry = (version, ResidentModel(spec))
+        logger.debug('model %s (version %s) is now resident in this process' % (name, version))
+    return entry[1]
+
+
+def load(name, version, spec):
+    '''
+    Makes the model resident in the executing process and returns a summary of it.
+    '''
+    m = model(name, version, spec)
+    return {'predicates': [p.name for p in m.mln.predicates],
+            'formulas': len(m.mln.formulas),
+            'domains': dict([(d, len(v)) for d, v in m.db.domains.items()])}
+
+
+def process(name, version, spec, requests, models=None):
+    '''
+    Entry point of the worker processes: answers the batch of `requests` against
+    the model `name`. If `models` is given, the resident models whose names are
+    not among them have been unloaded from the server and are dropped.
+
+    :returns:    a pair of the replies (see :meth:`ResidentModel.run`) and the
+                 time in seconds the worker spent on the batch, or `None` if
+                 the model is not resident and no `spec` has been given.
+    '''
+    start = time.time()
+    if models is not None:
+        for n in [n for n in resident if n not in models]:
+            del resident[n]
+    try:
+        m = model(name, version, spec)
+        if m is None:
+            return None
+        replies = m.run(requests)
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        replies = [('error', '%s: %s' % (type(e).__name__, e))] * len(requests)
+    return replies, time.time() - start
@@ -3,14 +3,35 @@ Created on Oct 28, 2015
 
 @author: nyga
 """
+import asyncio
+import json
 import os
+import random
+import shutil
+import tempfile
+from io import StringIO
+
+import numpy
 
 from pracmln import MLN, Database
 from pracmln import query, learn
+from pracmln.mln.database import parse_db
+from pracmln.mln.errors import MLNParsingError
+from pracmln.mln.evidence import ColumnarDatabase, EvidenceStore
+from pracmln.mln.learning.bpll import BPLL
+from pracmln.mln.learning.cll import CLL
+from pracmln.mln.learning.incremental import IncrementalLearner
+from pracmln.mln.learning.ll import LL
+from pracmln.mln.mrfcache import MRFCache
+from pracmln.mln.util import stripComments
 from pracmln.mlnlearn import EVIDENCE_PREDS
+from pracmln.server import MLNServer, RequestError
+from pracmln.mln.inference.wcspinfer import WCSPConverter
+from pracmln.wcsp import solver
 import time
 
 from pracmln.utils import locs
+from pracmln.utils.project import mlnpath
 
 
 def test_inference_smokers():
@@ -80,12 +101,312 @@ def test_learning_taxonomies():
                   discr_preds=EVIDENCE_PREDS).run()
 
 
+def test_database_loader():
+    print('=== DATABASE LOADER TEST ===')
+    p = os.path.join(locs.examples, 'taxonomies', 'taxonomies.pracmln')
+    mln = MLN(mlnfile=('%s:senses_and_roles.mln' % p), grammar='PRACGrammar')
+    content = mlnpath('%s:training.db' % p).content
+    dbs = parse_db(mln, content)
+    # reference: every literal parsed by the grammar and added one by one
+    refs = []
+    for chunk in stripComments(content).split('---'):
+        db = Database(mln)
+        for l in chunk.split('\n'):
+            l = l.strip()
+            if not l: continue
+            if '{' in l:
+                domname, values = mln.logic.parse_domain(l)
+                db.domain({domname: values})
+            elif l[0].isdigit():
+                value, atom = l.split(None, 1)
+                db << (atom, float(value))
+            else:
+                db << l
+        refs.append(db)
+    assert len(dbs) == len(refs) > 1
+    for db, ref in zip(dbs, refs):
+        assert db.domains == ref.domains
+        assert db.evidence == ref.evidence
+    for db, db_ in zip(dbs, parse_db(mln, content, multicore=True)):
+        assert db.domains == db_.domains and db.evidence == db_.evidence
+    # empty databases between separators are rejected
+    for content in ('---\nis_a(sit.v.01,sit.v.01)', 'is_a(sit.v.01,sit.v.01)\n---\n\n---\nis_a(sit.v.01,sit.v.01)'):
+        try:
+            parse_db(mln, content)
+        except MLNParsingError:
+            pass
+        else:
+            raise AssertionError('empty database accepted: %s' % repr(content))
+    assert len(parse_db(mln, 'is_a(sit.v.01,sit.v.01)\n---\n')) == 1
+
+
+def test_mrfcache():
+    print('=== MRF CACHE TEST ===')
+    p = os.path.join(locs.examples, 'smokers', 'smokers.pracmln')
+    mln = MLN(mlnfile=('%s:wts.pybpll.smoking-train-smoking.mln' % p), grammar='StandardGrammar')
+    db = Database(mln, dbfile='%s:smoking-train.db' % p)
+    directory = tempfile.mkdtemp()
+    try:
+        cache = MRFCache(directory)
+        _, mrf = cache.ground(mln, db)
+        gndatoms, evidence = [str(a) for a in mrf.gndatoms], list(mrf.evidence)
+        weights = cache.learner(mrf, BPLL).run()
+        assert (cache.hits, cache.misses) == (0, 2)
+        _, mrf_ = cache.ground(mln, db)
+        assert [str(a) for a in mrf_.gndatoms] == gndatoms
+        assert list(mrf_.evidence) == evidence
+        assert numpy.allclose(cache.learner(mrf_, BPLL).run(), weights)
+        assert (cache.hits, cache.misses) == (2, 2)
+        # changing the weights or the evidence invalidates the entry
+        mln_ = mln.copy()
+        mln_.weights = [float(w) + 1 for w in mln.weights]
+        cache.ground(mln_, db)
+        db_ = db.copy()
+        db_ << '!Smokes(Anna)'
+        cache.ground(mln, db_)
+        assert (cache.hits, cache.misses) == (2, 4)
+        cache.clear()
+        cache.ground(mln, db)
+        assert (cache.hits, cache.misses) == (2, 5)
+        # the pickled entries are only loaded from private directories
+        private = os.path.join(directory, 'mrf')
+        MRFCache(private).ground(mln, db)
+        assert os.stat(private).st_mode & 0o077 == 0
+        os.chmod(private, 0o777)
+        try:
+            MRFCache(private).ground(mln, db)
+        except Exception as e:
+            assert 'writable by others' in str(e), e
+        else:
+            raise AssertionError('MRF loaded from a public directory')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_incremental_learning():
+    print('=== INCREMENTAL LEARNING TEST ===')
+    p = os.path.join(locs.examples, 'smokers', 'smokers.pracmln')
+    mln = MLN(mlnfile=('%s:smoking.mln' % p), grammar='StandardGrammar')
+    db = Database(mln, dbfile='%s:smoking-train.db' % p)
+    directory = tempfile.mkdtemp()
+    try:
+        learner = IncrementalLearner(mln.materialize(db), [db], BPLL, incremental=directory)
+        weights = learner.run()
+        assert (learner.hits, learner.misses) == (0, 1)
+        db_ = db.copy()
+        db_ << '!Cancer(Anna)'
+        dbs = [db, db_]
+        learner = IncrementalLearner(mln.materialize(*dbs), dbs, BPLL, incremental=directory)
+        assert (learner.hits, learner.misses) == (1, 1)
+        learner.run()
+        learner = IncrementalLearner(mln.materialize(db), [db], BPLL, incremental=directory)
+        assert (learner.hits, learner.misses) == (1, 0)
+        assert numpy.allclose(learner.run(), weights, atol=1e-4)
+        # another learning method does not reuse the learners
+        learner = IncrementalLearner(mln.materialize(db), [db], CLL, incremental=directory)
+        assert (learner.hits, learner.misses) == (0, 1)
+        learner.clear()
+        learner = IncrementalLearner(mln.materialize(db), [db], BPLL, incremental=directory)
+        assert (learner.hits, learner.misses) == (0, 1)
+        # the weights are stored as JSON, the learners only in private directories
+        private = os.path.join(directory, 'learners')
+        learner = IncrementalLearner(mln.materialize(db), [db], BPLL, incremental=private)
+        learner.run()
+        with open(learner._weightspath()) as f:
+            assert set(json.load(f)) == set([str(f) for f in learner.mln.formulas])
+        assert os.stat(private).st_mode & 0o077 == 0
+        os.chmod(private, 0o777)
+        try:
+            IncrementalLearner(mln.materialize(db), [db], BPLL, incremental=private)
+        except Exception as e:
+            assert 'writable by others' in str(e), e
+        else:
+            raise AssertionError('learners loaded from a public directory')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_lifted_learning():
+    print('=== LIFTED LEARNING TEST ===')
+    p = os.path.join(locs.examples, 'smokers', 'smokers.pracmln')
+    mln = MLN(mlnfile=('%s:smoking.mln' % p), grammar='StandardGrammar')
+    db = Database(mln)
+    for i in range(8):
+        db << ('Smokes(P%d)' % i if i < 4 else '!Smokes(P%d)' % i)
+        db << ('Cancer(P%d)' % i if i < 2 else '!Cancer(P%d)' % i)
+    db << 'Friends(P0,P1)'
+    db << 'Friends(P1,P0)'
+    mrf = mln.materialize(db).ground(db)
+    for method in (BPLL, CLL):
+        weights = []
+        for lifted in (False, True):
+            random.seed(0)
+            weights.append(method(mrf, lifted=lifted).run())
+        assert numpy.allclose(weights[0], weights[1], atol=1e-6), (method.__name__, weights)
+    # exact log-likelihood learning can only be lifted without binary predicates over people
+    mln = MLN(grammar='StandardGrammar')
+    mln << 'Smokes(person)'
+    mln << 'Cancer(person)'
+    mln << 'Likes(person,food)'
+    mln << '0 Smokes(x) => Cancer(x)'
+    mln << '0 Likes(x,Pizza) => Smokes(x)'
+    mln << '0 Cancer(x)'
+    db = Database(mln)
+    for i in range(4):
+        db << ('Smokes(P%d)' % i if i < 3 else '!Smokes(P%d)' % i)
+        db << ('Cancer(P%d)' % i if i < 2 else '!Cancer(P%d)' % i)
+        db << ('Likes(P%d,Pizza)' % i if i % 2 else '!Likes(P%d,Pizza)' % i)
+    mrf = mln.materialize(db).ground(db)
+    weights = [LL(mrf, lifted=lifted).run() for lifted in (False, True)]
+    assert numpy.allclose(weights[0], weights[1], atol=1e-6), ('LL', weights)
+
+
+def test_wcsp_engines():
+    print('=== WCSP ENGINES TEST ===')
+    toulbar2 = solver('toulbar2')
+    if not toulbar2.available():
+        print('toulbar2 is not available, skipped.')
+        return
+    for project, mlnfile, dbfile in (('smokers', 'wts.pybpll.smoking-train-smoking.mln', 'smoking-test.db'),
+                                     ('alarm', 'alarm-kreator.mln', 'query1.db'),
+                                     ('tweety', 'tweety-kreator.mln', 'query1.db')):
+        p = os.path.join(locs.examples, project, '%s.pracmln' % project)
+        mln = MLN(mlnfile=('%s:%s' % (p, mlnfile)), grammar='StandardGrammar')
+        db = Database(mln, dbfile='%s:%s' % (p, dbfile))
+        wcsp = WCSPConverter(mln.ground(db)).convert()
+        _, cost = wcsp.solve(decompose=False, backend=toulbar2)
+        _, cost_ = wcsp.solve(decompose=False, backend=solver('native'))
+        assert cost == cost_, (project, cost, cost_)
+
+
+def test_columnar_evidence():
+    print('=== COLUMNAR EVIDENCE TEST ===')
+    p = os.path.join(locs.examples, 'smokers', 'smokers.pracmln')
+    mln = MLN(mlnfile=('%s:wts.pybpll.smoking-train-smoking.mln' % p), grammar='StandardGrammar')
+    db = Database(mln, dbfile='%s:smoking-train.db' % p)
+    mln_ = mln.materialize(db)
+    mrf = mln_.ground(db)
+    directory = tempfile.mkdtemp()
+    try:
+        ColumnarDatabase.fromdb(db).store.save(directory)
+        cdb = ColumnarDatabase(mln, EvidenceStore.load(directory))
+        assert cdb.domains == db.domains
+        assert cdb.evidence == db.evidence
+        mrf_ = mln_.ground(cdb)
+        assert [str(a) for a in mrf_.gndatoms] == [str(a) for a in mrf.gndatoms]
+        assert list(mrf_.evidence) == list(mrf.evidence)
+        # the default store is read-only, also for new constants
+        for atom in ('!Smokes(Anna)', 'Smokes(Zed)'):
+            try:
+                cdb << atom
+            except Exception as e:
+                assert 'read-only' in str(e), e
+            else:
+                raise AssertionError('read-only store modified: %s' % atom)
+        cdb = ColumnarDatabase(mln, EvidenceStore.load(directory, mmap_mode='c'))
+        cdb << '!Smokes(Anna)'
+        assert cdb['Smokes(Anna)'] == 0
+        assert ColumnarDatabase(mln, EvidenceStore.load(directory))['Smokes(Anna)'] == 1
+        cdb = ColumnarDatabase(mln, EvidenceStore.load(directory, mmap_mode='r+'))
+        cdb << '!Smokes(Anna)'
+        cdb.store.flush()
+        assert ColumnarDatabase(mln, EvidenceStore.load(directory))['Smokes(Anna)'] == 0
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_binary_format():
+    print('=== BINARY FORMAT TEST ===')
+    def mlntext(mln):
+        stream = StringIO()
+        mln.write(stream, color=False)
+        return stream.getvalue()
+    directory = tempfile.mkdtemp()
+    try:
+        mlnfile, dbfile = os.path.join(directory, 'model.mln'), os.path.join(directory, 'evidence.db')
+        for project, mlnname, dbname, grammar in (('smokers', 'smoking.mln', 'smoking-train.db', 'StandardGrammar'),
+                                                  ('alarm', 'alarm-kreator.mln', 'query1.db', 'StandardGrammar'),
+                                                  ('taxonomies', 'senses_and_roles.mln', 'training.db', 'PRACGrammar'),
+                                                  ('object-recognition', 'learnt.cll.scenes-new-object-detection.mln', 'scenes-new.db', 'PRACGrammar')):
+            p = os.path.join(locs.examples, project, '%s.pracmln' % project)
+            mln = MLN(mlnfile=('%s:%s' % (p, mlnname)), grammar=grammar)
+            dbs = Database.load(mln, '%s:%s' % (p, dbname), ignore_unknown_preds=True)
+            mln.save(mlnfile)
+            mln_ = MLN.load_binary(mlnfile)
+            assert type(mln_.logic) is type(mln.logic) and type(mln_.logic.grammar) is type(mln.logic.grammar)
+            assert mlntext(mln_) == mlntext(mln), project
+            assert mln_.weights == mln.weights and mln_.domains == mln.domains
+            Database.save_dbs(dbs, dbfile)
+            dbs_ = Database.load_binary(mln_, dbfile)
+            assert [db.domains for db in dbs_] == [db.domains for db in dbs]
+            assert [db.evidence for db in dbs_] == [db.evidence for db in dbs]
+        # quoted constants
+        mln = MLN(grammar='PRACGrammar')
+        mln << 'Smokes(person)'
+        mln << 'Friends(person,person)'
+        dbs = parse_db(mln, 'Smokes("Anna Smith")\n!Friends("Anna Smith",Bob)\n0.3 Smokes("O\'Neil,Jr.")\n---\nSmokes(Bob)')
+        Database.save_dbs(dbs, dbfile)
+        dbs_ = list(Database.iterload(mln, dbfile))
+        assert [db.domains for db in dbs_] == [db.domains for db in dbs]
+        assert [db.evidence for db in dbs_] == [db.evidence for db in dbs]
+        assert dbs_[0]['Smokes("O\'Neil,Jr.")'] == .3
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_server():
+    print('=== INFERENCE SERVER TEST ===')
+    p = os.path.join(locs.examples, 'smokers', 'smokers.pracmln')
+    mlnfile, dbfile = '%s:wts.pybpll.smoking-train-smoking.mln' % p, '%s:smoking-test-smaller.db' % p
+    mln = MLN(mlnfile=mlnfile, grammar='StandardGrammar')
+    db = Database(mln, dbfile=dbfile)
+    def direct(evidence=(), retract=()):
+        db_ = db.copy()
+        for atom in evidence: db_ << atom
+        for atom in retract: db_.retract(atom)
+        return query(queries='Cancer,Smokes', method='EnumerationAsk', mln=mln, db=db_, verbose=False).run().results
+    def same(results, expected):
+        return set(results) == set(expected) and all([abs(results[q] - expected[q]) < 1e-9 for q in expected])
+    async def run():
+        server = MLNServer(workers=0, batchwindow=.05)
+        try:
+            await server.load('smokers', mln=mlnpath(mlnfile).content, db=mlnpath(dbfile).content,
+                              grammar='StandardGrammar', method='EnumerationAsk')
+            # files can only be given on the command line
+            for spec in ({'mlnfile': mlnfile}, {'mln': None}):
+                try:
+                    await server.load('evil', **spec)
+                except (TypeError, RequestError):
+                    pass
+                else:
+                    raise AssertionError('model loaded from %s' % spec)
+            reply = await server.query('smokers', 'Cancer,Smokes', evidence=['Smokes(Bob)'], retract=['Cancer(Ann)'])
+            assert same(reply['results'], direct(['Smokes(Bob)'], ['Cancer(Ann)']))
+            # concurrent requests are batched, the ones with the same evidence share an inference run
+            evidence = [['Smokes(Ann)'], ['Smokes(Ann)'], ['!Smokes(Bob)'], None]
+            replies = await asyncio.gather(*[server.query('smokers', 'Cancer,Smokes', evidence=e) for e in evidence])
+            assert [r['shared'] for r in replies] == [2, 2, 1, 1]
+            for e, reply in zip(evidence, replies):
+                assert same(reply['results'], direct(e or ()))
+        finally:
+            await server.close()
+    asyncio.run(run())
+
+
 def runall():
     start = time.time()
     test_inference_smokers()
     test_inference_taxonomies()
     test_learning_smokers()
     test_learning_taxonomies()
+    test_columnar_evidence()
+    test_database_loader()
+    test_binary_format()
+    test_mrfcache()
+    test_incremental_learning()
+    test_lifted_learning()
+    test_wcsp_engines()
+    test_server()
     print()
     print('all test finished after', time.time() - start, 'secs')
 
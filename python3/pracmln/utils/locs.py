@@ -5,6 +5,7 @@ from pracmln._version import APPNAME, APPAUTHOR
 
 root = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..'))
 user_data = appdirs.user_data_dir(APPNAME, APPAUTHOR)
+user_cache = appdirs.user_cache_dir(APPNAME, APPAUTHOR)
 
 if os.path.basename(root).startswith('python'):
     root = os.path.realpath(os.path.join(root, '..'))
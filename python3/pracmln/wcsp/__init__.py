@@ -1 +1 @@
-from .wcsp import WCSP, Constraint
\ No newline at end of file
+from .wcsp import WCSP, Constraint, SolverBackend, Toulbar2, SolverPool, solver
\ No newline at end of file
@@ -0,0 +1,256 @@
+# Weighted Constraint Satisfaction Problems -- In-Process Solver
+#
+# (C) 2012-2015 by Daniel Nyga (nyga@cs.uni-bremen.edu)
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from functools import reduce
+
+import numpy
+
+from dnutils import logs
+
+from .wcsp import SolverBackend
+
+
+logger = logs.getlogger(__name__)
+
+
+class ProblemTooLarge(Exception): pass
+
+
+def cells(scope, domsizes):
+    '''
+    Returns the number of cells of the cost table over the given variables.
+    '''
+    return reduce(lambda x, y: x * y, [domsizes[v] for v in scope], 1)
+
+
+def minfill(domsizes, scopes):
+    '''
+    Computes an elimination order of the variables by the min-fill heuristic,
+    i.e. the variable whose elimination adds the fewest edges to the primal
+    graph is eliminated first. Ties are broken by the degree and the index
+    of the variables.
+
+    :param domsizes:    the list of domain sizes.
+    :param scopes:      iterable of the scopes (lists of variable indices) of the constraints.
+    :returns:           the list of variable indices in the order of their elimination.
+    '''
+    neighbors = [set() for _ in domsizes]
+    for scope in scopes:
+        for v in scope:
+            neighbors[v].update(scope)
+    for v, n in enumerate(neighbors):
+        n.discard(v)
+    def fill(v):
+        n = sorted(neighbors[v])
+        return sum([1 for i, a in enumerate(n) for b in n[i + 1:] if b not in neighbors[a]])
+    # the fill of a variable only changes if one of its neighbors has been eliminated
+    fills = dict([(v, fill(v)) for v in range(len(domsizes))])
+    order = []
+    while fills:
+        v = min(fills, key=lambda v: (fills[v], len(neighbors[v]), v))
+        order.append(v)
+        del fills[v]
+        n = neighbors[v]
+        dirty = set(n)
+        for a in n:
+            neighbors[a].discard(v)
+            neighbors[a].update(n - {a})
+            dirty.update(neighbors[a])
+        for a in dirty:
+            if a in fills:
+                fills[a] = fill(a)
+    return order
+
+
+class NativeSolver(SolverBackend):
+    '''
+    Exact in-process solver based on depth-first branch and bound, which
+    works directly on the :class:`Constraint` objects of a :class:`WCSP`.
+
+    The constraints are converted into dense NumPy cost tables. A mini-bucket
+    elimination along a min-fill order compiles a static lower bound of
+    the costs of all completions of a partial assignment, and the search
+    assigns the variables in reverse elimination order, trying the values in
+    the order of their lower bounds and pruning all partial assignments whose
+    bounds reach the costs of the best solution found so far.
+
+    :param maxcells:    the maximal number of cells of the cost table of a mini-bucket,
+                        i.e. the product of the domain sizes of its variables. If no
+                        bucket of the elimination exceeds it, the bounds are exact and
+                        the search runs backtrack-free. Larger values give tighter bounds
+                        at the expense of memory and elimination time.
+    :param maxtotal:    the maximal number of cells of all cost tables held at a time.
+                        Problems that need more raise a :class:`ProblemTooLarge` exception.
+    '''
+
+    def __init__(self, maxcells=2 ** 21, maxtotal=2 ** 27):
+        self.maxcells = maxcells
+        self.maxtotal = maxtotal
+
+
+    def _allocate(self, total, n):
+        total += n
+        if total > self.maxtotal:
+            raise ProblemTooLarge('The WCSP needs more than %d cost table cells, which exceeds the limit of the '
+                                  'in-process solver (%d). Use toulbar2 to solve it.' % (total, self.maxtotal))
+        return total
+
+
+    def solve(self, wcsp):
+        wcsp._make_integer_cost()
+        if not wcsp.domsizes:
+            return [], 0
+        top = wcsp.top
+        domsizes = wcsp.domsizes
+        total = 0
+        for c in wcsp.constraints.values():
+            total = self._allocate(total, cells(c.variables, domsizes))
+        functions = []
+        for c in wcsp.constraints.values():
+            table = numpy.full([domsizes[v] for v in c.variables], min(c.defcost, top), dtype=numpy.int64)
+            for t, cost in c.tuples.items():
+                table[t] = min(cost, top)
+            functions.append((tuple(c.variables), table))
+        order = minfill(domsizes, [f[0] for f in functions])
+        # the search assigns the variables in reverse elimination order
+        search = order[::-1]
+        depth = dict([(v, d) for d, v in enumerate(search)])
+        # a function belongs to the bucket of the variable of its scope that is assigned last
+        originals = [[] for _ in search]
+        for f in functions:
+            originals[max([depth[v] for v in f[0]])].append(f)
+        placed, generated, const = self._minibuckets(originals, search, depth, domsizes, top, total)
+        logger.debug('mini-bucket lower bound: %d' % const)
+        if const >= top:
+            return None, None
+        # everything that becomes evaluable when the variable at depth d is assigned: the original
+        # functions and the messages of its bucket, laid out such that the variable is the last axis
+        gains = []
+        for d, v in enumerate(search):
+            tables = []
+            for scope, table in originals[d] + placed[d]:
+                others = [u for u in scope if u != v]
+                tables.append((others, numpy.transpose(table, [scope.index(u) for u in others] + [scope.index(v)])))
+            gains.append(tables)
+        return self._search(search, gains, generated, domsizes, const, top)
+
+
+    def _minibuckets(self, buckets, search, depth, domsizes, top, total):
+        '''
+        Runs the mini-bucket elimination in the order of decreasing depth. The functions
+        of a bucket are partitioned such that the cost table of a mini-bucket has at most
+        `maxcells` cells, unless a single function exceeds it.
+
+        :param total:    the number of cells of the tables of the original functions.
+        :returns:        a triple (placed, generated, const), where placed[d] are the messages that
+                         have been moved into the bucket at depth d, generated[d] are the messages (as
+                         (scope, table) pairs) that the bucket at depth d has produced and const is
+                         the lower bound of the costs of the problem.
+        '''
+        buckets = [list(b) for b in buckets]
+        placed = [[] for _ in search]
+        generated = [[] for _ in search]
+        const = 0
+        for d in range(len(search) - 1, -1, -1):
+            v = search[d]
+            minibuckets = []
+            for f in sorted(buckets[d], key=lambda f: -cells(f[0], domsizes)):
+                for mb in minibuckets:
+                    if cells(mb[0] | set(f[0]), domsizes) <= self.maxcells:
+                        mb[0].update(f[0])
+                        mb[1].append(f)
+                        break
+                else:
+                    minibuckets.append((set(f[0]), [f]))
+            for scope, fs in minibuckets:
+                scope = sorted(scope, key=lambda u: depth[u])
+                scope_ = tuple([u for u in scope if u != v])
+                # the combined table is only needed until the message has been computed
+                self._allocate(total, cells(scope, domsizes))
+                total = self._allocate(total, cells(scope_, domsizes))
+                table = _combine(scope, fs, domsizes, top)
+                message = (scope_, table.min(axis=scope.index(v)))
+                generated[d].append(message)
+                if scope_:
+                    # the last variable of the (depth-sorted) scope is assigned last
+                    target = depth[scope_[-1]]
+                    buckets[target].append(message)
+                    placed[target].append(message)
+                else:
+                    const = min(const + int(message[1]), top)
+        return placed, generated, const
+
+
+    def _search(self, search, gains, generated, domsizes, const, top):
+        '''
+        Depth-first branch and bound over the variables in `search` order.
+        '''
+        n = len(search)
+        assignment = [0] * len(domsizes)
+        best, bound = None, top
+        def expand(d, f):
+            # the lower bounds of the values of the variable at depth d
+            v = search[d]
+            fs = numpy.full(domsizes[v], f, dtype=numpy.int64)
+            # the messages the bucket has produced are now accounted for by its functions
+            for scope, table in generated[d]:
+                fs -= int(table[tuple([assignment[u] for u in scope])])
+            for others, table in gains[d]:
+                fs += table[tuple([assignment[u] for u in others])]
+                numpy.minimum(fs, top, out=fs)
+            values = numpy.argsort(fs, kind='stable')
+            return list(zip(fs[values].tolist(), values.tolist()))
+        frames = [[expand(0, const), 0]]
+        nodes = 0
+        while frames:
+            d = len(frames) - 1
+            frame = frames[-1]
+            candidates, k = frame
+            if k == len(candidates) or candidates[k][0] >= bound:
+                frames.pop()
+                continue
+            frame[1] += 1
+            f, value = candidates[k]
+            assignment[search[d]] = value
+            nodes += 1
+            if d == n - 1:
+                best, bound = list(assignment), f
+            else:
+                frames.append([expand(d + 1, f), 0])
+        logger.debug('branch and bound expanded %d nodes' % nodes)
+        if best is None:
+            return None, None
+        return best, bound
+
+
+def _combine(scope, functions, domsizes, top):
+    '''
+    Sums up the given (scope, table) pairs into a table over `scope`.
+    '''
+    table = numpy.zeros([domsizes[u] for u in scope], dtype=numpy.int64)
+    for scope_, table_ in functions:
+        axes = sorted(range(len(scope_)), key=lambda i: scope.index(scope_[i]))
+        shape = [domsizes[u] if u in scope_ else 1 for u in scope]
+        table += numpy.transpose(table_, axes).reshape(shape)
+        numpy.minimum(table, top, out=table)
+    return table
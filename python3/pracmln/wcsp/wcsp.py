@@ -23,11 +23,16 @@
 
 import sys
 import os
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, DEVNULL
+import atexit
 import bisect
+import io
+import itertools
 import re
+import shutil
+import threading
 from collections import defaultdict
-import _thread
+from concurrent.futures import ThreadPoolExecutor
 import platform
 
 from dnutils import logs
@@ -147,7 +152,8 @@ class WCSP(object):
     '''
     Represents a WCSP problem.
     
-    This class implements a wrapper around the `toulbar2` weighted-SAT solver.
+    This class implements a wrapper around the `toulbar2` weighted-SAT solver. Other
+    solvers can be plugged in as a :class:`SolverBackend`.
     
     :member name:        (arbitrary) name of the problem
     :member domsizes:    list of domain sizes
@@ -158,6 +164,9 @@ class WCSP(object):
     # maximum costs imposed by toulbar
     MAX_COST = 1537228672809129301
     
+    # maximal number of assignments of a component that is solved in-process by branch and bound
+    BRANCHANDBOUND_MAX = 4096
+    
 
     def __init__(self, name=None, domsizes=None, top=-1):
         self.name = name
@@ -350,66 +359,234 @@ class WCSP(object):
         self.top = top
     
                     
-    def itersolutions(self):
+    def itersolutions(self, backend=None):
         '''
         Iterates over all (intermediate) solutions found.
         
         Intermediate solutions are sound variable assignments that may not necessarily
         be gloabally optimal.
         
+        :param backend:    the :class:`SolverBackend` to be used (defaults to toulbar2).
         :returns:    a generator of (idx, solution) tuples, where idx is the index and solution is a tuple
                      of variable value indices.
         '''
-        if not is_executable(_tb2path):
-            raise Exception('toulbar2 cannot be found.')
-        # append the process id to the filename to make it "process safe"
-        tmpfile = tempfile.NamedTemporaryFile(prefix=os.getpid(), suffix='.wcsp', delete=False)
-        wcspfilename = tmpfile.name
-        self.write(stream=tmpfile)
-        tmpfile.close()
-        cmd = '%s -s -a %s' % (_tb2path, wcspfilename)
-        logger.debug('solving WCSP...')
-        p = Popen(cmd, shell=True, stderr=PIPE, stdout=PIPE)
-        solution = None
-        while True:
-            l = p.stdout.readline().strip()
-            if not l: break
-            m = re.match(r'(\d+)\s+solution:([\s\d]+)', l) 
-            if m is not None:
-                num = m.group(1)
-                solution = list(map(int, m.group(2).strip().split()))
-                yield (num, solution)
-        p.wait()        
-        logger.debug('toulbar2 process returned {}'.format(str(p.returncode)))
-        try:
-            os.remove(wcspfilename)
-        except OSError:
-            logger.warning('could not remove temporary file {}'.format(wcspfilename))
-        if p.returncode != 0:
-            raise Exception('toulbar2 returned a non-zero exit code: {}'.format(p.returncode))
+        backend = toulbar2() if backend is None else backend
+        for i, solution in backend.itersolutions(self):
+            yield i, solution
+
+
+    def components(self):
+        '''
+        Partitions the variables into the connected components of the constraint graph.
+        
+        :returns:    a list of sorted lists of variable indices.
+        '''
+        parent = list(range(len(self.domsizes)))
+        def find(v):
+            while parent[v] != v:
+                parent[v] = parent[parent[v]]
+                v = parent[v]
+            return v
+        for c in self.constraints.values():
+            root = find(c.variables[0])
+            for v in c.variables[1:]:
+                parent[find(v)] = root
+        components = defaultdict(list)
+        for v in range(len(self.domsizes)):
+            components[find(v)].append(v)
+        return list(components.values())
+    
+    
+    def subproblem(self, variables):
+        '''
+        Creates the WCSP consisting of the given variables and the constraints among them,
+        whose variables are renumbered in the order of `variables`.
+        '''
+        index = dict([(v, i) for i, v in enumerate(variables)])
+        wcsp = WCSP(name=self.name, domsizes=[self.domsizes[v] for v in variables], top=self.top)
+        for c in self.constraints.values():
+            if c.variables[0] not in index: continue
+            c_ = Constraint(tuple([index[v] for v in c.variables]), defcost=c.defcost)
+            c_.tuples = dict(c.tuples)
+            wcsp.constraints[tuple(sorted(c_.variables))] = c_
+        return wcsp
+    
+    
+    def solve(self, decompose=True, backend=None, pool=None):
+        '''
+        Computes the best solution, i.e. a tuple of variable assignments
+        with minimal costs, and its costs.
+        
+        :param decompose:    if `True`, the connected components of the constraint
+                             graph are solved independently. Components with at most
+                             `BRANCHANDBOUND_MAX` assignments are solved in-process by
+                             :class:`wcsp.native.NativeSolver`, all others are solved by
+                             `backend` concurrently in the worker threads of `pool`.
+        :param backend:      the :class:`SolverBackend` for the problems that are not tiny
+                             (defaults to toulbar2).
+        :param pool:         the :class:`SolverPool` the components are distributed over
+                             (defaults to the pool shared by all WCSPs of this process).
+        '''
+        from .native import NativeSolver
+        backend = toulbar2() if backend is None else backend
+        if not decompose:
+            return backend.solve(self)
+        self._make_integer_cost()
+        components = self.components()
+        logger.debug('solving WCSP with %d variables in %d component(s)' % (len(self.domsizes), len(components)))
+        if len(components) == 1 and reduce(lambda x, y: x * y, self.domsizes, 1) > WCSP.BRANCHANDBOUND_MAX:
+            return backend.solve(self)
+        solution = [0] * len(self.domsizes)
+        cost = 0
+        results = []
+        pending = []
+        for variables in components:
+            wcsp = self.subproblem(variables)
+            if not wcsp.constraints: continue
+            if reduce(lambda x, y: x * y, wcsp.domsizes, 1) <= WCSP.BRANCHANDBOUND_MAX:
+                results.append((variables, NativeSolver().solve(wcsp)))
+            else:
+                pending.append((variables, wcsp))
+        if pending:
+            pool = solverpool() if pool is None else pool
+            results.extend(zip([v for v, _ in pending], pool.map(backend, [w for _, w in pending])))
+        for variables, (s, c) in results:
+            if s is None:
+                return None, None
+            for v, value in zip(variables, s):
+                solution[v] = value
+            cost += c
+        return solution, cost
 
 
-    def solve(self):
+class SolverBackend(object):
+    '''
+    Abstract base class of the solvers a :class:`WCSP` can be handed to.
+    
+    Backends must be safe to be used from multiple threads at the same time.
+    '''
+    
+    def available(self):
+        '''
+        Whether or not the solver can be used in this environment.
+        '''
+        return True
+    
+    
+    def solve(self, wcsp):
+        '''
+        Computes the best solution of the given WCSP.
+        
+        :returns:    a (solution, cost) tuple, where solution is a list of value indices,
+                     or (None, None) if the problem is unsatisfiable.
+        '''
+        raise Exception('%s does not implement solve()' % self.__class__.__name__)
+    
+    
+    def itersolutions(self, wcsp):
+        '''
+        Iterates over the (intermediate) solutions found, see :meth:`WCSP.itersolutions`.
+        '''
+        raise Exception('%s does not implement itersolutions()' % self.__class__.__name__)
+    
+    
+    def close(self):
+        '''
+        Releases all resources held by the solver.
+        '''
+        pass
+    
+    
+class Toulbar2(SolverBackend):
+    '''
+    Runs the `toulbar2` executable on the problems.
+    
+    The solver is started without a shell and reads the problem from a named pipe,
+    which is fed by a thread while the solver is running, so the problem never
+    hits the disk. The pipes are created in a session directory that lives on a
+    tmpfs if the system provides one (`/dev/shm`) and is removed by :meth:`close`.
+    On systems without named pipes, the problems are written to regular files in
+    the session directory.
+    
+    :param path:    the path of the toulbar2 executable.
+    '''
+    
+    def __init__(self, path=None):
+        self.path = _tb2path if path is None else path
+        self._dir = None
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        
+        
+    def available(self):
+        return is_executable(self.path) is not None
+    
+    
+    @property
+    def directory(self):
+        with self._lock:
+            if self._dir is None:
+                shm = '/dev/shm'
+                tmp = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+                self._dir = tempfile.mkdtemp(prefix='pracmln-tb2-{}-'.format(os.getpid()), dir=tmp)
+            return self._dir
+    
+    
+    def close(self):
+        with self._lock:
+            if self._dir is not None:
+                shutil.rmtree(self._dir, ignore_errors=True)
+                self._dir = None
+    
+    
+    def _run(self, wcsp, args, stderr):
         '''
-        Uses toulbar2 inference. Returns the best solution, i.e. a tuple
-        of variable assignments.
+        Starts toulbar2 on the given problem and returns the process and
+        a function that cleans up after the process has terminated.
         '''
-        if not is_executable(_tb2path):
+        if not self.available():
             raise Exception('toulbar2 cannot be found.')
-        # append the process id to the filename to make it "process safe"
-        tmpfile = tempfile.NamedTemporaryFile(prefix='{}-{}'.format(os.getpid(), _thread.get_ident()), suffix='.wcsp', delete=False)
-        wcspfilename = tmpfile.name
-        self.write(stream=tmpfile)
-        tmpfile.close()
-        cmd = '"%s" -s %s' % (_tb2path, wcspfilename)
+        # serialize upfront, so errors surface here and not in the feeding thread
+        data = io.BytesIO()
+        wcsp.write(stream=data)
+        data = data.getvalue()
+        # toulbar2 determines the format of the problem by the file extension
+        filename = os.path.join(self.directory, '{}.wcsp'.format(next(self._counter)))
+        feeder = None
+        if hasattr(os, 'mkfifo'):
+            os.mkfifo(filename)
+            feeder = threading.Thread(target=_feed, args=(filename, data), daemon=True)
+            feeder.start()
+        else:
+            with open(filename, 'wb') as f:
+                f.write(data)
         logger.debug('solving WCSP...')
-        p = Popen(cmd, shell=True, stderr=PIPE, stdout=PIPE)
+        p = Popen([self.path] + args + [filename], stdout=PIPE, stderr=stderr)
+        def cleanup():
+            # if the solver has not opened the pipe, the feeding thread must be unblocked
+            while feeder is not None and feeder.is_alive():
+                os.close(os.open(filename, os.O_RDONLY | os.O_NONBLOCK))
+                feeder.join(.1)
+            try:
+                os.remove(filename)
+            except OSError:
+                logger.warning('could not remove {}'.format(filename))
+        return p, cleanup
+        
+    
+    def solve(self, wcsp):
+        p, cleanup = self._run(wcsp, ['-s'], PIPE)
+        try:
+            out, err = p.communicate()
+        finally:
+            cleanup()
+        logger.debug('toulbar2 process returned {}'.format(str(p.returncode)))
+        if p.returncode != 0:
+            raise Exception('toulbar2 returned a non-zero exit code: {}\n{}'.format(p.returncode, err.decode(errors='replace')))
         solution = None
         nextLineIsSolution = False
         cost = None
-        while True:
-            l = p.stdout.readline()
-            if not l: break
+        for l in out.splitlines():
             if l.startswith(b'New solution'):
                 cost = int(l.split()[2])
                 nextLineIsSolution = True
@@ -417,15 +594,136 @@ class WCSP(object):
             if nextLineIsSolution:
                 solution = list(map(int, l.split()))
                 nextLineIsSolution = False
-        p.wait()
-        logger.debug('toulbar2 process returned {}'.format(str(p.returncode)))
+        return solution, cost
+    
+    
+    def itersolutions(self, wcsp):
+        p, cleanup = self._run(wcsp, ['-s', '-a'], DEVNULL)
         try:
-            os.remove(wcspfilename)
-        except OSError:
-            logger.warning('could not remove temporary file {}'.format(wcspfilename))
+            for l in p.stdout:
+                m = re.match(rb'(\d+)\s+solution:([\s\d]+)', l.strip())
+                if m is not None:
+                    yield int(m.group(1)), list(map(int, m.group(2).split()))
+            p.wait()
+        finally:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+            p.stdout.close()
+            cleanup()
+        logger.debug('toulbar2 process returned {}'.format(str(p.returncode)))
         if p.returncode != 0:
             raise Exception('toulbar2 returned a non-zero exit code: {}'.format(p.returncode))
-        return solution, cost
+
+
+def _feed(filename, data):
+    try:
+        with open(filename, 'wb') as f:
+            f.write(data)
+    except BrokenPipeError:
+        # the solver has terminated without reading the whole problem
+        pass
+    
+    
+class SolverPool(object):
+    '''
+    A bounded pool of worker threads that run the solves of multiple
+    problems concurrently. Since toulbar2 runs in processes of its own, threads
+    are sufficient to keep all cores busy. Solves by the in-process
+    :class:`wcsp.native.NativeSolver` hold the interpreter lock and do not run
+    in parallel.
+    
+    :param workers:    the maximal number of concurrent solves (defaults to the number of cores).
+    '''
+    
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        
+        
+    def submit(self, backend, wcsp):
+        '''
+        Schedules a solve of `wcsp` by `backend` and returns a future of its (solution, cost) tuple.
+        '''
+        return self._executor.submit(backend.solve, wcsp)
+    
+    
+    def map(self, backend, wcsps):
+        '''
+        Solves all the given problems and returns the list of their (solution, cost) tuples.
+        '''
+        return [f.result() for f in [self.submit(backend, w) for w in wcsps]]
+    
+    
+    def close(self):
+        self._executor.shutdown(wait=True)
+        
+        
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *args):
+        self.close()
+
+
+_toulbar2 = None
+_pool = None
+_fallback = False
+_lock = threading.Lock()
+
+
+def solver(engine=None):
+    '''
+    Returns the backend for the given engine.
+    
+    :param engine:    `'toulbar2'` for the toulbar2 executable, `'native'` for the in-process
+                      :class:`wcsp.native.NativeSolver`, or `None` for toulbar2 if it can be
+                      found and the in-process solver otherwise.
+    '''
+    global _fallback
+    if engine is None:
+        engine = 'toulbar2' if toulbar2().available() else 'native'
+        if engine == 'native' and not _fallback:
+            logger.warning('toulbar2 cannot be found. Falling back to the in-process solver, '
+                           'which is slower and limited in the size of the problems.')
+            _fallback = True
+    if engine == 'toulbar2':
+        return toulbar2()
+    if engine == 'native':
+        from .native import NativeSolver
+        return NativeSolver()
+    raise Exception('Unknown WCSP engine: %s' % engine)
+
+
+def toulbar2():
+    '''
+    Returns the toulbar2 backend that is shared within this process.
+    '''
+    global _toulbar2
+    with _lock:
+        if _toulbar2 is None:
+            _toulbar2 = Toulbar2()
+        return _toulbar2
+
+
+def solverpool():
+    '''
+    Returns the solver pool that is shared within this process.
+    '''
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = SolverPool()
+        return _pool
+
+
+@atexit.register
+def _shutdown():
+    if _pool is not None:
+        _pool.close()
+    if _toulbar2 is not None:
+        _toulbar2.close()
 
 
 # main function for debugging only
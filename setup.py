@@ -68,7 +68,7 @@ class myinstall(distutils.command.install.install):
 setup(
     name='pracmln',
     packages=['pracmln', 'pracmln._version', 'pracmln.logic', 'pracmln.mln',
-        'pracmln.utils', 'pracmln.wcsp', 'pracmln.mln.grounding',
+        'pracmln.utils', 'pracmln.wcsp', 'pracmln.server', 'pracmln.mln.grounding',
         'pracmln.mln.inference', 'pracmln.mln.learning'],
     package_dir={
         'pracmln': basedir('pracmln'),
@@ -112,6 +112,8 @@ setup(
 	        'mlnquery=pracmln.mlnquery:main',
 	        'libpracmln-build=pracmln.libpracmln:createcpplibs',
             'pracmlntest=pracmln.test:main',
+            'mlnserver=pracmln.server.server:main',
+            'mlnclient=pracmln.server.client:main',
         ],
     },
     cmdclass={'install': myinstall}